@@ -3,20 +3,48 @@
 # 메뉴: ①출고캘린더 ②SKU별조회 ③주차요약 ④월간요약(리포트)
 #       ⑤국가별조회 ⑥BP명별조회 ⑦트렌드분석 ⑧부족예상재고
 # ==========================================
+import io
+import os
 import re
+import sys
+import csv
 import html
+import json
+import time
 import hashlib
+import weakref
+import threading
+import zipfile
+import urllib.parse
+import urllib.request
 import calendar as pycal
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 import numpy as np
 import streamlit as st
 import pandas as pd
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
 try:
     import plotly.express as px
 except ImportError:
     px = None
     st.warning("plotly 패키지가 없습니다. requirements.txt에 plotly를 추가해 주세요.", icon="⚠️")
+try:
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+except ImportError:
+    pa = None
+    pa_feather = None
+try:
+    import fcntl  # 같은 호스트의 레플리카 간 스냅샷 빌드 잠금 (POSIX)
+except ImportError:
+    fcntl = None
 # =========================
 # 컬럼명 표준화 (RAW 기준)
 # =========================
@@ -51,6 +79,27 @@ GSHEET_ID = "1jbWMgV3fudWCQ1qhG0lCysZGGFCo4loTIf-j3iuaqOI"
 GSHEET_GID = "15468212"       # SAP 탭
 GSHEET_GID_INV = "525131304"  # 상품카테고리&입고일 탭 (현재고/입고일)
 HEADER_ROW_0BASED = 6
+GSHEET_TIMEOUT_SEC = 60
+# 로컬 대역 서버(tools/mock_gsheet_server.py) 등으로 바꿔 끼울 수 있도록 환경변수로 노출
+GSHEET_BASE_URL = os.environ.get("GSHEET_BASE_URL", "https://docs.google.com").rstrip("/")
+# SAP 탭: 열 선택 + 제품분류 필터를 시트 쿼리(gviz tq)로 서버에서 수행, 실패 시 전체 export
+GSHEET_PUSHDOWN = True
+# gviz 는 열마다 다수 타입을 정해 소수 타입 값을 비우고 값을 표시 서식대로 내보낸다 — 헤더만으로는 알 수 없으므로
+# 전체 export 와 대조(parity)해 통과한 tq 만 쓰고, 이 횟수만큼 쓰면 다음 갱신에서 다시 대조
+GSHEET_PARITY_EVERY = 12
+# 대조 사이 갱신: 핵심 컬럼의 값 있는 비율이 대조 때보다 이만큼 넘게 줄면 tq 본문을 버리고 전체 export
+GSHEET_BLANK_TOLERANCE = 0.01
+# =========================
+# 데이터 갱신 / 로컬 스냅샷 설정
+# =========================
+DATA_TTL_SEC = 1800            # 이 시간이 지나면 백그라운드 재검증
+DATA_PREWARM_SEC = 120         # TTL 만료 이만큼 전에 백그라운드 워커가 미리 갱신
+DATA_RETRY_SEC = 120           # 재검증 실패 시 재시도 간격
+SNAPSHOT_DIR = os.environ.get(
+    "B2B_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot"),
+)
+SNAPSHOT_SCHEMA = 7            # 전처리 결과 구조가 바뀌면 올려서 기존 스냅샷 무효화
 USECOLS = [
     COL_QTY, COL_YEAR, COL_MONTH,
     COL_DONE, COL_SHIP, COL_LT2,
@@ -177,26 +226,19 @@ def _filter_cust1(df: pd.DataFrame, cust1_value: str) -> pd.DataFrame:
     """거래처구분1 필터 헬퍼 — 반복 패턴 통합"""
     if df is None or df.empty or COL_CUST1 not in df.columns:
         return df if df is not None else pd.DataFrame()
-    return df[df[COL_CUST1].astype(str).str.strip() == cust1_value]
+    return df[df[COL_CUST1] == cust1_value]
 
 def make_btn_key(*parts) -> str:
     raw = "|".join([str(p) for p in parts])
     return hashlib.md5(raw.encode("utf-8")).hexdigest()
 def to_bool_true(s: pd.Series) -> pd.Series:
-    x = s.fillna("").astype(str).str.strip().str.upper()
+    x = s.astype(object).fillna("").astype(str).str.strip().str.upper()
     return x.isin(["TRUE", "T", "1", "Y", "YES"])
-def safe_dt(df: pd.DataFrame, col: str) -> None:
-    if col in df.columns:
-        df[col] = pd.to_datetime(df[col], errors="coerce")
 def safe_num(df: pd.DataFrame, col: str) -> None:
     if col in df.columns:
         s = df[col].astype(str).str.replace(",", "", regex=False).str.strip()
         s = s.replace({"": None, "nan": None, "None": None})
         df[col] = pd.to_numeric(s, errors="coerce")
-def uniq_sorted(df: pd.DataFrame, col: str):
-    if df is None or df.empty or col not in df.columns:
-        return []
-    return sorted(df[col].dropna().astype(str).unique().tolist())
 
 def render_download_buttons(df: pd.DataFrame, filename_prefix: str, key_suffix: str = ""):
     """CSV 다운로드 버튼 렌더링 (② SKU별 조회, ⑤ 국가별 조회, ⑥ BP명별 조회용)"""
@@ -221,10 +263,6 @@ def need_cols(df: pd.DataFrame, cols: list[str], title: str = "필요 컬럼 누
         st.warning(f"{title}: {missing}")
         return False
     return True
-def normalize_text_cols(df: pd.DataFrame, cols: list[str]) -> None:
-    for c in cols:
-        if c in df.columns:
-            df[c] = df[c].astype(str).str.strip()
 def safe_selectbox(label: str, options: list[str], key: str, default="전체"):
     if not options:
         options = [default]
@@ -237,6 +275,14 @@ def _escape(x) -> str:
     if pd.isna(x):
         return ""
     return html.escape(str(x))
+def fmt_age(sec: float) -> str:
+    """경과 시간 → '방금' / 'N분 전' / 'N시간 M분 전'"""
+    m = int(max(sec, 0) // 60)
+    if m < 1:
+        return "방금"
+    if m < 60:
+        return f"{m}분 전"
+    return f"{m // 60}시간 {m % 60}분 전" if m % 60 else f"{m // 60}시간 전"
 def _fmt_int(x) -> str:
     try:
         return f"{int(round(float(x))):,}"
@@ -404,28 +450,79 @@ def format_done_range(done_min, done_max) -> str:
         return fmt_date(dmin)
     return f"{fmt_date(dmin)} ~ {fmt_date(dmax)}"
 # =========================
-# Label helpers
+# 날짜 차원 / 라벨
 # =========================
-def parse_month_label_key(label: str) -> tuple[int, int]:
-    y = m = 0
-    try:
-        my = re.search(r"(\d{4})\s*년", str(label))
-        mm = re.search(r"(\d+)\s*월", str(label))
-        if my:
-            y = int(my.group(1))
-        if mm:
-            m = int(mm.group(1))
-    except Exception:
-        pass
-    return (y, m)
-def month_key_num_from_label(label: str) -> Optional[int]:
-    y, m = parse_month_label_key(label)
-    if y <= 0 or m <= 0:
-        return None
-    return y * 100 + m
+# 날짜 차원 — 일 단위 int32 키(1970-01-01 기준 일수). RAW 에는 키만 두고 연/월/주차/라벨은 여기서 조회
+DAY_KEY_EPOCH = date(1970, 1, 1)
+def day_key(d: date) -> int:
+    return (d - DAY_KEY_EPOCH).days
+def day_from_key(k: int) -> date:
+    return DAY_KEY_EPOCH + timedelta(days=int(k))
+def day_keys(dt: pd.Series) -> pd.Series:
+    """datetime 시리즈 → 일 키 (Int32, NaT → NA)"""
+    na = dt.isna().to_numpy()
+    keys = dt.to_numpy(dtype="datetime64[ns]").astype("datetime64[D]").astype("int64")
+    keys[na] = 0
+    return pd.Series(pd.arrays.IntegerArray(keys.astype("int32"), na), index=dt.index)
+def build_date_dim(start_key: int, end_key: int) -> pd.DataFrame:
+    """[start_key, end_key] 구간의 날짜 차원 (index = 일 키)
+    - wom: 월 내 주차 (day-1)//7+1, week_key_num/week_label: '2026년 6월 3주차'
+    - week_sunday: 일요일 시작 주의 일요일 키 (캘린더 주간요약용), ym: 'YYYY-MM'"""
+    keys = np.arange(start_key, end_key + 1, dtype="int64")
+    dts = pd.DatetimeIndex(keys.astype("datetime64[D]"))
+    dim = pd.DataFrame({"year": dts.year, "month": dts.month, "day": dts.day}, index=pd.Index(keys.astype("int32"), name="day_key"))
+    dim["wom"] = (dim["day"] - 1) // 7 + 1
+    dim["week_key_num"] = dim["year"] * 10000 + dim["month"] * 100 + dim["wom"]
+    dim["week_label"] = [f"{y}년 {m}월 {w}주차" for y, m, w in zip(dim["year"], dim["month"], dim["wom"])]
+    dim["ym"] = [f"{y:04d}-{m:02d}" for y, m in zip(dim["year"], dim["month"])]
+    # 1970-01-01 은 목요일 → (k + 4) % 7 = 일요일부터의 경과 일수
+    dim["week_sunday"] = (keys - (keys + 4) % 7).astype("int32")
+    return dim
+def date_dim_for(*key_series: pd.Series) -> pd.DataFrame:
+    """키 시리즈들이 걸친 범위를 덮는 날짜 차원 (값이 없으면 빈 차원)"""
+    los = [int(k.min()) for k in key_series if k.notna().any()]
+    his = [int(k.max()) for k in key_series if k.notna().any()]
+    if not los:
+        return build_date_dim(0, -1)
+    return build_date_dim(min(los), max(his))
+def dim_lookup(dim: pd.DataFrame, keys: pd.Series, col: str, dtype: str) -> pd.Series:
+    """일 키 → 차원 속성 (숫자). 키가 NA 인 행은 NA"""
+    valid = keys.notna().to_numpy()
+    out = pd.Series(pd.array([pd.NA] * len(keys), dtype=dtype), index=keys.index)
+    if valid.any():
+        pos = keys.to_numpy(dtype="int64", na_value=0)[valid] - int(dim.index[0])
+        out[valid] = dim[col].to_numpy()[pos]
+    return out
+def dim_labels(dim: pd.DataFrame, keys: pd.Series, col: str) -> pd.Series:
+    """일 키 → 라벨 category. 라벨 문자열은 차원에서 한 번만 만들고 행에는 코드만 둔다"""
+    cats = pd.Index(sorted(dim[col].unique()))
+    day_code = cats.get_indexer(dim[col])
+    valid = keys.notna().to_numpy()
+    codes = np.full(len(keys), -1, dtype="int64")
+    if valid.any():
+        codes[valid] = day_code[keys.to_numpy(dtype="int64", na_value=0)[valid] - int(dim.index[0])]
+    return pd.Series(pd.Categorical.from_codes(codes, categories=cats), index=keys.index)
+def week_label_for_sunday(sunday: date, cal_year: int = 0, cal_month: int = 0) -> str:
+    """일요일 시작 주 → 주차 라벨. 캘린더 표시 월이 주어지면 그 달에 속한 첫 날 기준"""
+    dim = build_date_dim(day_key(sunday), day_key(sunday) + 6)
+    if cal_year > 0 and cal_month > 0:
+        in_month = dim[(dim["year"] == cal_year) & (dim["month"] == cal_month)]
+        if not in_month.empty:
+            return str(in_month["week_label"].iloc[0])
+        return str(dim["week_label"].iloc[0])
+    return str(dim["week_label"].iloc[0])
 # =========================
 # TopN breakdown (대용량 최적화)
 # =========================
+def _order_desc(values, *names) -> np.ndarray:
+    """수량 내림차순(결측은 맨 뒤) 위치 순서 — 동률은 names(품목코드·품목명·BP명 등) 의 strip 문자열 오름차순.
+    명시적 키의 np.lexsort 라 입력 행 순서·pandas 정렬 구현과 무관하게 ③/④ 표와 월간 리포트의 순위가 같다"""
+    v = np.asarray(values, dtype="float64")
+    nan = np.isnan(v)
+    return np.lexsort((*[_tie_key(n) for n in reversed(names)], np.where(nan, 0.0, -v), nan))
+def _tie_key(names) -> np.ndarray:
+    """동률 정렬용 strip 문자열 배열"""
+    return np.array([str(x).strip() for x in names], dtype=object)
 def build_bp_list_map_for_items(df_period: pd.DataFrame, items: pd.DataFrame) -> pd.DataFrame:
     if df_period.empty or items.empty:
         return pd.DataFrame(columns=[COL_ITEM_CODE, COL_ITEM_NAME, "BP명(요청수량)"])
@@ -434,13 +531,13 @@ def build_bp_list_map_for_items(df_period: pd.DataFrame, items: pd.DataFrame) ->
     if sub.empty:
         return pd.DataFrame(columns=[COL_ITEM_CODE, COL_ITEM_NAME, "BP명(요청수량)"])
     bp_break = (
-        sub.groupby([COL_ITEM_CODE, COL_ITEM_NAME, COL_BP], dropna=False)[COL_QTY]
+        sub.groupby([COL_ITEM_CODE, COL_ITEM_NAME, COL_BP], dropna=False, observed=True)[COL_QTY]
         .sum(min_count=1)
         .reset_index()
         .rename(columns={COL_QTY: "BP요청수량"})
     )
     def format_bp_list(x: pd.DataFrame) -> str:
-        x = x.sort_values("BP요청수량", ascending=False, na_position="last")
+        x = x.iloc[_order_desc(x["BP요청수량"].to_numpy(dtype="float64", na_value=np.nan), x[COL_BP])]
         out = []
         for _, r in x.iterrows():
             bp = str(r[COL_BP]).strip()
@@ -449,7 +546,7 @@ def build_bp_list_map_for_items(df_period: pd.DataFrame, items: pd.DataFrame) ->
             out.append(f"{bp}({int(round(float(q))):,})")
         return "/ ".join(out)
     return (
-        bp_break.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)
+        bp_break.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)
         .apply(format_bp_list)
         .reset_index(name="BP명(요청수량)")
     )
@@ -457,13 +554,11 @@ def build_item_topn_with_bp(df_period: pd.DataFrame, n: int) -> pd.DataFrame:
     if df_period.empty:
         return pd.DataFrame(columns=["순위", COL_ITEM_CODE, COL_ITEM_NAME, "요청수량_합", "BP명(요청수량)"])
     topn = (
-        df_period.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
+        df_period.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY]
         .sum(min_count=1)
         .reset_index(name="요청수량_합")
-        .sort_values("요청수량_합", ascending=False, na_position="last")
-        .head(n)
-        .copy()
     )
+    topn = topn.iloc[_order_desc(topn["요청수량_합"], topn[COL_ITEM_CODE], topn[COL_ITEM_NAME])[:n]].copy()
     bp_map = build_bp_list_map_for_items(df_period, topn)
     topn = topn.merge(bp_map, on=[COL_ITEM_CODE, COL_ITEM_NAME], how="left")
     topn.insert(0, "순위", range(1, len(topn) + 1))
@@ -475,22 +570,19 @@ def build_spike_report_only(cur_df: pd.DataFrame, prev_df: pd.DataFrame) -> pd.D
     if cur_df.empty:
         return pd.DataFrame(columns=cols)
     cur_sku = (
-        cur_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
+        cur_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY]
         .sum(min_count=1)
         .reset_index(name="현재_요청수량")
     )
     prev_sku = (
-        prev_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
+        prev_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY]
         .sum(min_count=1)
         .reset_index(name="이전_요청수량")
     ) if not prev_df.empty else pd.DataFrame(columns=[COL_ITEM_CODE, COL_ITEM_NAME, "이전_요청수량"])
     cmp = cur_sku.merge(prev_sku, on=[COL_ITEM_CODE, COL_ITEM_NAME], how="left")
     cmp["이전_요청수량"] = pd.to_numeric(cmp["이전_요청수량"], errors="coerce").fillna(0)
     cmp["현재_요청수량"] = pd.to_numeric(cmp["현재_요청수량"], errors="coerce").fillna(0)
-    cmp["증가배수"] = cmp.apply(
-        lambda r: (r["현재_요청수량"] / r["이전_요청수량"]) if r["이전_요청수량"] > 0 else pd.NA,
-        axis=1
-    )
+    cmp["증가배수"] = cmp["현재_요청수량"] / cmp["이전_요청수량"].where(cmp["이전_요청수량"] > 0)
     spike = cmp[(cmp["이전_요청수량"] > 0) & (cmp["현재_요청수량"] >= cmp["이전_요청수량"] * SPIKE_FACTOR)].copy()
     if spike.empty:
         spike["BP명(요청수량)"] = ""
@@ -501,144 +593,219 @@ def build_spike_report_only(cur_df: pd.DataFrame, prev_df: pd.DataFrame) -> pd.D
     spike["이전_요청수량"] = pd.to_numeric(spike["이전_요청수량"], errors="coerce").fillna(0).round(0).astype("Int64")
     spike["증가배수"] = pd.to_numeric(spike["증가배수"], errors="coerce").round(2)
     spike["BP명(요청수량)"] = spike["BP명(요청수량)"].fillna("")
-    spike = spike.sort_values("현재_요청수량", ascending=False, na_position="last")
+    spike = spike.iloc[_order_desc(spike["현재_요청수량"].to_numpy(dtype="float64"), spike[COL_ITEM_CODE], spike[COL_ITEM_NAME])]
     return spike[cols]
 # =========================
 # 재고 데이터 로드 (상품카테고리&입고일 탭)
 # =========================
-@st.cache_data(ttl=1800, show_spinner=False)
-def load_inventory_from_gsheet() -> pd.DataFrame:
-    """상품카테고리&입고일 탭에서 현재고/입고일 데이터 로드 (H-M열)"""
-    csv_url = f"https://docs.google.com/spreadsheets/d/{GSHEET_ID}/export?format=csv&gid={GSHEET_GID_INV}"
+INV_COLS = ["품목코드", "품목이름", "현재고", "1차입고일", "1차입고수량"]
+# H열=품목 코드, I열=품목 이름, J열=현재고, K열=1차 입고, L열=1차 수량 (2행이 헤더)
+# L열 뒤의 'N차 입고' / 'N차 수량' 헤더 쌍(2차 이상)은 N차입고일 / N차입고수량 으로 같이 읽는다
+INV_RANGE_A1 = "H2:Z"
+INV_FULL_POS = [7, 8, 9, 10, 11]
+INV_RECEIPT_DATE_RE = re.compile(r"^\s*(\d+)\s*차\s*입고(?:일)?\s*$")
+INV_RECEIPT_QTY_RE = re.compile(r"^\s*(\d+)\s*차\s*(?:입고)?\s*수량\s*$")
+def empty_inventory() -> pd.DataFrame:
+    return pd.DataFrame(columns=INV_COLS)
+def inventory_receipt_cols(inv: pd.DataFrame) -> list[tuple[str, str]]:
+    """재고 프레임의 (N차입고일, N차입고수량) 열 쌍 — 차수 순"""
+    nums = sorted(
+        int(m.group(1)) for c in inv.columns
+        if (m := re.fullmatch(r"(\d+)차입고일", str(c))) and f"{m.group(1)}차입고수량" in inv.columns
+    )
+    return [(f"{n}차입고일", f"{n}차입고수량") for n in nums]
+def _inventory_extra_receipts(data: bytes, header: int, after_pos: int) -> list[tuple[int, str]]:
+    """헤더에서 after_pos 뒤의 2차 이상 입고일/수량 열 위치 → [(위치, 정규화 이름)] (날짜·수량이 다 있는 차수만)"""
+    labels = pd.read_csv(io.BytesIO(data), header=header, nrows=0).columns
+    dates: dict[int, int] = {}
+    qtys: dict[int, int] = {}
+    for pos, label in enumerate(labels):
+        if pos <= after_pos:
+            continue
+        if (m := INV_RECEIPT_DATE_RE.match(str(label))) and int(m.group(1)) >= 2:
+            dates.setdefault(int(m.group(1)), pos)
+        elif (m := INV_RECEIPT_QTY_RE.match(str(label))) and int(m.group(1)) >= 2:
+            qtys.setdefault(int(m.group(1)), pos)
+    cols = []
+    for n in sorted(dates.keys() & qtys.keys()):
+        cols += [(dates[n], f"{n}차입고일"), (qtys[n], f"{n}차입고수량")]
+    return sorted(cols)
+def parse_inventory_csv(data: bytes, ranged: bool = False) -> pd.DataFrame:
+    """상품카테고리&입고일 탭 CSV → 현재고/입고일 데이터 (H-L열)
+    - ranged=True: H:L 범위만 받은 payload (1행이 헤더)
+    - ranged=False: 전체 export (2행이 헤더, H-L열만 읽음)
+    - 2차 이상 입고 열(있으면)은 N차입고일/N차입고수량 으로 뒤에 붙인다
+    숫자(천 단위 쉼표)/날짜는 파싱 단계에서 바로 타입 지정"""
+    header = 0 if ranged else 1
+    base_pos = list(range(len(INV_COLS))) if ranged else INV_FULL_POS
     try:
-        inv_raw = pd.read_csv(csv_url, header=1)
-    except Exception:
-        return pd.DataFrame(columns=["품목코드", "품목이름", "현재고", "1차입고일", "1차입고수량"])
-    # H-M열 = 인덱스 7~12 (0-based) — 실제 컬럼명으로 매핑
-    if inv_raw.shape[1] < 13:
-        return pd.DataFrame(columns=["품목코드", "품목이름", "현재고", "1차입고일", "1차입고수량"])
-    # H열(idx7)=품목 코드, I열(idx8)=품목 이름, J열(idx9)=현재고, K열(idx10)=1차 입고, L열(idx11)=1차 수량
-    inv = inv_raw.iloc[:, [7, 8, 9, 10, 11]].copy()
-    inv.columns = ["품목코드", "품목이름", "현재고", "1차입고일", "1차입고수량"]
+        extra = _inventory_extra_receipts(data, header, base_pos[-1])
+        inv = pd.read_csv(
+            io.BytesIO(data),
+            header=header,
+            usecols=base_pos + [pos for pos, _ in extra],
+            names=INV_COLS + [name for _, name in extra],
+            dtype={"품목코드": "string", "품목이름": "string"},
+            thousands=",",
+            parse_dates=["1차입고일"] + [name for _, name in extra if name.endswith("입고일")],
+        )
+    except (ValueError, pd.errors.ParserError, pd.errors.EmptyDataError):
+        return empty_inventory()
     # 빈 행 제거
-    inv = inv.dropna(subset=["품목코드"])
-    inv["품목코드"] = inv["품목코드"].astype(str).str.strip()
-    inv = inv[inv["품목코드"].str.len() > 0].copy()
-    # 숫자 변환
-    for c in ["현재고", "1차입고수량"]:
-        inv[c] = inv[c].astype(str).str.replace(",", "", regex=False).str.strip()
-        inv[c] = pd.to_numeric(inv[c], errors="coerce").fillna(0)
-    # 날짜 변환
-    inv["1차입고일"] = pd.to_datetime(inv["1차입고일"], errors="coerce")
+    inv["품목코드"] = inv["품목코드"].str.strip()
+    inv = inv[inv["품목코드"].notna() & (inv["품목코드"].str.len() > 0)].copy()
+    inv["품목코드"] = inv["품목코드"].astype(object)
+    inv["품목이름"] = inv["품목이름"].astype(object)
+    # 숫자 열에 문자가 섞였을 때만 변환 (정상 시트는 read_csv 가 이미 숫자로 읽음)
+    receipts = inventory_receipt_cols(inv)
+    for c in ["현재고"] + [q for _, q in receipts]:
+        if not pd.api.types.is_numeric_dtype(inv[c]):
+            inv[c] = pd.to_numeric(inv[c], errors="coerce")
+        inv[c] = inv[c].fillna(0)
+    for c, _ in receipts:
+        if not pd.api.types.is_datetime64_any_dtype(inv[c]):
+            inv[c] = pd.to_datetime(inv[c], errors="coerce")
     return inv
 # =========================
 # 부족 예상 재고 알람 분석
 # =========================
+SHORTAGE_COLS_OUT = [
+    COL_ITEM_CODE, COL_ITEM_NAME, "현재고", "최근일평균출고", "예측일평균출고",
+    "소진예상일수", "소진예상일", "1차입고일", "1차입고수량",
+    "입고전소진여부", "위험등급", "이전월출고", "현재월출고", "증가배수",
+]
+# 소진일수 산출 기준 (첫 항목이 기본값) — 수요 예측은 백테스트에서 평균보다 낫다는 근거가 쌓일 때까지 선택 사항
+SHORTAGE_METHODS = {"average": "최근 N일 평균", "forecast": "수요 예측(추세 반영)"}
+SHORTAGE_FORECAST_RATE_DAYS = 30  # 예측일평균출고 = 향후 30일 예측 / 30
+SHORTAGE_LOOKBACK_GRID = tuple(range(30, 181, 10))  # "일평균 출고 계산 기간" 슬라이더 값
+SHORTAGE_THRESHOLD_GRID = tuple(sorted({*range(7, 61, 7), 30}))  # "알람 기준 소진일수" 슬라이더 값 + 기본값 30
+SHORTAGE_RISK_LEVELS = np.array(["긴급", "위험", "주의", "안전"], dtype=object)  # 코드 = 정렬 순서
+def _shortage_base(raw_df: pd.DataFrame, inv_df: pd.DataFrame, today: date) -> Optional[pd.DataFrame]:
+    """슬라이더와 무관한 부분: 해외B2B 전월 대비 30%+ 증가 품목 × 현재고/입고 정보 (대상이 없으면 None)"""
+    if raw_df is None or raw_df.empty or inv_df is None or inv_df.empty:
+        return None
+    # 해외B2B만 필터
+    overseas = _filter_cust1(raw_df, LT_ONLY_CUST1)
+    if overseas.empty or "_ship_ym" not in overseas.columns:
+        return None
+    # 현재월/이전월 기준 설정
+    cur_ym = today.strftime("%Y-%m")
+    prev_ym = (today.replace(day=1) - timedelta(days=1)).strftime("%Y-%m")
+    # 30% 이상 증가 품목 탐지 (기존 spike 로직 활용)
+    spike = build_spike_report_only(overseas[overseas["_ship_ym"] == cur_ym], overseas[overseas["_ship_ym"] == prev_ym])
+    if spike.empty:
+        return None
+    base = spike[[COL_ITEM_CODE, COL_ITEM_NAME, "이전_요청수량", "현재_요청수량", "증가배수"]].copy()
+    base = base.rename(columns={"이전_요청수량": "이전월출고", "현재_요청수량": "현재월출고"})
+    # inv_df의 컬럼명을 COL_ITEM_CODE와 통일 후 on= 으로 병합 (suffix 문제 방지)
+    inv_merge = inv_df.rename(columns={"품목코드": COL_ITEM_CODE})[[COL_ITEM_CODE, "현재고", "1차입고일", "1차입고수량"]]
+    base = base.merge(inv_merge, on=COL_ITEM_CODE, how="left")
+    base["현재고"] = pd.to_numeric(base["현재고"], errors="coerce").fillna(0)
+    return base
+class ShortageScenarios:
+    """⑧ 슬라이더 조합(일평균 계산 기간 L × 알람 기준일수 T)을 한 번에 계산.
+    소진일수 열 = 최근 L일 평균 기준 L개 + 수요 예측 기준 1개(마지막 열) →
+    소진일수/소진예상일/입고전소진여부는 품목 × (L+1), 위험등급은 품목 × (L+1) × T 배열.
+    슬라이더 이동은 배열 인덱싱과 정렬만 한다. 그리드 밖 값은 그 값으로 다시 만든다(build_shortage_alert).
+    """
+    def __init__(
+        self,
+        raw_df: pd.DataFrame,
+        inv_df: pd.DataFrame,
+        ship_matrix: Optional["DailyShipMatrix"] = None,
+        today: Optional[date] = None,
+        lookbacks: tuple = SHORTAGE_LOOKBACK_GRID,
+        thresholds: tuple = SHORTAGE_THRESHOLD_GRID,
+        forecast: Optional["DemandForecast"] = None,
+    ):
+        self.today = today or date.today()
+        self.lookbacks = tuple(int(x) for x in lookbacks)
+        self.thresholds = tuple(int(x) for x in thresholds)
+        self.base = _shortage_base(raw_df, inv_df, self.today)
+        if self.base is None:
+            return
+        if ship_matrix is None:
+            ship_matrix = DailyShipMatrix(raw_df)
+        # 최근 L일 일평균 출고량 (cutoff 이후 출고분 — SKU × 일 누적합의 차, 기간 전체를 한 번에)
+        lb = np.array(self.lookbacks, dtype=np.int64)
+        cutoff_keys = day_key(self.today) - lb
+        # cutoff 이후 출고가 하나도 없으면 그 기간은 알람 없음
+        self.has_recent = (ship_matrix.last_day >= cutoff_keys) & (len(ship_matrix.skus) > 0)
+        totals = ship_matrix.totals_since(cutoff_keys)  # SKU × L
+        rows = ship_matrix.skus.get_indexer(self.base[COL_ITEM_CODE].astype(str))
+        avg = np.zeros((len(rows), len(lb)))  # 출고 이력이 없는 품목은 0
+        hit = rows >= 0
+        avg[hit] = np.round(totals[rows[hit]] / np.maximum(lb, 1), 1)
+        self.avg = avg
+        # 소진일수 = 현재고 / 최근 일평균출고량 (출고 없으면 inf)
+        stock = self.base["현재고"].to_numpy(dtype="float64")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            days = np.where(avg > 0, np.round(stock[:, None] / avg, 1), np.inf)
+        # 수요 예측 기준: 주별 예측 수요를 누적해 재고가 바닥나는 날 (마지막 열)
+        if forecast is None:
+            forecast = forecast_demand(ship_matrix, day_key(self.today))
+        weekly = forecast.rows(self.base[COL_ITEM_CODE])
+        self.fc_rate = np.round(forecast_cumulative(weekly, SHORTAGE_FORECAST_RATE_DAYS) / SHORTAGE_FORECAST_RATE_DAYS, 1)
+        days = np.column_stack([days, np.round(forecast_depletion_days(weekly, stock), 1)])
+        self.days = days
+        # 소진예상일: 1년 이내만 (정수 일 버림)
+        finite = np.isfinite(days) & (days < 365)
+        offset = np.where(finite, np.trunc(np.where(finite, days, 0)), 0).astype("timedelta64[D]")
+        depl = np.datetime64(self.today, "D") + offset
+        self.depl_date = np.where(finite, depl, np.datetime64("NaT"))
+        self.depl_text = np.where(finite, np.datetime_as_string(depl, unit="D"), "-").astype(object)
+        # 입고 전 소진 여부
+        inbound = self.base["1차입고일"].to_numpy(dtype="datetime64[ns]")[:, None]
+        no_inbound = np.isnat(inbound)
+        before = finite & ~no_inbound & (self.depl_date.astype("datetime64[ns]") < inbound)
+        self.before_inbound = np.where(before, "예", np.where(no_inbound, "입고예정없음", "아니오")).astype(object)
+        # 위험등급 코드 (0 긴급 ≤7일, 1 위험 ≤14일, 2 주의 ≤기준일수, 3 안전) — 품목 × L × T
+        th = np.array(self.thresholds, dtype="float64")[None, None, :]
+        d3 = days[:, :, None]
+        self.risk = np.select([d3 <= 7, d3 <= 14, d3 <= th], [0, 1, 2], default=3).astype(np.int8)
+    def result(self, lookback_days: int, alert_threshold_days: int, method: str = "average") -> pd.DataFrame:
+        """슬라이더 값 한 조합의 알람 표 (위험등급 → 소진예상일수 순, 컬럼 = SHORTAGE_COLS_OUT)
+        - method: "average" 최근 lookback_days 일 평균 기준 소진일수 / "forecast" 수요 예측 기준"""
+        if self.base is None:
+            return pd.DataFrame(columns=SHORTAGE_COLS_OUT)
+        li = self.lookbacks.index(int(lookback_days))
+        ti = self.thresholds.index(int(alert_threshold_days))
+        if not self.has_recent[li]:
+            return pd.DataFrame(columns=SHORTAGE_COLS_OUT)
+        di = len(self.lookbacks) if method == "forecast" else li
+        alert = self.base.copy()
+        alert["최근일평균출고"] = self.avg[:, li]
+        alert["예측일평균출고"] = self.fc_rate
+        alert["소진예상일수"] = self.days[:, di]
+        alert["소진예상일"] = self.depl_text[:, di]
+        alert["입고전소진여부"] = self.before_inbound[:, di]
+        risk = self.risk[:, di, ti]
+        alert["위험등급"] = SHORTAGE_RISK_LEVELS[risk]
+        # 위험도순 → 소진일수순 (안정 정렬)
+        alert = alert.iloc[np.lexsort((self.days[:, di], risk))]
+        return alert[SHORTAGE_COLS_OUT]
 def build_shortage_alert(
     raw_df: pd.DataFrame,
     inv_df: pd.DataFrame,
     lookback_days: int = 90,
     alert_threshold_days: int = 30,
+    ship_matrix: Optional["DailyShipMatrix"] = None,
+    method: str = "average",
 ) -> pd.DataFrame:
     """
     30%+ 증가 품목을 대상으로 재고 소진일수를 계산하여 부족 예상 알람 생성.
-    - 소진일수 = 현재고 / 최근 일평균출고량
+    - 소진일수 = 현재고가 최근 일평균출고량(method="average") 또는 예측 수요(method="forecast")로 바닥나는 일수
     - alert_threshold_days 이하이면 알람 대상
+    - 슬라이더 전체 조합은 get_shortage_scenarios 로 데이터 버전별 1회 계산 — 여기서는 한 조합만
     """
-    cols_out = [
-        COL_ITEM_CODE, COL_ITEM_NAME, "현재고", "최근일평균출고",
-        "소진예상일수", "소진예상일", "1차입고일", "1차입고수량",
-        "입고전소진여부", "위험등급", "이전월출고", "현재월출고", "증가배수",
-    ]
-    if raw_df is None or raw_df.empty or inv_df is None or inv_df.empty:
-        return pd.DataFrame(columns=cols_out)
-    # 해외B2B만 필터
-    overseas = _filter_cust1(raw_df, LT_ONLY_CUST1).copy()
-    if overseas.empty:
-        return pd.DataFrame(columns=cols_out)
-    # 현재월/이전월 기준 설정
-    today = date.today()
-    cur_ym = today.strftime("%Y-%m")
-    prev_month = today.replace(day=1) - timedelta(days=1)
-    prev_ym = prev_month.strftime("%Y-%m")
-    # 월별 출고 집계
-    if "_ship_ym" not in overseas.columns:
-        return pd.DataFrame(columns=cols_out)
-    cur_data = overseas[overseas["_ship_ym"].astype(str) == cur_ym]
-    prev_data = overseas[overseas["_ship_ym"].astype(str) == prev_ym]
-    # 30% 이상 증가 품목 탐지 (기존 spike 로직 활용)
-    spike = build_spike_report_only(cur_data, prev_data)
-    if spike.empty:
-        return pd.DataFrame(columns=cols_out)
-    # 최근 N일 일평균 출고량 계산
-    cutoff = today - timedelta(days=lookback_days)
-    ship_dates = pd.to_datetime(overseas["_ship_date"], errors="coerce")
-    recent = overseas[ship_dates.notna() & (ship_dates >= pd.Timestamp(cutoff))].copy()
-    if recent.empty:
-        return pd.DataFrame(columns=cols_out)
-    daily_avg = (
-        recent.groupby(COL_ITEM_CODE, dropna=False)[COL_QTY]
-        .sum()
-        .reset_index(name="_total_qty")
-    )
-    daily_avg["_total_qty"] = pd.to_numeric(daily_avg["_total_qty"], errors="coerce").fillna(0)
-    actual_days = max((today - cutoff).days, 1)
-    daily_avg["최근일평균출고"] = (daily_avg["_total_qty"] / actual_days).round(1)
-    # spike 품목과 재고 데이터 조인
-    alert = spike[[COL_ITEM_CODE, COL_ITEM_NAME, "이전_요청수량", "현재_요청수량", "증가배수"]].copy()
-    alert = alert.rename(columns={"이전_요청수량": "이전월출고", "현재_요청수량": "현재월출고"})
-    # inv_df의 컬럼명을 COL_ITEM_CODE와 통일 후 on= 으로 병합 (suffix 문제 방지)
-    inv_merge = inv_df.rename(columns={"품목코드": COL_ITEM_CODE})[[COL_ITEM_CODE, "현재고", "1차입고일", "1차입고수량"]].copy()
-    alert = alert.merge(inv_merge, on=COL_ITEM_CODE, how="left")
-    alert = alert.merge(daily_avg[[COL_ITEM_CODE, "최근일평균출고"]], on=COL_ITEM_CODE, how="left")
-    # 소진일수 계산
-    alert["현재고"] = pd.to_numeric(alert["현재고"], errors="coerce").fillna(0)
-    alert["최근일평균출고"] = pd.to_numeric(alert["최근일평균출고"], errors="coerce").fillna(0)
-    alert["소진예상일수"] = alert.apply(
-        lambda r: round(r["현재고"] / r["최근일평균출고"], 1) if r["최근일평균출고"] > 0 else float("inf"),
-        axis=1,
+    scen = ShortageScenarios(
+        raw_df, inv_df, ship_matrix, lookbacks=(lookback_days,), thresholds=(alert_threshold_days,)
     )
-    alert["소진예상일"] = alert["소진예상일수"].apply(
-        lambda d: (today + timedelta(days=int(d))).strftime("%Y-%m-%d") if d != float("inf") and d < 365 else "-"
-    )
-    # 입고 전 소진 여부
-    alert["입고전소진여부"] = alert.apply(
-        lambda r: (
-            "예" if (
-                pd.notna(r.get("1차입고일")) and r["소진예상일"] != "-"
-                and pd.to_datetime(r["소진예상일"], errors="coerce") is not pd.NaT
-                and pd.to_datetime(r["소진예상일"], errors="coerce") < r["1차입고일"]
-            ) else ("입고예정없음" if pd.isna(r.get("1차입고일")) else "아니오")
-        ),
-        axis=1,
-    )
-    # 위험등급 분류
-    def _risk_level(r):
-        days = r["소진예상일수"]
-        if days == float("inf"):
-            return "안전"
-        if days <= 7:
-            return "긴급"
-        if days <= 14:
-            return "위험"
-        if days <= alert_threshold_days:
-            return "주의"
-        return "안전"
-    alert["위험등급"] = alert.apply(_risk_level, axis=1)
-    # 안전 등급 제외하고 위험도순 정렬
-    risk_order = {"긴급": 0, "위험": 1, "주의": 2, "안전": 3}
-    alert["_risk_sort"] = alert["위험등급"].map(risk_order)
-    alert = alert.sort_values(["_risk_sort", "소진예상일수"], ascending=[True, True])
-    alert = alert.drop(columns=["_risk_sort"], errors="ignore")
-    # 유효 컬럼만 반환
-    for c in cols_out:
-        if c not in alert.columns:
-            alert[c] = pd.NA
-    return alert[cols_out]
+    return scen.result(lookback_days, alert_threshold_days, method)
 # =========================
 # Slack 메시지 포맷 (부족 예상 재고)
 # =========================
-def build_shortage_slack_message(alert_df: pd.DataFrame) -> str:
+def build_shortage_slack_message(alert_df: pd.DataFrame, basis: str = "최근90일 평균출고") -> str:
     """부족 예상 재고 알람 데이터를 Slack 메시지 포맷으로 변환"""
     if alert_df is None or alert_df.empty:
         return "부족 예상 재고 알람: 현재 알람 대상 품목이 없습니다."
@@ -671,7 +838,7 @@ def build_shortage_slack_message(alert_df: pd.DataFrame) -> str:
             lines.append(f"    월간증가: {rate_str}")
             lines.append("")
     total = len(alert_df[alert_df["위험등급"] != "안전"])
-    lines.append(f"총 {total}건 알람 | 기준: 최근90일 평균출고 기반")
+    lines.append(f"총 {total}건 알람 | 기준: {basis} 기반")
     return "\n".join(lines)
 # =========================
 # 주차/월간 자동 코멘트 helpers
@@ -690,12 +857,22 @@ def _delta_text(diff: float) -> str:
         return "-"
 def _fmt_delta(diff: float) -> str:
     return f"{_delta_text(diff)} {_delta_arrow(diff)}"
+def _clean_keys(series: pd.Series) -> pd.Series:
+    """주문번호 등 키 컬럼: 빈값/결측 토큰 → NA. category(스키마 계약)는 이미 strip 되어 있어 값 비교만"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.where(~series.isin(["", "nan", "None"]))
+    s = series.astype(str).str.strip()
+    return s.replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
 def _clean_nunique(series: pd.Series) -> int:
     if series is None:
         return 0
-    s = series.astype(str).str.strip()
-    s = s.replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
-    return int(s.dropna().nunique())
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # 문자열 해시 없이 코드로: 등장한 카테고리 중 결측 토큰이 아닌 것의 수
+        cats = series.cat.categories
+        codes = series.cat.codes.to_numpy()
+        present = np.bincount(codes[codes >= 0], minlength=len(cats)) > 0
+        return int((present & ~cats.isin(["", "nan", "None"])).sum())
+    return int(_clean_keys(series).dropna().nunique())
 def _get_order_cnt(df: pd.DataFrame) -> int:
     if df is None or df.empty or COL_ORDER_NO not in df.columns:
         return 0
@@ -705,11 +882,11 @@ _get_ship_cnt = _get_order_cnt
 def _get_qty(df: pd.DataFrame) -> int:
     if df is None or df.empty or COL_QTY not in df.columns:
         return 0
-    return int(round(float(pd.to_numeric(df[COL_QTY], errors="coerce").fillna(0).sum()), 0))
+    return int(round(float(df[COL_QTY].fillna(0).sum()), 0))
 def _get_lt_mean(df: pd.DataFrame) -> float:
     if df is None or df.empty or COL_LT2 not in df.columns:
         return float("nan")
-    s = pd.to_numeric(df[COL_LT2], errors="coerce").dropna()
+    s = df[COL_LT2].dropna().astype("float64")
     if s.empty:
         return float("nan")
     return float(s.mean())
@@ -726,7 +903,7 @@ def category_top_comment(cur_df: pd.DataFrame, top_n: int = 2) -> list[str]:
         return []
     tmp = cur_df.copy()
     tmp[cat_col] = tmp[cat_col].astype(str).str.strip()
-    g = tmp.groupby(cat_col, dropna=False)[COL_QTY].sum(min_count=1).sort_values(ascending=False).head(top_n)
+    g = tmp.groupby(cat_col, dropna=False, observed=True)[COL_QTY].sum(min_count=1).sort_values(ascending=False).head(top_n)
     if g.empty:
         return []
     desc = ", ".join([f"{idx}({_fmt_int(val)})" for idx, val in g.items()])
@@ -739,13 +916,13 @@ def concentration_comment(cur_df: pd.DataFrame) -> list[str]:
         return []
     out = []
     if COL_BP in cur_df.columns:
-        g = cur_df.groupby(COL_BP, dropna=False)[COL_QTY].sum(min_count=1).sort_values(ascending=False)
+        g = cur_df.groupby(COL_BP, dropna=False, observed=True)[COL_QTY].sum(min_count=1).sort_values(ascending=False)
         if not g.empty:
             top_bp = str(g.index[0]).strip()
             top_bp_qty = float(pd.to_numeric(g.iloc[0], errors="coerce") or 0)
             out.append(f"Top BP 집중도: 1위 {top_bp}({_fmt_int(top_bp_qty)}) {top_bp_qty/total*100:.0f}%")
     if all(c in cur_df.columns for c in [COL_ITEM_CODE, COL_ITEM_NAME]):
-        g2 = cur_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY].sum(min_count=1).sort_values(ascending=False)
+        g2 = cur_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY].sum(min_count=1).sort_values(ascending=False)
         if not g2.empty:
             (top_code, top_name) = g2.index[0]
             top_qty = float(pd.to_numeric(g2.iloc[0], errors="coerce") or 0)
@@ -781,99 +958,1330 @@ def period_kpi_delta_comment(cur_df: pd.DataFrame, prev_df: pd.DataFrame) -> lis
 # =========================
 # Load + Prepare (RAW + cal_agg)
 # =========================
-@st.cache_data(ttl=1800, show_spinner=False)
-def load_prepared_from_gsheet() -> tuple[pd.DataFrame, pd.DataFrame]:
-    csv_url = f"https://docs.google.com/spreadsheets/d/{GSHEET_ID}/export?format=csv&gid={GSHEET_GID}"
+def _gsheet_csv_url(gid: str) -> str:
+    return f"{GSHEET_BASE_URL}/spreadsheets/d/{GSHEET_ID}/export?format=csv&gid={gid}"
+def _gsheet_query_url(gid: str, tq: str, range_a1: str) -> str:
+    params = urllib.parse.urlencode({"tqx": "out:csv", "gid": gid, "headers": 1, "range": range_a1, "tq": tq})
+    return f"{GSHEET_BASE_URL}/spreadsheets/d/{GSHEET_ID}/gviz/tq?{params}"
+def fetch_gsheet_csv(gid: str, timeout: float = GSHEET_TIMEOUT_SEC) -> bytes:
+    """시트 CSV export 원문(bytes) — 타임아웃 적용 (백그라운드 갱신이 무한 대기하지 않도록)"""
+    with urllib.request.urlopen(_gsheet_csv_url(gid), timeout=timeout) as resp:
+        return resp.read()
+def _col_letter(idx: int) -> str:
+    """0-based 열 인덱스 → A1 표기 열 문자 (0→A, 26→AA)"""
+    out = ""
+    idx += 1
+    while idx > 0:
+        idx, rem = divmod(idx - 1, 26)
+        out = chr(ord("A") + rem) + out
+    return out
+def _read_header_row(stream, header_row: int) -> list[str]:
+    """바이너리 스트림에서 header_row 행까지만 읽어 헤더 반환 (나머지는 읽지 않음)"""
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    for i, row in enumerate(reader):
+        if i == header_row:
+            return [str(c).strip() for c in row]
+    raise ValueError(f"헤더 행({header_row + 1}행)이 없습니다.")
+# SAP 탭에서 있으면 함께 읽는 컬럼 (보조 리드타임 / 카테고리)
+SAP_OPTIONAL_COLS = ["리드타임1"] + CATEGORY_COL_CANDIDATES
+def resolve_sap_columns(header: list[str]) -> dict[str, int]:
+    """헤더 → {읽을 컬럼명: 열 위치} (시트 순서). USECOLS + 선택 컬럼 중 실제로 있는 것만, 중복 이름은 첫 열"""
+    wanted = set(USECOLS) | set(SAP_OPTIONAL_COLS)
+    pos: dict[str, int] = {}
+    for i, name in enumerate(header):
+        if name in wanted and name not in pos:
+            pos[name] = i
+    return pos
+def build_sap_pushdown_query(header: list[str]) -> Optional[tuple[str, str, list[str]]]:
+    """헤더 → (tq, range, 기대 컬럼) — USECOLS 가 모두 있을 때만 (없으면 전체 export 경로)"""
+    pos = resolve_sap_columns(header)
+    if any(c not in pos for c in USECOLS):
+        return None
+    cols = list(pos)
+    select = ", ".join(_col_letter(pos[c]) for c in cols)
+    classes = "|".join(re.escape(c) for c in KEEP_CLASSES)
+    tq = f"select {select} where {_col_letter(pos[COL_CLASS])} matches '\\s*({classes})\\s*'"
+    range_a1 = f"A{HEADER_ROW_0BASED + 1}:{_col_letter(len(header) - 1)}"
+    return tq, range_a1, cols
+# 대조·감시 대상: 비면 행이 빠지거나 값이 틀어지는 컬럼
+SAP_PARITY_COLS = [COL_ORDER_NO, COL_ITEM_CODE, COL_QTY, COL_ORDER_DATE, COL_SHIP, COL_DONE]
+class PushdownPlan(NamedTuple):
+    url: str                    # gviz tq 요청 URL
+    header: list[str]           # 대조 때 받은 tq 헤더 (다르면 열 구성이 바뀐 것)
+    key_pos: list[int]          # 감시할 핵심 컬럼의 tq 본문 열 위치
+    filled: list[float]         # 대조 때 핵심 컬럼별 값 있는 비율
+@st.cache_resource(show_spinner=False)
+def _pushdown_plans() -> dict[str, dict]:
+    """탭(gid)별 대조를 통과한 pushdown 계획과 그 뒤 사용 횟수 {gid: {"plan", "uses"}} (프로세스 공용)"""
+    return {}
+def _csv_header(data: bytes) -> list[str]:
+    return [str(c).strip() for c in next(csv.reader(io.StringIO(data.decode("utf-8-sig").split("\n", 1)[0])), [])]
+def _filled_ratio(data: bytes, key_pos: list[int]) -> list[float]:
+    """tq 본문(1행 헤더) → 열 위치별 값 있는(공백 아닌) 칸 비율"""
+    df = pd.read_csv(io.BytesIO(data), header=0, usecols=key_pos, dtype=str, keep_default_na=False)
+    return [float((df.iloc[:, i].str.strip() != "").mean()) if len(df) else 0.0 for i in range(len(key_pos))]
+def _present_values(s: pd.Series) -> pd.Series:
+    """결측을 뺀 값 — 텍스트는 빈 칸·null 토큰·"<NA>"(_convert_text 의 결측 표기)도 결측"""
+    s = s.dropna()
+    if not (pd.api.types.is_numeric_dtype(s) or pd.api.types.is_datetime64_any_dtype(s)):
+        s = s[~s.astype(str).str.strip().isin([*SAP_NULL_TOKENS, "<NA>"])]
+    return s
+def _frames_agree(full: pd.DataFrame, part: pd.DataFrame, key_cols: list[str]) -> bool:
+    """전체 export 와 tq 본문의 파싱 결과 대조 — 행 수, 핵심 컬럼별 값 수와 (숫자·날짜면) 합계"""
+    if len(full) != len(part):
+        return False
+    for c in key_cols:
+        if c not in full.columns:
+            continue
+        if c not in part.columns:
+            return False
+        a, b = _present_values(full[c]), _present_values(part[c])
+        if len(a) != len(b):
+            return False
+        if pd.api.types.is_datetime64_any_dtype(a):
+            a, b = (x.to_numpy(dtype="datetime64[D]").astype(np.int64) for x in (a, b))
+        if pd.api.types.is_numeric_dtype(a):
+            if not np.isclose(np.asarray(a, dtype="float64").sum(), np.asarray(b, dtype="float64").sum()):
+                return False
+    return True
+def _fetch_verified_pushdown(gid: str, timeout: float) -> Optional[bytes]:
+    """대조를 통과한 계획이 있고 다음 대조 전이면 tq 본문 — 헤더가 달라졌거나 핵심 컬럼이 비면 계획을 버리고 None"""
+    plans = _pushdown_plans()
+    entry = plans.get(gid)
+    if entry is None or entry["uses"] >= GSHEET_PARITY_EVERY:
+        return None
+    plan = entry["plan"]
     try:
-        df = pd.read_csv(
-            csv_url,
-            header=HEADER_ROW_0BASED,
-            usecols=USECOLS,
-            dtype=DTYPE_MAP,
-        )
+        with urllib.request.urlopen(plan.url, timeout=timeout) as resp:
+            data = resp.read()
+        if _csv_header(data) == plan.header:
+            filled = _filled_ratio(data, plan.key_pos)
+            if all(now >= then - GSHEET_BLANK_TOLERANCE for now, then in zip(filled, plan.filled)):
+                entry["uses"] += 1
+                return data
     except Exception:
-        df = pd.read_csv(csv_url, header=HEADER_ROW_0BASED)
-    df.columns = df.columns.astype(str).str.strip()
-    df = df.loc[:, ~df.columns.str.match(r"^Unnamed")]
-    for c in [COL_SHIP, COL_DONE, COL_ORDER_DATE]:
-        safe_dt(df, c)
-    for c in [COL_QTY, COL_LT2, "리드타임1"]:
-        safe_num(df, c)
+        pass
+    plans.pop(gid, None)
+    return None
+def _verify_pushdown(
+    gid: str, url: str, full: pd.DataFrame, parse, key_cols: list[str], key_pos: list[int], timeout: float
+) -> Optional[bytes]:
+    """tq 본문을 받아 전체 export 파싱 결과(full)와 대조 — 통과하면 계획을 저장하고 본문, 아니면 None"""
+    _pushdown_plans().pop(gid, None)
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        data = resp.read()
+    if not _frames_agree(full, parse(data), key_cols):
+        return None
+    plan = PushdownPlan(url, _csv_header(data), key_pos, _filled_ratio(data, key_pos))
+    _pushdown_plans()[gid] = {"plan": plan, "uses": 0}
+    return data
+def fetch_sap_csv(timeout: float = GSHEET_TIMEOUT_SEC) -> tuple[bytes, int, str]:
+    """SAP 탭 CSV. 반환: (payload, 헤더 행 위치, 방식)
+    - 대조를 통과한 pushdown 계획이 있으면 tq 요청 하나로 끝 (GSHEET_PARITY_EVERY 회마다 다시 대조)
+    - 아니면 전체 export 를 받아 그 헤더로 tq 를 만들고, 대조를 통과하면 tq 본문을 돌려준다 (불가/불일치 시 전체 export)"""
+    if GSHEET_PUSHDOWN:
+        data = _fetch_verified_pushdown(GSHEET_GID, timeout)
+        if data is not None:
+            return data, 0, "pushdown"
+    full = fetch_gsheet_csv(GSHEET_GID, timeout)
+    if GSHEET_PUSHDOWN:
+        try:
+            plan = build_sap_pushdown_query(_read_header_row(io.BytesIO(full), HEADER_ROW_0BASED))
+            if plan is not None:
+                tq, range_a1, cols = plan
+                data = _verify_pushdown(
+                    GSHEET_GID, _gsheet_query_url(GSHEET_GID, tq, range_a1),
+                    parse_sap_csv(full, HEADER_ROW_0BASED), lambda b: parse_sap_csv(b, 0),
+                    SAP_PARITY_COLS, [cols.index(c) for c in SAP_PARITY_COLS if c in cols], timeout,
+                )
+                if data is not None and _csv_header(data) == cols:
+                    return data, 0, "pushdown"
+                _pushdown_plans().pop(GSHEET_GID, None)
+        except Exception:
+            pass
+    return full, HEADER_ROW_0BASED, "full"
+def fetch_inventory_csv(timeout: float = GSHEET_TIMEOUT_SEC) -> tuple[bytes, str]:
+    """재고 탭 CSV. 반환: (payload, "range" | "full") — H열부터 범위 요청.
+    SAP 탭과 같이 전체 export 와 대조를 통과한 뒤에만 범위 본문을 쓰고, 그 사이에는 핵심 컬럼(H~L열) 공란을 감시"""
+    if GSHEET_PUSHDOWN:
+        data = _fetch_verified_pushdown(GSHEET_GID_INV, timeout)
+        if data is not None:
+            return data, "range"
+    full = fetch_gsheet_csv(GSHEET_GID_INV, timeout)
+    if GSHEET_PUSHDOWN:
+        try:
+            data = _verify_pushdown(
+                GSHEET_GID_INV, _gsheet_query_url(GSHEET_GID_INV, "select *", INV_RANGE_A1),
+                parse_inventory_csv(full), lambda b: parse_inventory_csv(b, ranged=True),
+                INV_COLS, list(range(len(INV_COLS))), timeout,
+            )
+            if data is not None:
+                return data, "range"
+        except Exception:
+            pass
+    return full, "full"
+# 파생 컬럼(행 단위) / 캘린더 집계 키
+DERIVED_COLS = ["_is_rep", "_week_label", "_week_key_num", "_month_label", "_month_key_num", "_ship_day", "_ship_ym"]
+CAL_AGG_KEYS = ["_ship_ym", "_ship_day", COL_BP, COL_CUST1, COL_CUST2]
+# 증분(delta) 반영: 행 지문으로 이전 스냅샷과 비교해 추가/변경/삭제 행만 파생·집계에 반영
+DELTA_INGEST = True
+DELTA_MAX_CHANGE_RATIO = 0.5   # 변경 행 비율이 이보다 크면 전체 재구성이 더 싸다
+ROW_KEY_COLS = [COL_ORDER_NO, COL_ITEM_CODE, COL_ORDER_DATE, COL_SHIP, COL_DONE]
+class PreparedData(NamedTuple):
+    raw: pd.DataFrame
+    cal_agg: pd.DataFrame
+    inv: pd.DataFrame
+    version: str       # SAP 탭 원문 해시
+    inv_version: str   # 재고 탭 원문 해시
+    fetched_at: float  # SAP 탭과 마지막으로 일치 확인된 시각 (epoch)
+# 파싱 단계 타입 변환: 읽는 시점에 천 단위 쉼표/null 토큰/공백을 처리하고, 날짜는 감지한 포맷을 재사용
+SAP_NULL_TOKENS = ["", "nan", "None"]
+SAP_NUM_COLS = [COL_QTY, COL_LT2, "리드타임1"]
+SAP_DATE_COLS = [COL_SHIP, COL_DONE, COL_ORDER_DATE]
+SAP_TEXT_COLS = [COL_BP, COL_ITEM_CODE, COL_ITEM_NAME, COL_CUST1, COL_CUST2, COL_CLASS, COL_MAIN, COL_ORDER_NO]
+@st.cache_resource(show_spinner=False)
+def _date_format_cache() -> dict[str, Optional[str]]:
+    """컬럼별 감지된 날짜 포맷 (프로세스 공용, 재실행/백그라운드 갱신 간 유지)"""
+    return {}
+def _convert_dates(s: pd.Series, col: str) -> pd.Series:
+    """문자열 → datetime. 캐시된 포맷으로 한 번에 변환 (pandas 의 첫 값 기준 포맷 추론과 같은 결과)"""
+    cache = _date_format_cache()
+    first_idx = s.first_valid_index()
+    first = s[first_idx] if first_idx is not None else None
+    fmt = cache.get(col)
+    if first is not None and (fmt is None or pd.isna(pd.to_datetime(first, format=fmt, errors="coerce"))):
+        fmt = guess_datetime_format(first)
+        cache[col] = fmt
+    if fmt is None:
+        return pd.to_datetime(s, errors="coerce")
+    return pd.to_datetime(s, format=fmt, errors="coerce")
+def _convert_numbers(s: pd.Series) -> pd.Series:
+    """read_csv(thousands=",") 가 숫자로 못 읽은 열(문자 섞임)만 문자열 정리 후 변환"""
+    if pd.api.types.is_numeric_dtype(s):
+        return s
+    s = s.astype(str).str.replace(",", "", regex=False).str.strip()
+    return pd.to_numeric(s.replace({t: None for t in SAP_NULL_TOKENS}), errors="coerce")
+def _convert_text(s: pd.Series) -> pd.Series:
+    """공백 제거 — 고유값에만 strip 후 코드로 펼침. 결측은 기존 astype(str) 결과("<NA>")와 같게 object 로 반환"""
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    stripped = np.array([str(u).strip() for u in uniques] + ["<NA>"], dtype=object)
+    return pd.Series(stripped[codes], index=s.index, name=s.name)
+def parse_sap_csv(data: bytes, header_row: int = HEADER_ROW_0BASED) -> pd.DataFrame:
+    """SAP 탭 CSV → 타입 변환/정규화 + 제품분류 필터까지 (파생 컬럼 제외)
+    payload 의 헤더 행만 먼저 읽어 실제 있는 컬럼을 확정한 뒤, 열 위치로 한 번만 projection 파싱"""
+    pos = resolve_sap_columns(_read_header_row(io.BytesIO(data), header_row))
+    names = list(pos)
+    dtype = {c: t for c, t in DTYPE_MAP.items() if c in pos}
+    dtype.update({c: object for c in SAP_TEXT_COLS if c in pos})
+    dtype.update({c: object for c in SAP_DATE_COLS if c in pos})
+    df = pd.read_csv(
+        io.BytesIO(data),
+        header=header_row,
+        usecols=list(pos.values()),
+        names=names,
+        dtype=dtype,
+        thousands=",",
+        na_values=SAP_NULL_TOKENS,
+        keep_default_na=True,
+    )
+    for c in SAP_DATE_COLS:
+        if c in df.columns:
+            df[c] = _convert_dates(df[c], c)
+    for c in SAP_NUM_COLS:
+        if c in df.columns:
+            df[c] = _convert_numbers(df[c])
     if (COL_LT2 not in df.columns) or (df[COL_LT2].dropna().empty):
         if all(c in df.columns for c in [COL_DONE, COL_ORDER_DATE]):
             df[COL_LT2] = (df[COL_DONE] - df[COL_ORDER_DATE]).dt.days
             safe_num(df, COL_LT2)
-    normalize_text_cols(df, [COL_BP, COL_ITEM_CODE, COL_ITEM_NAME, COL_CUST1, COL_CUST2, COL_CLASS, COL_MAIN, COL_ORDER_NO])
     if COL_CLASS in df.columns:
-        df = df[df[COL_CLASS].astype(str).str.strip().isin(KEEP_CLASSES)].copy()
+        # 필터를 먼저 적용해 나머지 텍스트 정리는 남는 행에만
+        df = df[_convert_text(df[COL_CLASS]).isin(KEEP_CLASSES)]
+    for c in SAP_TEXT_COLS:
+        if c in df.columns:
+            df[c] = _convert_text(df[c])
+    return df.reset_index(drop=True)
+def derive_raw_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """행 단위 파생 컬럼(대표행/주차·월 라벨/출고일) 추가 — 다른 행에 의존하지 않으므로 일부 행에만 적용 가능"""
+    df = df.copy()
     df["_is_rep"] = to_bool_true(df[COL_MAIN]) if COL_MAIN in df.columns else False
     ship_dt = pd.to_datetime(df[COL_SHIP], errors="coerce") if COL_SHIP in df.columns else pd.Series(pd.NaT, index=df.index)
     done_dt = pd.to_datetime(df[COL_DONE], errors="coerce") if COL_DONE in df.columns else pd.Series(pd.NaT, index=df.index)
-    base_dt = ship_dt.fillna(done_dt)
-    wk = ((base_dt.dt.day - 1) // 7 + 1).astype("Int64")
-    mask = base_dt.notna() & wk.notna()
-    y_int = base_dt.dt.year.astype("Int64")
-    m_int = base_dt.dt.month.astype("Int64")
-    df["_week_label"] = pd.NA
-    df.loc[mask, "_week_label"] = (
-        y_int.astype(str) + "년 " +
-        m_int.astype(str) + "월 " +
-        wk.astype(str) + "주차"
-    )
-    df["_week_key_num"] = pd.NA
-    df.loc[mask, "_week_key_num"] = (y_int * 10000 + m_int * 100 + wk).astype("Int64")
+    # 날짜 → 일 키, 주차/월 라벨은 날짜 차원에서 코드로 연결 (행 단위 문자열 조립 없음)
+    ship_key = day_keys(ship_dt)
+    base_key = ship_key.fillna(day_keys(done_dt))
+    dim = date_dim_for(ship_key, base_key)
+    df["_week_label"] = dim_labels(dim, base_key, "week_label")
+    df["_week_key_num"] = dim_lookup(dim, base_key, "week_key_num", "Int32")
     if (COL_YEAR in df.columns) and (COL_MONTH in df.columns):
         y = pd.to_numeric(df[COL_YEAR], errors="coerce").astype("Int64")
         m = pd.to_numeric(df[COL_MONTH], errors="coerce").astype("Int64")
-        mmask = y.notna() & m.notna()
-        df["_month_label"] = pd.NA
-        df.loc[mmask, "_month_label"] = y.astype(str) + "년 " + m.astype(str) + "월"
-        df["_month_key_num"] = pd.NA
-        df.loc[mmask, "_month_key_num"] = (y * 100 + m).astype("Int64")
+        mkey = (y * 100 + m).astype("Int32")
+        # 월 라벨은 고유 (년, 월) 조합만 문자열로 만들고 행에는 코드만
+        pairs = pd.DataFrame({"k": mkey, "y": y, "m": m}).dropna().drop_duplicates("k")
+        label_of = dict(zip(pairs["k"].tolist(), [f"{a}년 {b}월" for a, b in zip(pairs["y"], pairs["m"])]))
+        cats = pd.Index(sorted(label_of.values()))
+        code_of = pd.Series(cats.get_indexer(list(label_of.values())), index=list(label_of.keys()), dtype="int64")
+        codes = mkey.map(code_of).fillna(-1).astype("int64").to_numpy()
+        df["_month_label"] = pd.Categorical.from_codes(codes, categories=cats)
+        df["_month_key_num"] = mkey
     else:
-        df["_month_label"] = pd.NA
-        df["_month_key_num"] = pd.NA
-    df["_ship_date"] = ship_dt.dt.date
-    df["_ship_ym"] = ship_dt.dt.strftime("%Y-%m")
-    cal_src = df.dropna(subset=["_ship_date"]).copy()
+        df["_month_label"] = pd.Categorical.from_codes(np.full(len(df), -1), categories=pd.Index([], dtype=object))
+        df["_month_key_num"] = pd.Series(pd.NA, index=df.index, dtype="Int32")
+    df["_ship_day"] = ship_key
+    df["_ship_ym"] = dim_labels(dim, ship_key, "ym")
+    return df
+# RAW 스키마 계약 — 차원은 category(사전 인코딩), 측정값/키는 고정 숫자형.
+# 메뉴 코드는 이 타입을 전제로 to_numeric / astype(str).str.strip() 재변환 없이 바로 사용한다.
+# (요청수량은 합계가 정확해야 하므로 float64 유지 — float32 는 2^24 이상 합계에서 오차)
+SHIPMENT_DIM_COLS = [
+    COL_BP, COL_CUST1, COL_CUST2, COL_CLASS, COL_MAIN,
+    COL_ITEM_CODE, COL_ITEM_NAME, COL_ORDER_NO,
+    "_week_label", "_month_label", "_ship_ym",
+] + CATEGORY_COL_CANDIDATES
+SHIPMENT_SCHEMA = {
+    COL_QTY: "float64",
+    COL_LT2: "float32",
+    "리드타임1": "float32",
+    "_week_key_num": "Int32",
+    "_month_key_num": "Int32",
+    "_ship_day": "Int32",
+    "_is_rep": "bool",
+}
+def _categorize(df: pd.DataFrame, cols: list[str]) -> pd.DataFrame:
+    """문자열 컬럼 → category (카테고리는 정렬 — 정렬 결과가 문자열 정렬과 같도록)"""
+    for c in cols:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = pd.Categorical(df[c].astype(object))
+    return df
+def to_shipment_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """파생까지 끝난 RAW → 스키마 계약 타입 (제자리 변환 후 반환)"""
+    _categorize(df, SHIPMENT_DIM_COLS)
+    for c, t in SHIPMENT_SCHEMA.items():
+        if c in df.columns and str(df[c].dtype) != t:
+            df[c] = df[c].astype(t)
+    return df
+def shipment_schema_errors(df: pd.DataFrame) -> list[str]:
+    """계약 위반 컬럼 목록 (빈 리스트면 정상)"""
+    errors = []
+    for c in SHIPMENT_DIM_COLS:
+        if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            errors.append(f"{c}: {df[c].dtype} (category 기대)")
+    for c, t in SHIPMENT_SCHEMA.items():
+        if c in df.columns and str(df[c].dtype) != t:
+            errors.append(f"{c}: {df[c].dtype} ({t} 기대)")
+    return errors
+def _cal_agg_parts(df: pd.DataFrame, sign: int = 1) -> pd.DataFrame:
+    """캘린더 집계의 가산 가능한 부분합(수량 합/행수) — 증분 반영 시 sign=-1 로 차감"""
+    cal_src = df.dropna(subset=["_ship_day"])
     if cal_src.empty:
-        cal_agg = pd.DataFrame(columns=["_ship_ym", "_ship_date", COL_BP, COL_CUST1, COL_CUST2, "qty_sum"])
+        return pd.DataFrame(columns=CAL_AGG_KEYS + ["_qty_exact", "_rows"])
+    parts = (
+        cal_src.groupby(CAL_AGG_KEYS, dropna=False, observed=True)[COL_QTY]
+        .agg(_qty_exact="sum", _rows="size")
+        .reset_index()
+    )
+    if sign != 1:
+        parts["_qty_exact"] = parts["_qty_exact"] * sign
+        parts["_rows"] = parts["_rows"] * sign
+    return parts
+def _finish_cal_agg(parts: pd.DataFrame) -> pd.DataFrame:
+    if parts.empty:
+        return pd.DataFrame(columns=CAL_AGG_KEYS + ["qty_sum", "_qty_exact", "_rows"])
+    cal_agg = _categorize(parts[parts["_rows"] > 0].reset_index(drop=True), [c for c in CAL_AGG_KEYS if c != "_ship_day"])
+    cal_agg.insert(len(CAL_AGG_KEYS), "qty_sum", pd.to_numeric(cal_agg["_qty_exact"], errors="coerce").fillna(0).round(0).astype("Int64"))
+    return cal_agg
+def build_cal_agg(df: pd.DataFrame) -> pd.DataFrame:
+    return _finish_cal_agg(_cal_agg_parts(df))
+def _source_cols(df: pd.DataFrame) -> list[str]:
+    return [c for c in df.columns if not str(c).startswith("_")]
+def _hash_rows(df: pd.DataFrame, cols: list[str]) -> np.ndarray:
+    if not cols:
+        return np.zeros(len(df), dtype="uint64")
+    return pd.util.hash_pandas_object(df[cols], index=False).to_numpy(dtype="uint64")
+def _occurrence_keys(fp: np.ndarray) -> np.ndarray:
+    """같은 지문이 여러 번 나오는 행(완전 중복 행)도 1:1 로 대응되도록 등장 순번을 섞은 키"""
+    occ = pd.Series(fp).groupby(fp).cumcount().to_numpy(dtype="uint64")
+    return fp ^ (occ * np.uint64(0x9E3779B97F4A7C15))
+def prepare_full(src: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    df = derive_raw_columns(src)
+    df["_row_fp"] = _hash_rows(src, _source_cols(src))
+    df = to_shipment_frame(df)
+    return df, build_cal_agg(df)
+def prepare_delta(src: pd.DataFrame, prev: PreparedData) -> Optional[tuple[pd.DataFrame, pd.DataFrame, dict]]:
+    """이전 raw 와 행 지문을 비교해 추가/삭제 행만 파생·집계에 반영.
+    컬럼 구성이 달라졌거나 변경 비율이 크면 None (→ 전체 재구성)"""
+    prev_raw = prev.raw
+    src_cols = _source_cols(src)
+    if "_row_fp" not in prev_raw.columns or _source_cols(prev_raw) != src_cols:
+        return None
+    if "_qty_exact" not in prev.cal_agg.columns:
+        return None
+    new_fp = _hash_rows(src, src_cols)
+    new_keys = _occurrence_keys(new_fp)
+    old_keys = _occurrence_keys(prev_raw["_row_fp"].to_numpy(dtype="uint64"))
+    old_index = pd.Index(old_keys)
+    new_index = pd.Index(new_keys)
+    if not (old_index.is_unique and new_index.is_unique):
+        return None
+    old_pos = old_index.get_indexer(new_keys)
+    added_mask = old_pos < 0
+    removed_mask = new_index.get_indexer(old_keys) < 0
+    n_added = int(added_mask.sum())
+    n_removed = int(removed_mask.sum())
+    if (n_added + n_removed) > DELTA_MAX_CHANGE_RATIO * max(len(src), 1):
+        return None
+    # 재사용 행은 이전 파생값 그대로, 추가 행만 파생 계산
+    reused = prev_raw.iloc[old_pos[~added_mask]]
+    reused.index = np.flatnonzero(~added_mask)
+    added = derive_raw_columns(src.loc[added_mask])
+    added["_row_fp"] = new_fp[added_mask]
+    removed = prev_raw.loc[removed_mask]
+    if n_added == 0:
+        df = reused.sort_index()
     else:
-        cal_agg = (
-            cal_src.groupby(["_ship_ym", "_ship_date", COL_BP, COL_CUST1, COL_CUST2], dropna=False)[COL_QTY]
-            .sum(min_count=1)
-            .reset_index()
-            .rename(columns={COL_QTY: "qty_sum"})
+        # 카테고리 집합이 다른 category 끼리 concat 하면 object 가 되므로 계약 타입으로 다시 맞춘다
+        df = to_shipment_frame(pd.concat([reused, added[reused.columns]]).sort_index())
+    cal_agg = prev.cal_agg
+    if n_added or n_removed:
+        keep = CAL_AGG_KEYS + ["_qty_exact", "_rows"]
+        parts = pd.concat(
+            [cal_agg[keep], _cal_agg_parts(added), _cal_agg_parts(removed, sign=-1)],
+            ignore_index=True,
+        )
+        parts = parts.groupby(CAL_AGG_KEYS, dropna=False, observed=True)[["_qty_exact", "_rows"]].sum().reset_index()
+        cal_agg = _finish_cal_agg(parts)
+    # 변경 = 같은 키(주문번호+품목코드+날짜)가 삭제·추가 양쪽에 있는 행
+    key_cols = [c for c in ROW_KEY_COLS if c in src_cols]
+    added_keys = set(_hash_rows(src.loc[added_mask], key_cols).tolist())
+    removed_keys = set(_hash_rows(removed, key_cols).tolist())
+    n_changed = len(added_keys & removed_keys)
+    info = {
+        "mode": "delta",
+        "added": n_added - n_changed,
+        "changed": n_changed,
+        "removed": n_removed - n_changed,
+    }
+    return df, cal_agg, info
+def load_prepared_from_gsheet(prev: Optional[PreparedData] = None) -> tuple[pd.DataFrame, pd.DataFrame, str, dict]:
+    """SAP 탭 다운로드 + 전처리. 반환: (raw, cal_agg, data_version, ingest_info)
+    - data_version 은 원문 CSV 해시 — 이전과 같으면 파싱 없이 이전 결과 재사용
+    - prev 가 있으면 증분 반영(DELTA_INGEST), 불가하면 전체 재구성"""
+    t0 = time.perf_counter()
+    data, header_row, fetch_mode = fetch_sap_csv()
+    t1 = time.perf_counter()
+    version = hashlib.sha1(data).hexdigest()[:16]
+    fetch_info = {"fetch_mode": fetch_mode, "bytes": len(data), "fetch_sec": t1 - t0}
+    if prev is not None and prev.version == version:
+        return prev.raw, prev.cal_agg, version, {"mode": "unchanged", **fetch_info, "parse_sec": 0.0}
+    src = parse_sap_csv(data, header_row)
+    result = prepare_delta(src, prev) if (DELTA_INGEST and prev is not None) else None
+    if result is None:
+        raw_df, cal_agg = prepare_full(src)
+        info = {"mode": "full", "rows": len(raw_df)}
+    else:
+        raw_df, cal_agg, info = result
+    info.update(fetch_info)
+    info["parse_sec"] = time.perf_counter() - t1
+    return raw_df, cal_agg, version, info
+def load_inventory_from_gsheet() -> tuple[pd.DataFrame, str, dict]:
+    """상품카테고리&입고일 탭 다운로드 + 파싱. 반환: (inv, inv_version, timing)"""
+    t0 = time.perf_counter()
+    data, mode = fetch_inventory_csv()
+    t1 = time.perf_counter()
+    inv = parse_inventory_csv(data, ranged=(mode == "range"))
+    timing = {"fetch_mode": mode, "bytes": len(data), "fetch_sec": t1 - t0, "parse_sec": time.perf_counter() - t1}
+    return inv, hashlib.sha1(data).hexdigest()[:16], timing
+# =========================
+# SAP / 재고 탭 병렬 로딩
+# =========================
+SOURCE_SAP = "SAP"
+SOURCE_INV = "재고"
+def load_sources_concurrently(prev: Optional[PreparedData] = None) -> dict[str, dict]:
+    """SAP·재고 탭을 동시에 받아 각자 도착하는 대로 파싱.
+    반환: {source: {"ok", "value" | "error", "sec"}} — 한쪽이 실패해도 다른 쪽 결과는 그대로 돌려준다"""
+    jobs = {
+        SOURCE_SAP: lambda: load_prepared_from_gsheet(prev),
+        SOURCE_INV: load_inventory_from_gsheet,
+    }
+    t0 = time.perf_counter()
+    out: dict[str, dict] = {}
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix="gsheet-fetch") as ex:
+        futures = {ex.submit(fn): name for name, fn in jobs.items()}
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                out[name] = {"ok": True, "value": fut.result()}
+            except Exception as e:
+                out[name] = {"ok": False, "error": str(e) or e.__class__.__name__}
+            out[name]["sec"] = time.perf_counter() - t0
+    return out
+# =========================
+# 로컬 스냅샷 (Arrow IPC) + stale-while-revalidate
+# =========================
+def _snapshot_meta_path() -> str:
+    return os.path.join(SNAPSHOT_DIR, "meta.json")
+def _snapshot_file(name: str, version: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}-{version}.arrow")
+def _snapshot_frames(data: PreparedData) -> list[tuple[str, str, pd.DataFrame]]:
+    return [
+        ("raw", data.version, data.raw),
+        ("cal_agg", data.version, data.cal_agg),
+        ("inv", data.inv_version, data.inv),
+    ]
+def write_snapshot(data: PreparedData) -> None:
+    """raw/cal_agg/inv 를 버전별 Arrow 파일로 저장 후 meta.json 을 마지막에 교체 (원자적 전환)"""
+    if pa is None:
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    keep = set()
+    for name, version, frame in _snapshot_frames(data):
+        path = _snapshot_file(name, version)
+        keep.add(os.path.basename(path))
+        if os.path.exists(path):
+            continue
+        tmp = f"{path}.{os.getpid()}.tmp"
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pa_feather.write_feather(table, tmp, compression="uncompressed")
+        os.replace(tmp, path)
+    meta = {
+        "schema": SNAPSHOT_SCHEMA,
+        "version": data.version,
+        "inv_version": data.inv_version,
+        "fetched_at": data.fetched_at,
+    }
+    tmp = f"{_snapshot_meta_path()}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _snapshot_meta_path())
+    # 이전 버전 파일 정리
+    for fn in os.listdir(SNAPSHOT_DIR):
+        if fn.endswith(".arrow") and fn not in keep:
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, fn))
+            except OSError:
+                pass
+@contextmanager
+def snapshot_build_lock():
+    """SNAPSHOT_DIR 배타 잠금 — 같은 호스트의 여러 서버 프로세스 중 하나만 시트를 받아 스냅샷을 만든다.
+    fcntl 이 없는 환경에서는 프로세스 내 잠금(_refresh_lock)만 적용"""
+    if fcntl is None or pa is None:
+        yield
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(os.path.join(SNAPSHOT_DIR, ".build.lock"), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+def read_snapshot_meta() -> Optional[dict]:
+    if pa is None:
+        return None
+    try:
+        with open(_snapshot_meta_path(), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("schema") == SNAPSHOT_SCHEMA else None
+def _read_arrow_frame(path: str) -> pd.DataFrame:
+    # 비압축 IPC 를 mmap 으로 열어 Arrow 쪽 힙 사본 없이 변환 (null 없는 수치 열은 페이지 캐시를 그대로 참조)
+    return pa_feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+def read_snapshot() -> Optional[PreparedData]:
+    """마지막으로 저장된 스냅샷 — 없거나 스키마가 다르거나 손상되었으면 None"""
+    meta = read_snapshot_meta()
+    if meta is None:
+        return None
+    try:
+        version = str(meta["version"])
+        inv_version = str(meta["inv_version"])
+        raw_df = _read_arrow_frame(_snapshot_file("raw", version))
+        if shipment_schema_errors(raw_df):
+            return None
+        cal_agg = _read_arrow_frame(_snapshot_file("cal_agg", version))
+        inv = _read_arrow_frame(_snapshot_file("inv", inv_version))
+        return PreparedData(raw_df, cal_agg, inv, version, inv_version, float(meta.get("fetched_at", 0.0)))
+    except Exception:
+        return None
+def freeze_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """열 버퍼를 쓰기 금지로 표시한 얕은 사본 — 세션 공용 프레임을 제자리에서 고치면 ValueError 로 바로 드러난다.
+    필터/take/select 결과는 새 버퍼라 그대로 쓸 수 있다.
+    - pandas 내부(BlockManager.arrays)에 기대는 최선 노력 보호: 구조가 예상과 다르면 아무것도 하지 않고 그대로 반환
+    - Copy-on-Write 가 켜져 있으면 파생 객체에 쓸 때 사본이 생기므로 생략
+    - 동결 전에 만들어진 열 Series(쓰기 가능한 view)를 피하려고 열 캐시가 빈 얕은 사본(같은 버퍼)을 돌려준다"""
+    if pd.options.mode.copy_on_write is True:
+        return df
+    arrays = getattr(getattr(df, "_mgr", None), "arrays", None)
+    if not isinstance(arrays, (list, tuple)):
+        return df
+    for arr in arrays:
+        # ndarray 블록 / Categorical·datetime(_ndarray) / 마스크 정수(_data, _mask)
+        for buf in (arr, getattr(arr, "_ndarray", None), getattr(arr, "_data", None), getattr(arr, "_mask", None)):
+            if isinstance(buf, np.ndarray):
+                buf.flags.writeable = False
+    return df.copy(deep=False)
+def freeze_prepared(data: PreparedData) -> PreparedData:
+    return data._replace(raw=freeze_frame(data.raw), cal_agg=freeze_frame(data.cal_agg), inv=freeze_frame(data.inv))
+class PreparedDataStore:
+    """프로세스 공용 RAW/재고 보관소.
+    - 모든 세션이 같은 PreparedData 를 공유(직렬화·세션별 사본 없음), 버퍼는 쓰기 금지
+    - 여러 서버 프로세스가 SNAPSHOT_DIR 을 공유하면 파일 잠금으로 한 곳만 시트를 받고 나머지는 스냅샷에 붙는다
+    - 시작 시 스냅샷을 즉시 제공하고 시트 재검증은 백그라운드 스레드에서 수행
+    - 재검증 성공 시 current 를 통째로 교체(다음 rerun 부터 반영), 실패한 탭은 마지막 정상 데이터 유지
+    - 예열 워커가 TTL 만료 DATA_PREWARM_SEC 전에 미리 갱신 → 요청 스레드는 갱신을 기다리지 않음
+    """
+    def __init__(self):
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        snap = read_snapshot()
+        self.current: Optional[PreparedData] = freeze_prepared(snap) if snap is not None else None
+        self.checked_at = self.current.fetched_at if self.current is not None else 0.0
+        self.errors: dict[str, str] = {}
+        self.last_ingest: dict = {}
+        self.last_timings: dict[str, float] = {}
+    @property
+    def refreshing(self) -> bool:
+        return self._refresh_lock.locked()
+    @property
+    def last_error(self) -> str:
+        return " / ".join(f"{name}: {msg}" for name, msg in self.errors.items())
+    def _attach_shared_snapshot(self) -> Optional[PreparedData]:
+        """다른 프로세스가 마지막 확인 이후 만든, 아직 예열 전인 스냅샷이 있으면 받지 않고 그대로 사용"""
+        meta = read_snapshot_meta()
+        if meta is None:
+            return None
+        fetched_at = float(meta.get("fetched_at", 0.0))
+        if fetched_at <= self.checked_at or time.time() - fetched_at >= DATA_TTL_SEC - DATA_PREWARM_SEC:
+            return None
+        prev = self.current
+        if prev is not None and (prev.version, prev.inv_version) == (str(meta["version"]), str(meta["inv_version"])):
+            self.current = prev._replace(fetched_at=fetched_at)
+        else:
+            snap = read_snapshot()
+            if snap is None:
+                return None
+            self.current = freeze_prepared(snap)
+        self.checked_at = fetched_at
+        self.errors = {}
+        self.last_ingest = {"mode": "shared", "version": self.current.version}
+        self.last_timings = {}
+        return self.current
+    def _refresh_locked(self, force: bool = False) -> PreparedData:
+        with snapshot_build_lock():
+            if not force:
+                attached = self._attach_shared_snapshot()
+                if attached is not None:
+                    return attached
+            return self._fetch_and_build()
+    def _fetch_and_build(self) -> PreparedData:
+        prev = self.current
+        results = load_sources_concurrently(prev)
+        now = time.time()
+        self.checked_at = now
+        self.errors = {name: r["error"] for name, r in results.items() if not r["ok"]}
+        self.last_timings = {name: r["sec"] for name, r in results.items()}
+        sap, inv = results[SOURCE_SAP], results[SOURCE_INV]
+        if not sap["ok"] and prev is None:
+            raise RuntimeError(sap["error"])
+        if sap["ok"]:
+            raw_df, cal_agg, version, info = sap["value"]
+            fetched_at = now
+            self.last_ingest = info
+        else:
+            raw_df, cal_agg, version, fetched_at = prev.raw, prev.cal_agg, prev.version, prev.fetched_at
+        if inv["ok"]:
+            inv_df, inv_version, _ = inv["value"]
+        elif prev is not None:
+            inv_df, inv_version = prev.inv, prev.inv_version
+        else:
+            inv_df, inv_version = empty_inventory(), ""
+        if prev is not None and (prev.version, prev.inv_version) == (version, inv_version):
+            self.current = prev._replace(fetched_at=fetched_at)
+        else:
+            self.current = freeze_prepared(PreparedData(raw_df, cal_agg, inv_df, version, inv_version, fetched_at))
+        try:
+            write_snapshot(self.current)
+        except Exception:
+            pass
+        return self.current
+    def refresh(self, force: bool = False) -> PreparedData:
+        """동기 갱신. 보여줄 데이터가 전혀 없는데 SAP 탭을 못 받으면 예외, 그 외 실패는 errors 에 기록.
+        force=False 면 다른 프로세스가 방금 만든 스냅샷이 있을 때 그것을 사용"""
+        with self._refresh_lock:
+            return self._refresh_locked(force)
+    def needs_revalidate(self) -> bool:
+        wait = DATA_RETRY_SEC if self.last_error else DATA_TTL_SEC
+        return (time.time() - self.checked_at) >= wait
+    def next_prewarm_at(self) -> float:
+        """예열 워커의 다음 갱신 예정 시각 (실패 후에는 재시도 간격)"""
+        wait = DATA_RETRY_SEC if self.last_error else max(DATA_TTL_SEC - DATA_PREWARM_SEC, 0)
+        return self.checked_at + wait
+    def _try_refresh(self) -> bool:
+        """잠금을 못 잡으면(이미 갱신 중) 바로 False"""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            self._refresh_locked()
+        except Exception:
+            pass
+        finally:
+            self._refresh_lock.release()
+        return True
+    def revalidate_async(self) -> None:
+        if self.refreshing:
+            return  # 이미 갱신 중
+        threading.Thread(target=self._try_refresh, name="gsheet-revalidate", daemon=True).start()
+    @staticmethod
+    def _prewarm_loop(ref: "weakref.ReferenceType[PreparedDataStore]", stop: threading.Event) -> None:
+        """store 는 약한 참조로만 잡는다 — 캐시가 store 를 버리면 워커가 store 를 붙잡아 두지 않고 함께 끝남"""
+        while not stop.is_set():
+            store = ref()
+            if store is None:
+                return
+            # 수동 새로고침 등으로 checked_at 이 바뀌면 다음 바퀴에서 예정 시각을 다시 계산
+            delay = max(store.next_prewarm_at() - time.time(), 1.0)
+            del store
+            if stop.wait(delay):
+                return
+            store = ref()
+            if store is None:
+                return
+            # 첫 로딩은 요청 스레드(spinner)가 담당
+            if store.current is not None and time.time() >= store.next_prewarm_at():
+                store._try_refresh()
+            del store
+    def start_prewarm(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._worker = threading.Thread(
+            target=PreparedDataStore._prewarm_loop, args=(weakref.ref(self), self._stop), name="gsheet-prewarm", daemon=True
+        )
+        self._worker.start()
+        # cache_resource 에서 밀려나 store 가 회수되면 대기 중인 워커를 바로 깨워 종료
+        weakref.finalize(self, self._stop.set)
+@st.cache_resource(show_spinner=False)
+def get_prepared_store() -> PreparedDataStore:
+    store = PreparedDataStore()
+    # 스냅샷이 오래됐으면 예열 워커가 곧바로 갱신(다른 레플리카가 막 만든 것이면 그대로 사용)
+    store.start_prewarm()
+    return store
+# =========================
+# 사이드바 필터 역색인
+# =========================
+FILTER_INDEX_COLS = [COL_CUST1, COL_CUST2, "_month_label", COL_BP, "_week_label"]
+FILTER_OPTIONS_CACHE_SIZE = 512  # (열, 상위 선택 조합)별 선택지 목록 LRU 크기
+_NO_ROWS = np.empty(0, dtype=np.int64)
+def _intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """정렬된 위치 배열 교집합 — 짧은 쪽(a)을 긴 쪽(b)에서 이분 탐색"""
+    if len(a) == 0 or len(b) == 0:
+        return _NO_ROWS
+    idx = np.searchsorted(b, a)
+    hit = idx < len(b)
+    hit[hit] = b[idx[hit]] == a[hit]
+    return a[hit]
+class FilterIndex:
+    """데이터 버전별 1회 구축: 필터 컬럼 값 → 정렬된 행 위치 배열.
+    필터 = 선택값 위치 배열의 교집합 + take 한 번, 하위 선택지 = 교집합 위치의 코드 집계
+    """
+    def __init__(self, df: pd.DataFrame, version: str = ""):
+        self.version = version
+        self.n = len(df)
+        self._options: OrderedDict[tuple, list[str]] = OrderedDict()
+        self._options_lock = threading.Lock()  # 세션 스레드들이 같은 인덱스를 공유
+        self._codes: dict[str, np.ndarray] = {}
+        self._cats: dict[str, list[str]] = {}
+        self._postings: dict[str, dict[str, np.ndarray]] = {}
+        for col in FILTER_INDEX_COLS:
+            if col not in df.columns:
+                continue
+            s = df[col]
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.astype("category")
+            codes = s.cat.codes.to_numpy()
+            cats = [str(c) for c in s.cat.categories]
+            order = np.argsort(codes, kind="stable").astype(np.int64)  # 코드별 구간 안에서 위치 오름차순
+            bounds = np.cumsum(np.bincount(codes + 1, minlength=len(cats) + 1))  # 0번 칸 = 결측(-1)
+            self._codes[col] = codes
+            self._cats[col] = cats
+            self._postings[col] = {c: order[bounds[i]:bounds[i + 1]] for i, c in enumerate(cats)}
+        self._month_order: dict[str, int] = {}
+        if "_month_label" in df.columns and "_month_key_num" in df.columns:
+            keys = df.groupby("_month_label", observed=True)["_month_key_num"].first().dropna()
+            self._month_order = {str(lbl): int(k) for lbl, k in keys.items()}
+    def positions(self, selections: dict[str, str]) -> Optional[np.ndarray]:
+        """'전체' 가 아닌 선택값들의 위치 교집합 — 제한이 없으면 None(전체 행)"""
+        lists = [
+            self._postings[col].get(str(val), _NO_ROWS)
+            for col, val in selections.items()
+            if val != "전체" and col in self._postings
+        ]
+        if not lists:
+            return None
+        lists.sort(key=len)
+        out = lists[0]
+        for p in lists[1:]:
+            out = _intersect_sorted(out, p)
+        return out
+    def options(self, col: str, prefix: dict[str, str]) -> list[str]:
+        """상위 선택(prefix) 아래에서 col 선택지 — 조합별 1회 계산 후 LRU 로 재사용"""
+        key = (col,) + tuple((c, str(v)) for c, v in prefix.items() if v != "전체")
+        with self._options_lock:
+            hit = self._options.get(key)
+            if hit is not None:
+                self._options.move_to_end(key)
+                return hit
+        vals = self.values(col, self.positions(prefix))
+        with self._options_lock:
+            self._options[key] = vals
+            while len(self._options) > FILTER_OPTIONS_CACHE_SIZE:
+                self._options.popitem(last=False)
+        return vals
+    def values(self, col: str, positions: Optional[np.ndarray]) -> list[str]:
+        """positions 행에 실제로 등장하는 col 값 (정렬)"""
+        if col not in self._codes:
+            return []
+        codes = self._codes[col] if positions is None else self._codes[col][positions]
+        present = np.flatnonzero(np.bincount(codes[codes >= 0], minlength=len(self._cats[col])))
+        vals = [self._cats[col][i] for i in present]
+        if col == "_month_label":
+            return sorted((v for v in vals if v in self._month_order), key=self._month_order.__getitem__)
+        return sorted(vals)
+class FilteredView:
+    """필터 선택값만 기록해 두는 지연 뷰 — 메뉴가 select(열 목록) 할 때 그 열만 위치 take 로 물리화"""
+    def __init__(self, base: pd.DataFrame, index: FilterIndex, selections: dict[str, str]):
+        self.base = base
+        self.index = index
+        self.selections = dict(selections)
+        self._positions: Optional[np.ndarray] = None
+        self._resolved = False
+    def without(self, col: str) -> "FilteredView":
+        """col 필터만 해제한 뷰 (예: 월 필터 제외)"""
+        return FilteredView(self.base, self.index, {**self.selections, col: "전체"})
+    def where(self, col: str, value: str) -> "FilteredView":
+        """col 을 value 로 고정한 뷰 (예: 선택 주차/월만)"""
+        return FilteredView(self.base, self.index, {**self.selections, col: value})
+    @property
+    def positions(self) -> Optional[np.ndarray]:
+        if not self._resolved:
+            self._positions = self.index.positions(self.selections)
+            self._resolved = True
+        return self._positions
+    @property
+    def cache_key(self) -> tuple:
+        """(데이터 버전, 정규화된 필터 선택) — 결과 캐시 키의 공통 부분"""
+        return (self.index.version,) + tuple(
+            (c, str(v)) for c, v in sorted(self.selections.items()) if v != "전체"
+        )
+    @property
+    def columns(self) -> pd.Index:
+        return self.base.columns
+    def __len__(self) -> int:
+        pos = self.positions
+        return len(self.base) if pos is None else len(pos)
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+    def select(self, cols: list[str]) -> pd.DataFrame:
+        """투영 열(없는 열은 건너뜀)만 담은 새 DataFrame"""
+        cols = [c for c in dict.fromkeys(cols) if c in self.base.columns]
+        pos = self.positions
+        out = self.base[cols] if pos is None else self.base.iloc[pos, self.base.columns.get_indexer(cols)]
+        # 두 경우 모두 이미 새 버퍼 — 얕은 복사로 slice 표식만 떼어 메뉴에서 바로 열을 고칠 수 있게
+        return out.copy(deep=False)
+# 메뉴별 투영 열 — 각 메뉴가 실제로 읽는 열만 물리화
+VIEW_COLS_KPI = [COL_QTY, COL_DONE, COL_CUST1, COL_LT2, COL_BP]
+VIEW_COLS_SKU = [
+    COL_ITEM_CODE, COL_ITEM_NAME, COL_QTY, COL_ORDER_NO, COL_BP, COL_CUST1, COL_SHIP,
+    "_ship_day", "_ship_ym", "_month_label", "_month_key_num",
+]
+# ③/④: 직전기간 비교 코멘트(주문번호/리드타임)와 월간 리포트(거래처구분2)까지
+VIEW_COLS_PERIOD = [
+    "_week_label", "_week_key_num", "_month_label", "_month_key_num", "_ship_ym",
+    COL_CUST1, COL_CUST2, COL_QTY, COL_LT2, COL_ORDER_NO, COL_ITEM_CODE, COL_ITEM_NAME, COL_BP, COL_SHIP,
+] + CATEGORY_COL_CANDIDATES
+# ④ 월간 리포트 / ⑦ Top SKU: 월 필터를 뺀 전체 기간 품목 단위 롤업(출고월/월 × 거래처구분 × BP × 품목 요청수량 합)
+VIEW_COLS_ROLLUP = [
+    "_ship_day", "_ship_ym", "_month_label", "_month_key_num", COL_CUST1, COL_CUST2, COL_BP, COL_ITEM_CODE, COL_ITEM_NAME, COL_QTY,
+]
+def slice_for_view(agg: pd.DataFrame, view: "FilteredView") -> pd.DataFrame:
+    """뷰와 같은 필터를 사전 집계(출고 큐브/주문/리드타임 셀 테이블)에 적용 (원본은 공용·쓰기 금지 — 필터 결과는 새 프레임)"""
+    mask = None
+    for col, val in view.selections.items():
+        if val == "전체" or col not in agg.columns:
+            continue
+        m = (agg[col] == val).to_numpy()
+        mask = m if mask is None else (mask & m)
+    return agg.copy(deep=False) if mask is None else agg[mask]
+# =========================
+# 출고 큐브 (③/④/⑦ 주·월 롤업용 사전 집계)
+# =========================
+# 주차 × 월 × 출고월 × 거래처구분1/2 × BP 단위 수량 합. 품목은 키에서 뺀다 — 품목까지 넣으면 그룹 수가 RAW 행 수와
+# 거의 같아 압축이 안 된다. 품목이 필요한 Top SKU·월간 리포트는 뷰의 행(VIEW_COLS_ROLLUP)을 그대로 쓴다.
+SHIPMENT_CUBE_KEYS = ["_week_label", "_week_key_num", "_month_label", "_month_key_num", "_ship_ym", COL_CUST1, COL_CUST2, COL_BP]
+def build_shipment_cube(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """RAW → 큐브. 요청수량은 sum(min_count=1) 부분합이라 다시 sum / sum(min_count=1) 해도 RAW 와 같은 값"""
+    keys = [c for c in SHIPMENT_CUBE_KEYS if c in raw_df.columns]
+    return raw_df.groupby(keys, dropna=False, observed=True)[COL_QTY].sum(min_count=1).reset_index()
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_shipment_cube(version: str, _raw: pd.DataFrame) -> pd.DataFrame:
+    return freeze_frame(build_shipment_cube(_raw))
+# =========================
+# 주문 단위 사실 테이블 (출고건수용)
+# - 결(grain) = (주문번호, 뷰에서 값이 고정된 필터 차원, 요약 축) → 그 필터를 적용하면 요약 축 그룹마다 주문이 한 행씩만
+#   남으므로 출고건수 = 행 수(.size()). 결마다 데이터 버전당 1회 구축
+# =========================
+ORDER_FACT_DIMS = [COL_CUST1, COL_CUST2, COL_BP, "_month_label", "_week_label"]
+def build_order_facts(raw_df: pd.DataFrame, dims: tuple[str, ...]) -> pd.DataFrame:
+    """RAW(라인) → (주문번호, dims) 마다 한 행 + 라인 수 (빈값/결측 토큰 주문번호 제외)"""
+    keys = [COL_ORDER_NO] + [c for c in dims if c in raw_df.columns]
+    if COL_ORDER_NO not in raw_df.columns:
+        return pd.DataFrame(columns=keys + ["_lines"])
+    src = raw_df.loc[_clean_keys(raw_df[COL_ORDER_NO]).notna().to_numpy(), keys]
+    return src.groupby(keys, dropna=False, observed=True).size().rename("_lines").reset_index()
+def order_fact_dims(view: "FilteredView", by: Optional[str] = None) -> tuple[str, ...]:
+    """뷰에 맞는 사실 테이블 결 — 값이 고정된 필터 차원 + 요약 축(by)"""
+    return tuple(c for c in ORDER_FACT_DIMS if c == by or view.selections.get(c, "전체") != "전체")
+def order_count(orders: pd.DataFrame) -> int:
+    """뷰 결의 주문 테이블(필터 후) → 출고건수 (주문 단위 결이라 행 수)"""
+    return 0 if orders is None else len(orders)
+@st.cache_resource(show_spinner=False, max_entries=16)
+def get_order_facts(version: str, dims: tuple[str, ...], _raw: pd.DataFrame) -> pd.DataFrame:
+    return freeze_frame(build_order_facts(_raw, dims))
+def view_orders(version: str, raw: pd.DataFrame, view: "FilteredView", by: Optional[str] = None) -> pd.DataFrame:
+    """뷰 필터를 적용한 (주문번호[, by]) 단위 주문 테이블"""
+    return slice_for_view(get_order_facts(version, order_fact_dims(view, by), raw), view)
+# =========================
+# 리드타임 분포 스케치 (⑤/⑥ 평균·분위수용)
+# - 셀 = (거래처구분1, 거래처구분2, BP, 월, 주차) 마다 합/개수 + 희소 (리드타임 값, 행 수) 쌍 → 쌍을 모으기만 하면 병합
+# - 쌍은 셀 안의 고유 리드타임 값만 저장하므로 크기 ≤ 리드타임이 있는 행 수 (일 단위면 셀당 수십 개)
+# - 정확도: 값을 구간으로 묶지 않으므로 평균/분위수는 원본 행에서 pandas 로 구한 값과 같다
+# =========================
+LT_SKETCH_DIMS = [COL_CUST1, COL_CUST2, COL_BP, "_month_label", "_week_label"]
+LT_COL_MEAN = "평균_리드타임_작업완료기준"
+LT_QUANTILE_COLS = {
+    0.5: "리드타임_중간값_작업완료기준",
+    0.75: "리드타임 P75",
+    0.9: "리드타임 느린 상위10% 기준(P90)",
+    0.95: "리드타임 느린 상위5% 기준(P95)",
+}
+class LeadTimeSketch(NamedTuple):
+    cells: pd.DataFrame   # 셀 차원 + 요청수량/_rows/_lt_n/_lt_sum/최근 출고·작업완료일, _cell = 셀 번호
+    cell: np.ndarray      # (셀, 리드타임 값) 쌍의 셀 번호 (셀 → 값 오름차순)
+    value: np.ndarray     # 쌍의 리드타임 값
+    count: np.ndarray     # 쌍의 행 수
+def build_lead_time_sketch(raw_df: pd.DataFrame) -> LeadTimeSketch:
+    keys = [c for c in LT_SKETCH_DIMS if c in raw_df.columns]
+    g = raw_df.groupby(keys, dropna=False, observed=True)
+    cells = g[COL_QTY].sum().to_frame(COL_QTY)
+    cells["_rows"] = g.size()
+    for c in (COL_SHIP, COL_DONE):
+        if c in raw_df.columns:
+            cells[c] = g[c].max()
+    cells = cells.reset_index()
+    n_cells = len(cells)
+    cells["_cell"] = np.arange(n_cells)
+    cell = g.ngroup().to_numpy()  # agg 결과와 같은 (정렬된 키) 순서
+    lt = raw_df[COL_LT2].to_numpy(dtype="float64", na_value=np.nan) if COL_LT2 in raw_df.columns else np.full(len(raw_df), np.nan)
+    ok = ~np.isnan(lt)
+    lt, cell = lt[ok], cell[ok]
+    cells["_lt_n"] = np.bincount(cell, minlength=n_cells)
+    cells["_lt_sum"] = np.bincount(cell, weights=lt, minlength=n_cells)
+    pairs = pd.DataFrame({"cell": cell, "value": lt}).value_counts(sort=False).sort_index()
+    return LeadTimeSketch(
+        cells,
+        pairs.index.get_level_values("cell").to_numpy(dtype=np.int32),
+        pairs.index.get_level_values("value").to_numpy(dtype=np.float64),
+        pairs.to_numpy(dtype=np.int32),
+    )
+def _weighted_quantiles(group: np.ndarray, value: np.ndarray, count: np.ndarray, n_groups: int, q: float) -> np.ndarray:
+    """(그룹, 값) 순으로 정렬된 (값, 행 수) 쌍 → 그룹별 q 분위수 (numpy/pandas 기본 linear 보간과 같은 식, 빈 그룹은 NaN)"""
+    n = np.bincount(group, weights=count, minlength=n_groups).astype(np.int64)
+    start = np.cumsum(n) - n  # 그룹 앞까지의 행 수
+    cum = np.cumsum(count)
+    h = n * q + (1 - q) - 1  # 0-based 순위 (n-1)·q
+    lo = np.clip(np.floor(h), 0, None).astype(np.int64)
+    hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+    t = h - np.floor(h)
+    res = np.full(n_groups, np.nan)
+    ok = n > 0
+    if ok.any():
+        # 전체 순위 r 인 행의 값 = 누적 행 수가 r 을 처음 넘는 쌍의 값
+        a = value[np.searchsorted(cum, start[ok] + lo[ok], side="right")]
+        b = value[np.searchsorted(cum, start[ok] + hi[ok], side="right")]
+        diff, t = b - a, t[ok]
+        res[ok] = np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+    return res
+def summarize_lead_time(sketch: LeadTimeSketch, view: "FilteredView", by: str) -> pd.DataFrame:
+    """필터에 걸린 셀만 by 별로 병합 → 요청수량 합/행 수/리드타임 평균·분위수/최근 출고·작업완료일 (원본 행 미사용)"""
+    cells = slice_for_view(sketch.cells, view)
+    g = cells.groupby(by, dropna=False, observed=True)
+    aggs = {"요청수량_합": (COL_QTY, "sum"), "집계행수_표본": ("_rows", "sum"), "_lt_n": ("_lt_n", "sum"), "_lt_sum": ("_lt_sum", "sum")}
+    for c, name in ((COL_SHIP, "최근_출고일"), (COL_DONE, "최근_작업완료일")):
+        if c in cells.columns:
+            aggs[name] = (c, "max")
+    out = g.agg(**aggs)
+    # 셀 → 결과 그룹 번호(필터 밖 셀은 -1)로 쌍을 골라 (그룹, 값) 순 정렬
+    group_of_cell = np.full(len(sketch.cells), -1, dtype=np.int64)
+    group_of_cell[cells["_cell"].to_numpy()] = g.ngroup().to_numpy()
+    group = group_of_cell[sketch.cell]
+    sel = group >= 0
+    group, value, count = group[sel], sketch.value[sel], sketch.count[sel]
+    order = np.lexsort((value, group))
+    group, value, count = group[order], value[order], count[order]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[LT_COL_MEAN] = np.where(out["_lt_n"] > 0, out["_lt_sum"] / out["_lt_n"], np.nan)
+    for q, col in LT_QUANTILE_COLS.items():
+        out[col] = _weighted_quantiles(group, value, count, len(out), q)
+    return out.drop(columns=["_lt_n", "_lt_sum"]).reset_index()
+# =========================
+# 해외B2B SKU × 일 출고 누적합 (⑧ 최근 N일 합계/일평균용)
+# =========================
+class DailyShipMatrix:
+    """데이터 버전별 1회 구축: 품목코드 × 출고일(일 키) 출고량의 일 방향 누적합.
+    임의 구간 [start, end] 의 SKU 별 합계 = cum[:, end+1] - cum[:, start] → SKU 수만큼의 벡터 연산
+    - cust1: 대상 거래처구분1 (기본 해외B2B, None 이면 재고를 함께 쓰는 전 채널)
+    """
+    def __init__(self, df: pd.DataFrame, cust1: Optional[str] = LT_ONLY_CUST1):
+        overseas = _filter_cust1(df, cust1) if cust1 is not None else df
+        if overseas is None or overseas.empty or not all(c in overseas.columns for c in [COL_ITEM_CODE, "_ship_day", COL_QTY]):
+            self.skus = pd.Index([], dtype=object)
+            self.first_day = 0
+            self.cum = np.zeros((0, 1))
+            return
+        day = overseas["_ship_day"].to_numpy(dtype="float64", na_value=np.nan)
+        code = overseas[COL_ITEM_CODE]
+        ok = ~np.isnan(day) & code.notna().to_numpy()
+        sku_idx, skus = pd.factorize(code[ok].astype(str), sort=True)
+        day = day[ok].astype(np.int64)
+        qty = overseas[COL_QTY].to_numpy(dtype="float64", na_value=np.nan)[ok]
+        self.skus = pd.Index(skus)
+        self.first_day = int(day.min()) if len(day) else 0
+        n_days = int(day.max()) - self.first_day + 1 if len(day) else 0
+        grid = np.bincount(
+            sku_idx * n_days + (day - self.first_day), weights=np.nan_to_num(qty), minlength=len(skus) * n_days
+        ).reshape(len(skus), n_days)
+        self.cum = np.zeros((len(skus), n_days + 1))
+        np.cumsum(grid, axis=1, out=self.cum[:, 1:])
+    @property
+    def last_day(self) -> int:
+        return self.first_day + self.cum.shape[1] - 2
+    def window_totals(self, start_days, end_days) -> np.ndarray:
+        """구간 여러 개 [start_days[i], end_days[i]] (일 키, 양끝 포함) 의 SKU 별 합계를 한 번에 → (SKU, 구간 수)"""
+        n_days = self.cum.shape[1] - 1
+        lo = np.clip(np.asarray(start_days, dtype=np.int64) - self.first_day, 0, n_days)
+        hi = np.clip(np.asarray(end_days, dtype=np.int64) - self.first_day + 1, 0, n_days)
+        return self.cum[:, np.maximum(hi, lo)] - self.cum[:, lo]
+    def totals_since(self, start_days) -> np.ndarray:
+        """여러 시작일(일 키 배열)부터 데이터 끝까지의 합계 → (SKU, 시작일 수)"""
+        start_days = np.asarray(start_days, dtype=np.int64)
+        return self.window_totals(start_days, np.full(len(start_days), self.last_day))
+# =========================
+# 해외B2B SKU 수요 예측 (감쇠 추세 지수평활 — 전 SKU 를 배열 하나로)
+# - B2B 일 출고는 들쭉날쭉해 7일 단위 합계 시계열에 맞춘다 (요일 편차도 주 합계에 흡수)
+# - SKU 마다 (alpha, beta) 격자 중 1-step 예측 오차 제곱합이 가장 작은 조합을 고른다 — 격자 × SKU 를 한 번에 갱신
+# =========================
+FORECAST_HISTORY_WEEKS = 52
+FORECAST_WARMUP_WEEKS = 8     # 초기 level = 첫 8주 평균, 오차는 그 이후만 집계
+FORECAST_ALPHAS = (0.1, 0.2, 0.3, 0.5)
+FORECAST_BETAS = (0.0, 0.1, 0.3)
+FORECAST_PHI = 0.9            # 추세 감쇠 — 먼 미래로 갈수록 추세 기여가 줄어든다 (최대 9주치)
+FORECAST_HORIZON_WEEKS = 53   # 1년 + 여유
+class DemandForecast(NamedTuple):
+    skus: pd.Index
+    weekly: np.ndarray  # (SKU, 예측 주 수) 기준일 다음 날부터 7일 단위 예측 출고량
+    def rows(self, codes) -> np.ndarray:
+        """품목코드 순서대로 주별 예측 (예측 대상이 아닌 품목은 0)"""
+        idx = self.skus.get_indexer(pd.Index(codes).astype(str))
+        out = np.zeros((len(idx), self.weekly.shape[1]))
+        out[idx >= 0] = self.weekly[idx[idx >= 0]]
+        return out
+def forecast_cumulative(weekly: np.ndarray, days: int) -> np.ndarray:
+    """주별 예측 → 향후 days 일 누적 예측 (마지막 주는 일 단위로 안분)"""
+    w, r = divmod(int(days), 7)
+    cum = np.cumsum(weekly[:, :w], axis=1)[:, -1] if w else np.zeros(len(weekly))
+    return cum + (weekly[:, w] * r / 7 if w < weekly.shape[1] else 0.0)
+def forecast_depletion_days(weekly: np.ndarray, stock: np.ndarray) -> np.ndarray:
+    """재고가 예측 수요로 바닥나는 일수 (주 안에서는 일 단위 선형, 예측 범위 밖은 마지막 주 속도로 연장, 수요 0 이면 inf)"""
+    n, h = weekly.shape
+    cum = np.zeros((n, h + 1))
+    np.cumsum(weekly, axis=1, out=cum[:, 1:])
+    k = (cum[:, 1:] < stock[:, None]).sum(axis=1)  # 재고가 남은 채로 지나가는 주 수
+    rows = np.arange(n)
+    rate = weekly[rows, np.minimum(k, h - 1)] / 7
+    left = stock - cum[rows, k]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(rate > 0, 7 * k + left / rate, np.inf)
+def forecast_demand(matrix: "DailyShipMatrix", end_day: int) -> DemandForecast:
+    """end_day(일 키, 포함) 까지의 주별 출고로 전 SKU 감쇠 추세 모델을 맞추고 FORECAST_HORIZON_WEEKS 주를 예측"""
+    ends = end_day - 7 * np.arange(FORECAST_HISTORY_WEEKS - 1, -1, -1)
+    y = matrix.window_totals(ends - 6, ends)  # (SKU, 주) 오래된 주 → 최근 주
+    alpha = np.repeat(FORECAST_ALPHAS, len(FORECAST_BETAS))[:, None]
+    beta = np.tile(FORECAST_BETAS, len(FORECAST_ALPHAS))[:, None]
+    phi = FORECAST_PHI
+    level = np.repeat(y[:, :FORECAST_WARMUP_WEEKS].mean(axis=1)[None, :], len(alpha), axis=0)
+    trend = np.zeros_like(level)
+    sse = np.zeros_like(level)
+    for t in range(FORECAST_WARMUP_WEEKS, y.shape[1]):
+        f = level + phi * trend
+        err = y[:, t] - f
+        sse += err * err
+        level = f + alpha * err
+        trend = phi * trend + alpha * beta * err
+    best = sse.argmin(axis=0)
+    cols = np.arange(y.shape[0])
+    damp = np.cumsum(phi ** np.arange(1, FORECAST_HORIZON_WEEKS + 1))
+    weekly = level[best, cols][:, None] + trend[best, cols][:, None] * damp[None, :]
+    return DemandForecast(matrix.skus, np.maximum(weekly, 0.0))
+def backtest_demand_forecast(
+    matrix: "DailyShipMatrix",
+    end_day: int,
+    origins: int = 8,
+    horizon_days: int = 28,
+    lookback_days: int = 90,
+) -> pd.DataFrame:
+    """최근 origins 개 기준일마다 '그날까지 데이터로 다음 horizon_days 일 출고 예측' → 실제와 비교.
+    - 대상: 기준일 전 lookback_days 일 안에 출고가 있는 SKU / 그중 증가 품목(직전 28일이 그 전 28일의 1.3배 이상)
+    - WAPE = Σ|예측-실제| / Σ실제, 편향 = Σ(예측-실제) / Σ실제, 실행시간 = 기준일 1회당 전 SKU 예측 시간
+    """
+    def window(lo, hi):
+        return matrix.window_totals([lo], [hi])[:, 0]
+    segs = ("전체", "증가 품목")
+    acc = {(m, s): np.zeros(3) for m in ("수요 예측(추세)", f"최근 {lookback_days}일 평균") for s in segs}
+    secs = {m: 0.0 for m, _ in acc}
+    for i in range(origins, 0, -1):
+        o = end_day - horizon_days * i
+        actual = window(o + 1, o + horizon_days)
+        recent, prior = window(o - 27, o), window(o - 55, o - 28)
+        active = window(o - lookback_days + 1, o) > 0
+        masks = {"전체": active, "증가 품목": active & (recent >= 1.3 * prior)}
+        t0 = time.perf_counter()
+        avg_pred = window(o - lookback_days + 1, o) / lookback_days * horizon_days
+        secs[f"최근 {lookback_days}일 평균"] += time.perf_counter() - t0
+        t0 = time.perf_counter()
+        fc_pred = forecast_cumulative(forecast_demand(matrix, o).weekly, horizon_days)
+        secs["수요 예측(추세)"] += time.perf_counter() - t0
+        for (m, s), a in acc.items():
+            pred = fc_pred if m == "수요 예측(추세)" else avg_pred
+            mk = masks[s]
+            a += [np.abs(pred[mk] - actual[mk]).sum(), (pred[mk] - actual[mk]).sum(), actual[mk].sum()]
+    rows = []
+    for (m, s), (abs_err, err, tot) in acc.items():
+        rows.append({
+            "방법": m, "대상": s,
+            "WAPE(%)": round(abs_err / tot * 100, 1) if tot > 0 else np.nan,
+            "편향(%)": round(err / tot * 100, 1) if tot > 0 else np.nan,
+            "실행시간(ms/회)": round(secs[m] / max(origins, 1) * 1000, 1),
+        })
+    return pd.DataFrame(rows).sort_values(["대상", "방법"], kind="stable").reset_index(drop=True)
+# =========================
+# 전 품목 재고 추이 예측 (향후 180일, 품목 × 일 배열)
+# - 재고(d) = 현재고 - 누적 예측 수요(전 채널, forecast_demand) + 누적 입고(1차·2차·… 입고일/수량)
+# - 수요는 재고를 함께 쓰는 전 채널(해외·국내B2B) 출고로 예측 — ⑧ 알람(해외B2B 증가 품목)과 달리 채널을 가리지 않는다
+# - 오늘 입고분은 아직 현재고에 없다고 보고 첫날 마감 재고에 더한다. 오늘 이전 입고일은 현재고에 반영된 것으로 보고 제외,
+#   품절 후에는 미충족 수요가 음수로 누적된다
+# =========================
+STOCK_PROJECTION_DAYS = 180
+class StockProjection(NamedTuple):
+    summary: pd.DataFrame  # 품목별 첫품절일/재고커버일수/부족수량 (행 순서 = level 행)
+    level: np.ndarray      # (품목, 일) start 부터 하루씩 마감 예상 재고
+    start: date
+def project_stock(inv_df: pd.DataFrame, forecast: DemandForecast, today: date, days: int = STOCK_PROJECTION_DAYS) -> StockProjection:
+    """재고 탭 전 품목의 일별 예상 재고 → 첫품절일, 재고커버일수(품절 전까지 버티는 일수, 없으면 inf), 부족수량(기간 중 최대 미충족)"""
+    start = today + timedelta(days=1)
+    n = len(inv_df)
+    weekly = forecast.rows(inv_df["품목코드"])
+    demand = np.repeat(weekly[:, : -(-days // 7)] / 7, 7, axis=1)[:, :days]
+    receipts = np.zeros((n, days))
+    for date_col, qty_col in inventory_receipt_cols(inv_df):
+        when = inv_df[date_col].to_numpy(dtype="datetime64[D]")
+        qty = pd.to_numeric(inv_df[qty_col], errors="coerce").fillna(0).to_numpy(dtype="float64")
+        off = (when - np.datetime64(today, "D")).astype(np.int64)
+        ok = ~np.isnat(when) & (off >= 0) & (off <= days) & (qty > 0)
+        # 오늘(off 0)·내일(off 1) 입고 → 첫날(start) 열
+        np.add.at(receipts, (np.flatnonzero(ok), np.maximum(off[ok] - 1, 0)), qty[ok])
+    stock = pd.to_numeric(inv_df["현재고"], errors="coerce").fillna(0).to_numpy(dtype="float64")
+    level = stock[:, None] + np.cumsum(receipts - demand, axis=1)
+    short = level < -1e-9
+    has_short = short.any(axis=1)
+    first = short.argmax(axis=1)
+    summary = pd.DataFrame({
+        COL_ITEM_CODE: inv_df["품목코드"].to_numpy(),
+        COL_ITEM_NAME: inv_df["품목이름"].to_numpy(),
+        "현재고": stock,
+        "예측일평균출고": np.round(demand.mean(axis=1), 1) if days else 0.0,
+        "입고예정수량": receipts.sum(axis=1),
+        "첫품절일": pd.to_datetime(np.where(has_short, np.datetime64(start, "D") + first, np.datetime64("NaT"))),
+        "재고커버일수": np.where(has_short, first, np.inf),
+        "부족수량": np.round(np.maximum(-level.min(axis=1), 0), 0) if days else 0.0,
+    })
+    return StockProjection(summary, level, start)
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_daily_ship_matrix(version: str, _raw: pd.DataFrame, cust1: Optional[str] = LT_ONLY_CUST1) -> DailyShipMatrix:
+    m = DailyShipMatrix(_raw, cust1)
+    m.cum.flags.writeable = False
+    return m
+@st.cache_resource(show_spinner=False, max_entries=4)
+def get_demand_forecast(
+    version: str, today_iso: str, _raw: pd.DataFrame, cust1: Optional[str] = LT_ONLY_CUST1
+) -> DemandForecast:
+    fc = forecast_demand(get_daily_ship_matrix(version, _raw, cust1), day_key(date.fromisoformat(today_iso)))
+    fc.weekly.flags.writeable = False
+    return fc
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_forecast_backtest(version: str, today_iso: str, _raw: pd.DataFrame) -> pd.DataFrame:
+    matrix = get_daily_ship_matrix(version, _raw)
+    return backtest_demand_forecast(matrix, min(day_key(date.fromisoformat(today_iso)), matrix.last_day))
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_stock_projection(
+    version: str, inv_version: str, today_iso: str, _raw: pd.DataFrame, _inv: pd.DataFrame
+) -> StockProjection:
+    today = date.fromisoformat(today_iso)
+    proj = project_stock(_inv, get_demand_forecast(version, today_iso, _raw, cust1=None), today)
+    proj.level.flags.writeable = False
+    return proj._replace(summary=freeze_frame(proj.summary))
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_shortage_scenarios(
+    version: str, inv_version: str, today_iso: str, _raw: pd.DataFrame, _inv: pd.DataFrame
+) -> ShortageScenarios:
+    """⑧ 슬라이더 전 조합 — SAP·재고 탭 버전 + 날짜(현재월/소진예상일 기준) 별 1회"""
+    return ShortageScenarios(
+        _raw, _inv, get_daily_ship_matrix(version, _raw),
+        today=date.fromisoformat(today_iso), forecast=get_demand_forecast(version, today_iso, _raw),
+    )
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_lead_time_sketch(version: str, _raw: pd.DataFrame) -> LeadTimeSketch:
+    sketch = build_lead_time_sketch(_raw)
+    for arr in (sketch.cell, sketch.value, sketch.count):
+        arr.flags.writeable = False
+    return sketch._replace(cells=freeze_frame(sketch.cells))
+# =========================
+# ⑤/⑥ 집계표
+# =========================
+def build_country_summary(view: "FilteredView", orders: pd.DataFrame, sketch: LeadTimeSketch) -> pd.DataFrame:
+    """⑤ 국가별(거래처구분2) 요청수량/리드타임 분포/출고건수 — 리드타임은 스케치 병합, 출고건수는 (주문, 거래처구분2) 결 주문 테이블 행 수"""
+    lt_cols = [LT_COL_MEAN] + list(LT_QUANTILE_COLS.values())
+    out = summarize_lead_time(sketch, view, COL_CUST2)[[COL_CUST2, "요청수량_합"] + lt_cols + ["집계행수_표본"]]
+    rep_cnt = orders.groupby(COL_CUST2, observed=True).size()
+    out["출고건수"] = out[COL_CUST2].astype(str).map(rep_cnt).fillna(0).astype(int)
+    for c in lt_cols:
+        out[c] = pd.to_numeric(out[c], errors="coerce").round(2)
+    out["요청수량_합"] = out["요청수량_합"].fillna(0).round(0).astype("Int64")
+    out["집계행수_표본"] = out["집계행수_표본"].astype("Int64")
+    out = out.sort_values("요청수량_합", ascending=False, na_position="last")
+    return out
+def build_bp_summary(view: "FilteredView", orders: pd.DataFrame, sketch: LeadTimeSketch) -> pd.DataFrame:
+    """⑥ BP명별 요청수량/리드타임 분포/최근 출고·작업완료일/출고건수 — 리드타임은 스케치 병합, 출고건수는 (주문, BP) 결 주문 테이블 행 수"""
+    lt_cols = [LT_COL_MEAN] + list(LT_QUANTILE_COLS.values())
+    out = summarize_lead_time(sketch, view, COL_BP)[
+        [COL_BP, "요청수량_합"] + lt_cols + ["최근_출고일", "최근_작업완료일", "집계행수_표본"]
+    ]
+    rep_cnt2 = orders.groupby(COL_BP, observed=True).size()
+    out["출고건수"] = out[COL_BP].astype(str).map(rep_cnt2).fillna(0).astype(int)
+    out["요청수량_합"] = out["요청수량_합"].fillna(0).round(0).astype("Int64")
+    for c in lt_cols:
+        out[c] = pd.to_numeric(out[c], errors="coerce").round(2)
+    out["최근_출고일"] = out["최근_출고일"].apply(fmt_date)
+    out["최근_작업완료일"] = out["최근_작업완료일"].apply(fmt_date)
+    out["집계행수_표본"] = out["집계행수_표본"].astype("Int64")
+    out = out.sort_values("요청수량_합", ascending=False, na_position="last")
+    return out
+# =========================
+# 집계 결과 캐시 (데이터 버전 + 필터 + 메뉴 파라미터 키, 메모리 상한 LRU)
+# =========================
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+def _result_nbytes(value) -> int:
+    """캐시 항목 크기 추정 — DataFrame/Series 는 deep 메모리, 컨테이너는 재귀 합"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_result_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_result_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+class ResultCache:
+    """세션 공용 집계 결과 캐시. 값은 읽기 전용으로 다룬다(호출부에서 고치지 않음)."""
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[tuple, tuple[object, int]] = OrderedDict()
+        self._lock = threading.Lock()
+    def get_or_compute(self, key: tuple, compute):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+        value = compute()
+        size = _result_nbytes(value)
+        if size > self.max_bytes:
+            return value  # 상한보다 큰 결과는 보관하지 않음
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._items[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.nbytes -= evicted
+        return value
+    def stats_text(self) -> str:
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return (
+            f"집계 캐시: 적중 {self.hits:,} · 미스 {self.misses:,} ({rate:.0f}%)"
+            f" · {len(self._items):,}개 {self.nbytes / 2**20:.1f}MB"
         )
-        cal_agg["qty_sum"] = pd.to_numeric(cal_agg["qty_sum"], errors="coerce").fillna(0).round(0).astype("Int64")
-    return df, cal_agg
+@st.cache_resource(show_spinner=False)
+def get_result_cache() -> ResultCache:
+    return ResultCache()
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_filter_index(version: str, _raw: pd.DataFrame) -> FilterIndex:
+    return FilterIndex(_raw, version)
 # =========================
 # KPI
 # =========================
-def compute_kpis(df_view: pd.DataFrame):
-    total_qty = float(pd.to_numeric(df_view[COL_QTY], errors="coerce").fillna(0).sum()) if (df_view is not None and COL_QTY in df_view.columns) else 0.0
-    total_cnt = _clean_nunique(df_view[COL_ORDER_NO]) if (df_view is not None and not df_view.empty and COL_ORDER_NO in df_view.columns) else 0
+def compute_kpis(df_view: pd.DataFrame, orders: Optional[pd.DataFrame] = None, orders_by_bp: Optional[pd.DataFrame] = None):
+    """orders / orders_by_bp: 같은 필터를 적용한 주문 / (주문, BP) 결 주문 테이블 — 있으면 건수 KPI 를 라인 대신 행 수로 센다"""
+    total_qty = float(df_view[COL_QTY].fillna(0).sum()) if (df_view is not None and COL_QTY in df_view.columns) else 0.0
+    if orders is not None:
+        total_cnt = order_count(orders)
+    else:
+        total_cnt = _clean_nunique(df_view[COL_ORDER_NO]) if (df_view is not None and not df_view.empty and COL_ORDER_NO in df_view.columns) else 0
     latest_done = df_view[COL_DONE].max() if (df_view is not None and COL_DONE in df_view.columns) else pd.NaT
     avg_lt2_overseas = None
     if df_view is not None and all(c in df_view.columns for c in [COL_CUST1, COL_LT2]):
         overseas = _filter_cust1(df_view, LT_ONLY_CUST1)
         if not overseas.empty and not overseas[COL_LT2].dropna().empty:
-            avg_lt2_overseas = float(overseas[COL_LT2].dropna().mean())
+            avg_lt2_overseas = float(overseas[COL_LT2].dropna().astype("float64").mean())
     top_bp_qty_name = "-"
     top_bp_qty_val = "-"
     if df_view is not None and (not df_view.empty) and all(c in df_view.columns for c in [COL_BP, COL_QTY]):
-        g = df_view.groupby(COL_BP, dropna=False)[COL_QTY].sum().sort_values(ascending=False)
+        g = df_view.groupby(COL_BP, dropna=False, observed=True)[COL_QTY].sum().sort_values(ascending=False)
         if not g.empty:
             top_bp_qty_name = str(g.index[0])
-            top_bp_qty_val = f"{float(pd.to_numeric(g.iloc[0], errors='coerce') or 0):,.0f}"
+            top_bp_qty_val = f"{float(g.iloc[0] or 0):,.0f}"
     top_bp_cnt_name = "-"
     top_bp_cnt_val = "-"
-    if df_view is not None and (not df_view.empty) and all(c in df_view.columns for c in [COL_BP, COL_ORDER_NO]):
-        tmp = df_view[[COL_BP, COL_ORDER_NO]].copy()
-        tmp["_ord"] = tmp[COL_ORDER_NO].astype(str).str.strip().replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
+    if orders_by_bp is not None:
+        if not orders_by_bp.empty and COL_BP in orders_by_bp.columns:
+            g2 = orders_by_bp.groupby(COL_BP, observed=True).size().sort_values(ascending=False)
+            if not g2.empty:
+                top_bp_cnt_name = str(g2.index[0])
+                top_bp_cnt_val = f"{int(g2.iloc[0]):,}"
+    elif df_view is not None and (not df_view.empty) and all(c in df_view.columns for c in [COL_BP, COL_ORDER_NO]):
+        tmp = df_view[[COL_BP]].assign(_ord=_clean_keys(df_view[COL_ORDER_NO]))
         tmp = tmp.dropna(subset=["_ord"])
         if not tmp.empty:
-            g2 = tmp.groupby(COL_BP)["_ord"].nunique().sort_values(ascending=False)
+            g2 = tmp.groupby(COL_BP, observed=True)["_ord"].nunique().sort_values(ascending=False)
             if not g2.empty:
                 top_bp_cnt_name = str(g2.index[0])
                 top_bp_cnt_val = f"{int(g2.iloc[0]):,}"
@@ -916,28 +2324,31 @@ def add_months(ym: str, delta: int) -> str:
 def build_day_map_from_cal_agg(cal_agg: pd.DataFrame, ym: str) -> dict[date, list[dict]]:
     if cal_agg is None or cal_agg.empty:
         return {}
-    sub = cal_agg[cal_agg["_ship_ym"].astype(str) == str(ym)].copy()
+    # 월 라벨 문자열 대신 일 키 구간으로 (cal_agg 는 출고일 있는 행만)
+    y, m = ym_to_year_month(ym)
+    days = cal_agg["_ship_day"]
+    sub = cal_agg[((days >= day_key(date(y, m, 1))) & (days <= day_key(date(y, m, pycal.monthrange(y, m)[1])))).to_numpy()]
     if sub.empty:
         return {}
     total = (
-        sub.groupby(["_ship_date", COL_BP], dropna=False)["qty_sum"]
+        sub.groupby(["_ship_day", COL_BP], dropna=False, observed=True)["qty_sum"]
         .sum()
         .reset_index()
         .rename(columns={"qty_sum": "qty_total"})
     )
     pick = (
         sub.sort_values("qty_sum", ascending=False)
-        .drop_duplicates(subset=["_ship_date", COL_BP], keep="first")[["_ship_date", COL_BP, COL_CUST1]]
+        .drop_duplicates(subset=["_ship_day", COL_BP], keep="first")[["_ship_day", COL_BP, COL_CUST1]]
         .copy()
     )
-    pick[COL_CUST1] = pick[COL_CUST1].fillna("").astype(str).str.strip()
-    merged = total.merge(pick, on=["_ship_date", COL_BP], how="left")
+    pick[COL_CUST1] = pick[COL_CUST1].astype(object).fillna("").astype(str).str.strip()
+    merged = total.merge(pick, on=["_ship_day", COL_BP], how="left")
     merged["qty_total"] = pd.to_numeric(merged["qty_total"], errors="coerce").fillna(0).round(0).astype("Int64")
-    merged[COL_CUST1] = merged[COL_CUST1].fillna("").astype(str)
+    merged[COL_CUST1] = merged[COL_CUST1].astype(object).fillna("").astype(str)
     out: dict[date, list[dict]] = {}
-    for d, grp in merged.groupby("_ship_date"):
+    for k, grp in merged.groupby("_ship_day", observed=True):
         grp = grp.sort_values("qty_total", ascending=False, na_position="last")
-        out[d] = [
+        out[day_from_key(k)] = [
             {"bp": str(r[COL_BP]).strip(), "qty": int(r["qty_total"]) if pd.notna(r["qty_total"]) else 0, "cust1": str(r[COL_CUST1]).strip()}
             for _, r in grp.iterrows()
         ]
@@ -946,70 +2357,44 @@ def build_day_map_from_cal_agg(cal_agg: pd.DataFrame, ym: str) -> dict[date, lis
 # Weekly summary for calendar (해외B2B)
 # =========================
 def compute_weekly_summary_for_calendar(raw_df: pd.DataFrame, ym: str) -> dict:
-    """해외B2B 주간 평균 리드타임 + 출고수량을 계산하여 {sunday_date: {avg_lt, total_qty, ship_count}} 형태로 반환"""
+    """해외B2B 주간 평균 리드타임 + 출고수량을 계산하여 {sunday_date: {avg_lt, total_qty, ship_count}} 형태로 반환
+    주(일요일 시작)는 날짜 차원의 week_sunday 키로 한 번에 묶는다"""
     if raw_df is None or raw_df.empty:
         return {}
     y, m = ym_to_year_month(ym)
     # 해외B2B만 필터
-    overseas = _filter_cust1(raw_df, LT_ONLY_CUST1).copy()
-    if overseas.empty:
-        return {}
-    # 출고일자 기준 필터
-    if "_ship_date" not in overseas.columns:
+    overseas = _filter_cust1(raw_df, LT_ONLY_CUST1)
+    if overseas.empty or "_ship_day" not in overseas.columns:
         return {}
-    overseas = overseas.dropna(subset=["_ship_date"])
-    if overseas.empty:
-        return {}
-    # 캘린더 주차 구성 (일요일 시작)
-    cal = pycal.Calendar(firstweekday=6)
-    weeks = cal.monthdayscalendar(y, m)
-    result = {}
-    for wk in weeks:
-        # 주의 실제 날짜 범위 계산
-        non_zero = [(pos, day_num) for pos, day_num in enumerate(wk) if day_num > 0]
-        if not non_zero:
-            continue
-        pos0, day0 = non_zero[0]
-        ref_date = date(y, m, day0)
-        sunday = ref_date - timedelta(days=pos0)
-        saturday = sunday + timedelta(days=6)
-        # 해당 주 데이터 필터
-        wk_data = overseas[
-            (overseas["_ship_date"] >= sunday) &
-            (overseas["_ship_date"] <= saturday)
-        ]
-        if wk_data.empty:
-            result[sunday] = {"avg_lt": None, "total_qty": 0, "ship_count": 0}
-            continue
-        # 출고수량 합계
-        total_qty = float(pd.to_numeric(wk_data[COL_QTY], errors="coerce").fillna(0).sum())
-        # 출고 건수 (BP 기준 고유 건수)
-        ship_count = int(wk_data[COL_BP].nunique()) if COL_BP in wk_data.columns else 0
-        # 평균 리드타임 (COL_LT2)
-        avg_lt = None
-        if COL_LT2 in wk_data.columns:
-            lt_vals = pd.to_numeric(wk_data[COL_LT2], errors="coerce").dropna()
-            if not lt_vals.empty:
-                avg_lt = float(lt_vals.mean())
-        result[sunday] = {"avg_lt": avg_lt, "total_qty": total_qty, "ship_count": ship_count}
+    # 캘린더에 보이는 주: 1일이 속한 주의 일요일 ~ 말일이 속한 주의 토요일
+    first = day_key(date(y, m, 1))
+    last = day_key(date(y, m, pycal.monthrange(y, m)[1]))
+    dim = build_date_dim(first - 6, last + 6)
+    sundays = dim.loc[first:last, "week_sunday"].unique()
+    lo, hi = int(sundays.min()), int(sundays.max()) + 6
+    keys = overseas["_ship_day"]
+    wk_data = overseas[((keys >= lo) & (keys <= hi)).fillna(False)]
+    result = {day_from_key(k): {"avg_lt": None, "total_qty": 0, "ship_count": 0} for k in sundays}
+    if wk_data.empty:
+        return result
+    week = dim_lookup(dim, wk_data["_ship_day"], "week_sunday", "Int32")
+    cols = {COL_QTY: wk_data[COL_QTY].fillna(0)}
+    if COL_BP in wk_data.columns:
+        cols[COL_BP] = wk_data[COL_BP]
+    if COL_LT2 in wk_data.columns:
+        cols[COL_LT2] = wk_data[COL_LT2].astype("float64")
+    g = pd.DataFrame(cols).groupby(week.to_numpy(dtype="int64"), observed=True)
+    qty = g[COL_QTY].sum()
+    bp_cnt = g[COL_BP].nunique() if COL_BP in cols else None
+    lt_mean = g[COL_LT2].mean() if COL_LT2 in cols else None
+    for k in qty.index:
+        avg_lt = lt_mean.get(k) if lt_mean is not None else None
+        result[day_from_key(k)] = {
+            "avg_lt": float(avg_lt) if avg_lt is not None and pd.notna(avg_lt) else None,
+            "total_qty": float(qty[k]),
+            "ship_count": int(bp_cnt[k]) if bp_cnt is not None else 0,
+        }
     return result
-def _sunday_to_week_label(sunday: date, cal_year: int = 0, cal_month: int = 0) -> str:
-    """일요일 날짜 → '2026년 6월 3주차' 형식 라벨 계산 (③주차요약 연동용)
-    캘린더 표시 월(cal_year/cal_month)이 주어지면 해당 월에 속하는 날짜 기준으로 계산"""
-    # 일요일~토요일 범위에서 캘린더 월에 속하는 날짜를 우선 사용
-    for offset in range(7):
-        d = sunday + timedelta(days=offset)
-        if cal_year > 0 and cal_month > 0:
-            if d.year == cal_year and d.month == cal_month:
-                wk = (d.day - 1) // 7 + 1
-                return f"{d.year}년 {d.month}월 {wk}주차"
-        else:
-            wk = (d.day - 1) // 7 + 1
-            return f"{d.year}년 {d.month}월 {wk}주차"
-    # fallback: 일요일 기준
-    wk = (sunday.day - 1) // 7 + 1
-    return f"{sunday.year}년 {sunday.month}월 {wk}주차"
-
 def _render_weekly_summary_html(ws: dict) -> str:
     """캘린더 주간요약 HTML 블록 생성 (중복 제거용 헬퍼)"""
     lt_str = f"{ws['avg_lt']:.1f}일" if ws['avg_lt'] is not None else "-"
@@ -1070,7 +2455,7 @@ def render_month_calendar(cal_agg_filtered: pd.DataFrame, ym: str, raw_df: pd.Da
                         with st.container(border=True):
                             st.markdown("&nbsp;")
                             st.markdown(_render_weekly_summary_html(weekly_summary[wk_sunday]), unsafe_allow_html=True)
-                            wk_label = _sunday_to_week_label(wk_sunday, y, m)
+                            wk_label = week_label_for_sunday(wk_sunday, y, m)
                             if wk_label and st.button("📊 주차요약 →", key=f"ws_nav_{wk_sunday}", use_container_width=True):
                                 st.session_state["nav_menu"] = "③ 주차요약"
                                 st.session_state["wk_sel_week"] = wk_label
@@ -1088,7 +2473,7 @@ def render_month_calendar(cal_agg_filtered: pd.DataFrame, ym: str, raw_df: pd.Da
                     # ── 일요일(i==0): 주간요약 표시 ──
                     if i == 0 and wk_sunday and wk_sunday in weekly_summary:
                         st.markdown(_render_weekly_summary_html(weekly_summary[wk_sunday]), unsafe_allow_html=True)
-                        wk_label = _sunday_to_week_label(wk_sunday, y, m)
+                        wk_label = week_label_for_sunday(wk_sunday, y, m)
                         if wk_label and st.button("📊 주차요약 →", key=f"ws_nav_d_{wk_sunday}", use_container_width=True):
                             st.session_state["nav_menu"] = "③ 주차요약"
                             st.session_state["wk_sel_week"] = wk_label
@@ -1137,11 +2522,11 @@ def render_calendar_detail(raw_df: pd.DataFrame, selected_date, selected_bp: str
         st.warning("품목코드/품목명/요청수량 컬럼이 없습니다.")
         return
 
-    # ── 날짜 + BP 필터 ──
-    detail_df = raw_df.copy()
+    # ── 날짜 + BP 필터 ── (공용 RAW 는 통째로 복사하지 않고 필터 결과만 새로 만든다)
+    detail_df = raw_df
 
-    if "_ship_date" in detail_df.columns:
-        detail_df = detail_df[detail_df["_ship_date"] == selected_date].copy()
+    if "_ship_day" in detail_df.columns:
+        detail_df = detail_df[(detail_df["_ship_day"] == day_key(selected_date)).fillna(False)].copy()
     elif COL_SHIP in detail_df.columns:
         detail_df = detail_df[
             pd.to_datetime(detail_df[COL_SHIP], errors="coerce").dt.date == selected_date
@@ -1201,9 +2586,9 @@ def render_calendar_detail(raw_df: pd.DataFrame, selected_date, selected_bp: str
     if COL_SHIP in out_df.columns:
         out_df["출고일자"] = out_df[COL_SHIP].apply(fmt_date)
         out_df = out_df.drop(columns=[COL_SHIP])
-    elif "_ship_date" in out_df.columns:
-        out_df["출고일자"] = out_df["_ship_date"].apply(
-            lambda x: str(x) if pd.notna(x) else "-"
+    elif "_ship_day" in out_df.columns:
+        out_df["출고일자"] = out_df["_ship_day"].apply(
+            lambda k: str(day_from_key(k)) if pd.notna(k) else "-"
         )
 
     # 요청수량 정수화
@@ -1247,25 +2632,41 @@ def reset_state_for_menu(menu: str):
         if "wk_sel_week" in st.session_state:
             del st.session_state["wk_sel_week"]
     elif menu == "④ 월간요약":
-        if "m_sel_month" in st.session_state:
-            del st.session_state["m_sel_month"]
-        if "monthly_report_text" in st.session_state:
-            del st.session_state["monthly_report_text"]
+        for k in ["m_sel_month", "m_batch_report_key"]:
+            if k in st.session_state:
+                del st.session_state[k]
 def init_nav_state():
     st.session_state.setdefault("nav_menu", "① 출고 캘린더")
     st.session_state.setdefault("_prev_nav_menu", st.session_state["nav_menu"])
 # =========================
-# 월간 리포트 생성 helpers
+# 월간 리포트 엔진 (월 × 거래처구분1 롤업 공유)
+# - 뷰 필터를 적용한 출고 행에서 리포트 대상 월들의 (월, 거래처구분1/2, BP, 품목) 요청수량 합을 한 번 집계하고(build_report_aggregate),
+#   MonthlyReportEngine 이 그 표에서 BP별/품목별/품목×BP/BP×품목 롤업과 전월 대비 품목 비교표, 신규 업체 표를
+#   대상 월 전체에 대해 한 번씩만 만든다. 월별 리포트는 롤업의 (월, 거래처구분1) 구간을 잘라 상위 N 정렬과 문구 조립만 한다
+#   → 선택 월 하나(선택/전월/차월 3개월)도, 전체 월 일괄 생성도 같은 경로
+# - 요청수량은 sum(min_count=1) 부분합이라 어느 롤업도 행 단위 계산과 같은 값이고, 구간 안 행 순서도 월별 groupby 와 같아
+#   동률 정렬까지 월마다 따로 만든 리포트와 같은 문구가 나온다
+# - 신규 업체 판정(전체 이력)은 필터 없는 RAW 에서 만든 (거래처구분1, BP명) → 유일 출고월 표로
 # =========================
-def _sum_qty(df: pd.DataFrame) -> int:
-    if df is None or df.empty or COL_QTY not in df.columns:
-        return 0
-    return int(round(float(pd.to_numeric(df[COL_QTY], errors="coerce").fillna(0).sum()), 0))
-def _top_bp_lines(df: pd.DataFrame, top_n: int = REPORT_TOP_N) -> list[str]:
-    if df is None or df.empty or (COL_BP not in df.columns) or (COL_QTY not in df.columns):
-        return []
-    g = df.groupby(COL_BP, dropna=False)[COL_QTY].sum(min_count=1).sort_values(ascending=False).head(top_n)
-    return [f"{str(bp).strip()}({_fmt_int(q)})" for bp, q in g.items()]
+REPORT_AGG_KEYS = ["_month_label", COL_CUST1, COL_CUST2, COL_BP, COL_ITEM_CODE, COL_ITEM_NAME]
+def build_report_aggregate(rows: pd.DataFrame, months: list[str]) -> pd.DataFrame:
+    """출고 행(뷰 필터 적용) → months 의 (월, 거래처구분1/2, BP, 품목) 요청수량 합"""
+    keys = [c for c in REPORT_AGG_KEYS if c in rows.columns]
+    sub = rows[rows["_month_label"].isin(months).to_numpy()]
+    return sub.groupby(keys, dropna=False, observed=True)[COL_QTY].sum(min_count=1).reset_index()
+def build_bp_month_history(raw_df: pd.DataFrame) -> pd.Series:
+    """RAW(필터 없음) → (거래처구분1, BP명 strip) 별 출고가 있었던 유일한 월.
+    두 달 이상(월 미상 행도 한 달로 셈)이면 NaN → 어느 월에서도 신규 업체가 아니다"""
+    src = raw_df.loc[raw_df[COL_BP].notna().to_numpy(), [COL_CUST1, COL_BP, "_month_label"]]
+    g = pd.DataFrame({
+        COL_CUST1: src[COL_CUST1].astype(object),
+        COL_BP: src[COL_BP].astype(str).str.strip(),
+        "_month_label": src["_month_label"].astype(object),
+    }).groupby([COL_CUST1, COL_BP], dropna=False)["_month_label"]
+    return g.first().where(g.nunique(dropna=False) == 1)
+@st.cache_resource(show_spinner=False, max_entries=2)
+def get_bp_month_history(version: str, _raw: pd.DataFrame) -> pd.Series:
+    return build_bp_month_history(_raw)
 def _overseas_stock_type_from_item_name(name: str) -> str:
     s = (name or "").strip()
     if not s:
@@ -1283,176 +2684,6 @@ def _extract_overseas_country(name: str) -> str:
     if m:
         return m.group(1).upper()
     return "공용"
-def _new_bp_detail_lines_whole_history(
-    all_df: pd.DataFrame,
-    cur_df: pd.DataFrame,
-    cust1_value: str,
-    cur_month_label: str,
-    top_n: int = REPORT_TOP_N
-) -> list[str]:
-    if cur_df is None or cur_df.empty or COL_BP not in cur_df.columns:
-        return ["- 없음"]
-    cur = _filter_cust1(cur_df, cust1_value).copy()
-    if cur.empty:
-        return ["- 없음"]
-    cur["__bp"] = cur[COL_BP].astype(str).str.strip()
-    cur = cur[cur["__bp"].notna() & (cur["__bp"] != "")]
-    if cur.empty:
-        return ["- 없음"]
-    others = all_df.copy()
-    if "_month_label" in others.columns:
-        others = others[others["_month_label"].astype(str) != str(cur_month_label)].copy()
-    others = _filter_cust1(others, cust1_value).copy()
-    other_bps = set(others[COL_BP].dropna().astype(str).str.strip().tolist()) if not others.empty else set()
-    new_cur = cur[~cur["__bp"].isin(other_bps)].copy()
-    if new_cur.empty:
-        return ["- 없음"]
-    if cust1_value == "해외B2B":
-        new_cur["__country"] = new_cur.get(COL_CUST2, "").fillna("").astype(str).str.strip()
-        agg = new_cur.groupby(["__bp", "__country"], dropna=False).agg(
-            sku_cnt=(COL_ITEM_CODE, lambda s: s.astype(str).str.strip().replace({"": pd.NA}).dropna().nunique()),
-            qty_sum=(COL_QTY, "sum")
-        ).reset_index()
-        agg["qty_sum"] = pd.to_numeric(agg["qty_sum"], errors="coerce").fillna(0)
-        agg = agg.sort_values(["qty_sum"], ascending=False).head(top_n)
-        out = []
-        for _, r in agg.iterrows():
-            bp = str(r["__bp"]).strip()
-            ctry = str(r["__country"]).strip()
-            sku = int(r["sku_cnt"]) if pd.notna(r["sku_cnt"]) else 0
-            qty = float(r["qty_sum"]) if pd.notna(r["qty_sum"]) else 0
-            tail = f"({ctry})" if ctry else ""
-            out.append(f"- {bp}{tail} : 총 {sku}SKU / {_fmt_int(qty)}개")
-        return out
-    agg = new_cur.groupby("__bp", dropna=False).agg(
-        sku_cnt=(COL_ITEM_CODE, lambda s: s.astype(str).str.strip().replace({"": pd.NA}).dropna().nunique()),
-        qty_sum=(COL_QTY, "sum")
-    ).reset_index()
-    agg["qty_sum"] = pd.to_numeric(agg["qty_sum"], errors="coerce").fillna(0)
-    agg = agg.sort_values(["qty_sum"], ascending=False).head(top_n)
-    out = []
-    for _, r in agg.iterrows():
-        bp = str(r["__bp"]).strip()
-        sku = int(r["sku_cnt"]) if pd.notna(r["sku_cnt"]) else 0
-        qty = float(r["qty_sum"]) if pd.notna(r["qty_sum"]) else 0
-        out.append(f"- {bp}: 총 {sku}SKU / {_fmt_int(qty)}개")
-    return out
-def _top_sku_with_bp_lines(df: pd.DataFrame, top_n: int = REPORT_TOP_N, bp_top_k: int = 2) -> list[str]:
-    if df is None or df.empty or not all(c in df.columns for c in [COL_ITEM_CODE, COL_ITEM_NAME, COL_QTY, COL_BP]):
-        return []
-    sku = (
-        df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
-        .sum(min_count=1).reset_index()
-        .rename(columns={COL_QTY: "qty"})
-    )
-    sku["qty"] = pd.to_numeric(sku["qty"], errors="coerce").fillna(0)
-    sku = sku.sort_values("qty", ascending=False).head(top_n)
-    out = []
-    for _, r in sku.iterrows():
-        code = str(r[COL_ITEM_CODE]).strip()
-        name = str(r[COL_ITEM_NAME]).strip()
-        qty = float(r["qty"]) if pd.notna(r["qty"]) else 0
-        sub = df[df[COL_ITEM_CODE].astype(str).str.strip() == code].copy()
-        bp_g = sub.groupby(COL_BP, dropna=False)[COL_QTY].sum(min_count=1).sort_values(ascending=False).head(bp_top_k)
-        bp_txt = "/ ".join([f"{str(bp).strip()}({_fmt_int(v)})" for bp, v in bp_g.items()])
-        if bp_txt:
-            out.append(f"- {code} {name} : {_fmt_int(qty)}개 → {bp_txt}")
-        else:
-            out.append(f"- {code} {name} : {_fmt_int(qty)}개")
-    return out
-def _top_sku_with_bp_lines_overseas_split_stock(df_overseas: pd.DataFrame, top_n_each: int = REPORT_TOP_N) -> list[str]:
-    if df_overseas is None or df_overseas.empty:
-        return ["- 없음"]
-    tmp = df_overseas.copy()
-    tmp["__stock_type"] = tmp[COL_ITEM_NAME].astype(str).apply(_overseas_stock_type_from_item_name)
-    out: list[str] = []
-    for stock in ["공용재고", "전용재고"]:
-        sub = tmp[tmp["__stock_type"] == stock].copy()
-        out.append(f"- {stock}")
-        lines = _top_sku_with_bp_lines(sub, top_n=top_n_each, bp_top_k=2)
-        if lines:
-            out.extend(["  " + ln for ln in lines])
-        else:
-            out.append("  - 없음")
-    return out
-# ✅✅✅ (에러 수정 핵심) pd.NA 제거 + np.nan 벡터화
-def _sku_mom_compare_table(cur_df: pd.DataFrame, prev_df: pd.DataFrame) -> pd.DataFrame:
-    if cur_df is None:
-        cur_df = pd.DataFrame()
-    if prev_df is None:
-        prev_df = pd.DataFrame()
-    cur = (
-        cur_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
-        .sum(min_count=1).reset_index().rename(columns={COL_QTY: "cur_qty"})
-    ) if (not cur_df.empty) else pd.DataFrame(columns=[COL_ITEM_CODE, COL_ITEM_NAME, "cur_qty"])
-    prev = (
-        prev_df.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
-        .sum(min_count=1).reset_index().rename(columns={COL_QTY: "prev_qty"})
-    ) if (not prev_df.empty) else pd.DataFrame(columns=[COL_ITEM_CODE, COL_ITEM_NAME, "prev_qty"])
-    cur["cur_qty"] = pd.to_numeric(cur.get("cur_qty", 0), errors="coerce").fillna(0.0)
-    prev["prev_qty"] = pd.to_numeric(prev.get("prev_qty", 0), errors="coerce").fillna(0.0)
-    cmp = cur.merge(prev, on=[COL_ITEM_CODE, COL_ITEM_NAME], how="outer")
-    cmp["cur_qty"] = pd.to_numeric(cmp.get("cur_qty", 0), errors="coerce").fillna(0.0)
-    cmp["prev_qty"] = pd.to_numeric(cmp.get("prev_qty", 0), errors="coerce").fillna(0.0)
-    cmp["diff_qty"] = cmp["cur_qty"] - cmp["prev_qty"]
-    cmp["pct"] = np.where(cmp["prev_qty"] > 0, (cmp["cur_qty"] / cmp["prev_qty"]) - 1.0, np.nan)
-    cmp["abs_diff"] = cmp["diff_qty"].abs().astype(float)
-    cmp["abs_pct_sort"] = pd.to_numeric(np.abs(cmp["pct"]), errors="coerce").fillna(-1.0)
-    return cmp
-def _sku_mom_top_lines_by_pct(cur_df: pd.DataFrame, prev_df: pd.DataFrame, top_n: int = REPORT_TOP_N) -> list[str]:
-    cmp = _sku_mom_compare_table(cur_df, prev_df)
-    cmp2 = cmp[cmp["abs_pct_sort"] >= 0].copy()
-    if cmp2.empty:
-        return ["- 없음"]
-    cmp2 = cmp2.sort_values(["abs_pct_sort", "abs_diff"], ascending=False).head(top_n)
-    out = []
-    for _, r in cmp2.iterrows():
-        code = str(r[COL_ITEM_CODE]).strip()
-        name = str(r[COL_ITEM_NAME]).strip()
-        pq = float(r["prev_qty"])
-        cq = float(r["cur_qty"])
-        pct = float(r["pct"]) * 100
-        out.append(f"- {code} {name} : {pct:+.0f}% ({_fmt_int(pq)} → {_fmt_int(cq)})")
-    return out
-def _sku_mom_top_lines_by_diff(cur_df: pd.DataFrame, prev_df: pd.DataFrame, top_n: int = REPORT_TOP_N) -> list[str]:
-    cmp = _sku_mom_compare_table(cur_df, prev_df)
-    if cmp.empty:
-        return ["- 없음"]
-    cmp2 = cmp.sort_values(["abs_diff"], ascending=False).head(top_n)
-    out = []
-    for _, r in cmp2.iterrows():
-        code = str(r[COL_ITEM_CODE]).strip()
-        name = str(r[COL_ITEM_NAME]).strip()
-        pq = float(r["prev_qty"])
-        cq = float(r["cur_qty"])
-        diff = float(r["diff_qty"])
-        out.append(f"- {code} {name} : {diff:+,.0f}개 ({_fmt_int(pq)} → {_fmt_int(cq)})")
-    return out
-def _spike_sku_lines(cur_df: pd.DataFrame, prev_df: pd.DataFrame, top_n: int = REPORT_TOP_N) -> list[str]:
-    spike_df = build_spike_report_only(cur_df, prev_df)
-    if spike_df is None or spike_df.empty:
-        return ["- 없음"]
-    spike_df = spike_df.copy()
-    spike_df["pct_tmp"] = spike_df.apply(
-        lambda r: ((float(r["현재_요청수량"]) / float(r["이전_요청수량"]) - 1) * 100)
-        if (pd.notna(r["이전_요청수량"]) and float(r["이전_요청수량"]) > 0) else np.nan,
-        axis=1
-    )
-    spike_df = spike_df.sort_values(["pct_tmp", "현재_요청수량"], ascending=False).head(top_n)
-    out = []
-    for _, r in spike_df.iterrows():
-        code = str(r[COL_ITEM_CODE]).strip()
-        name = str(r[COL_ITEM_NAME]).strip()
-        prev_q = int(r["이전_요청수량"]) if pd.notna(r["이전_요청수량"]) else 0
-        cur_q = int(r["현재_요청수량"]) if pd.notna(r["현재_요청수량"]) else 0
-        pct = r["pct_tmp"]
-        pct_s = f"(약 {pct:+.0f}%)" if pd.notna(pct) else ""
-        bp_map = str(r.get("BP명(요청수량)", "") or "").strip()
-        tail = f" → {bp_map}" if bp_map else ""
-        out.append(f"- {code} {name} : {_fmt_int(prev_q)} → {_fmt_int(cur_q)} {pct_s}{tail}")
-    return out
-
-
 # ✅ v2.1 — 증감 방향 표시 헬퍼
 def _pct_change_str(cur_val: float, prev_val: float) -> str:
     """전월 대비 증감률 문자열 생성 (▲/▼ 포함)"""
@@ -1461,137 +2692,369 @@ def _pct_change_str(cur_val: float, prev_val: float) -> str:
     pct = (cur_val / prev_val - 1) * 100
     arrow = "▲" if pct > 0 else ("▼" if pct < 0 else "→")
     return f"({arrow} {abs(pct):.1f}%)"
+def _stripped_category(s: pd.Series, fn=None) -> pd.Categorical:
+    """값을 str → strip(→ fn) 한 범주형 (범주 = 정렬된 고유값, 결측은 'nan').
+    범주형 열은 범주 라벨만 변환해 행마다 문자열을 만들지 않는다"""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        labels = s.cat.categories.astype(str).str.strip().to_numpy(dtype=object)
+        labels = np.append(labels, "nan")  # 코드 -1(결측) → 마지막 라벨
+        codes = s.cat.codes.to_numpy()
+    else:
+        labels, codes = s.astype(str).str.strip().to_numpy(dtype=object), np.arange(len(s))
+    if fn is not None:
+        labels = np.array([fn(x) for x in labels], dtype=object)
+    uniq, inv = np.unique(labels, return_inverse=True)
+    return pd.Categorical.from_codes(inv[codes], categories=uniq)
+class _ReportRollup:
+    """롤업 표 + lead 키(월, 거래처구분1, ...) 조합별 [시작, 끝) 행 구간.
+    groupby 결과는 키 사전순이라 lead 가 같은 행이 붙어 있다 → 구간은 복사 없는 iloc 슬라이스"""
+    def __init__(self, frame: pd.DataFrame, lead: list[str]):
+        self.frame = frame
+        self.keys = [c for c in frame.columns if c not in lead and c != COL_QTY]
+        n = len(frame)
+        change = np.zeros(n, dtype=bool)
+        if n:
+            change[0] = True
+        for c in lead:
+            col = frame[c]
+            codes = col.cat.codes.to_numpy() if isinstance(col.dtype, pd.CategoricalDtype) else pd.factorize(col)[0]
+            change[1:] |= codes[1:] != codes[:-1]
+        starts = np.flatnonzero(change)
+        ends = np.append(starts[1:], n).astype(np.int64)
+        keys = frame[lead].iloc[starts].itertuples(index=False, name=None)
+        self._span = {k: (s, e) for k, s, e in zip(keys, starts.tolist(), ends.tolist())}
+        self._values = {c: frame[c].to_numpy() for c in frame.columns}
+    def part(self, *key) -> dict[str, np.ndarray]:
+        """lead 키 조합 한 구간의 열 배열 (복사 없는 슬라이스)"""
+        s, e = self._span.get(key, (0, 0))
+        return {c: v[s:e] for c, v in self._values.items()}
+    def by_key(self, *key) -> tuple[np.ndarray, np.ndarray]:
+        """키가 하나 남는 롤업(BP별 합 등) → (그 키 값, 요청수량)"""
+        part = self.part(*key)
+        return part[self.keys[0]], part[COL_QTY]
+class MonthlyReportEngine:
+    """월간 공유용 리포트 — 리포트 집계(agg, months 전체)에서 월 × 거래처구분1 롤업을 한 번씩 만들고 report(월) 로 렌더.
+    전월/차월은 months 순서상 앞뒤 월 (④ 월 목록과 같은 순서로 넘긴다)"""
+    def __init__(self, agg: pd.DataFrame, bp_history: pd.Series, months: list[str]):
+        self.months = [str(m) for m in months]
+        M = "_month_label"
+        a = agg.copy(deep=False)
+        a["__bp"] = _stripped_category(a[COL_BP])
+        a["__code"] = _stripped_category(a[COL_ITEM_CODE])
+        a["__stock"] = _stripped_category(a[COL_ITEM_NAME], _overseas_stock_type_from_item_name)
 
+        def rollup(lead: list[str], keys: list[str]) -> _ReportRollup:
+            g = a.groupby([M, COL_CUST1] + lead + keys, dropna=False, observed=True)[COL_QTY].sum(min_count=1)
+            return _ReportRollup(g.reset_index(), [M, COL_CUST1] + lead)
+        sku = [COL_ITEM_CODE, COL_ITEM_NAME]
+        self.bp = rollup([], [COL_BP])
+        self.sku = rollup([], sku)
+        self.code_bp = rollup(["__code"], [COL_BP])
+        self.sku_st = rollup(["__stock"], sku)
+        self.code_bp_st = rollup(["__stock", "__code"], [COL_BP])
+        self.bp_sku = rollup(["__bp"], sku)
+        self.bp_code_bp = rollup(["__bp", "__code"], [COL_BP])
+        self.sku_bp = rollup(sku, [COL_BP])
+        qty = a[COL_QTY].fillna(0)
+        self.cust1_total = qty.groupby([a[M], a[COL_CUST1]], dropna=False, observed=True).sum().to_dict()
+        self.month_total = qty.groupby(a[M], dropna=False, observed=True).sum().to_dict()
+        self.cmp = self._build_sku_compare(self.sku.frame)
+        self.new_bp, self.new_bp_country = self._build_new_bp(a, bp_history)
 
-def build_monthly_share_report(
-    all_df: pd.DataFrame,
-    sel_month_label: str,
-    cur_df: pd.DataFrame,
-    prev_df: pd.DataFrame,
-    next_df: Optional[pd.DataFrame] = None,
-) -> str:
-    # ✅ v2.1 — 유니코드 이모지 사용 + 총괄 요약 추가
-
-    # ── 총괄 수치 산출 ──
-    total_cur_qty = _sum_qty(cur_df)
-    total_prev_qty = _sum_qty(prev_df)
-    overseas_cur = _filter_cust1(cur_df, "해외B2B") if (cur_df is not None and not cur_df.empty) else pd.DataFrame()
-    domestic_cur = _filter_cust1(cur_df, "국내B2B") if (cur_df is not None and not cur_df.empty) else pd.DataFrame()
-    overseas_prev = _filter_cust1(prev_df, "해외B2B") if (prev_df is not None and not prev_df.empty) else pd.DataFrame()
-    domestic_prev = _filter_cust1(prev_df, "국내B2B") if (prev_df is not None and not prev_df.empty) else pd.DataFrame()
-
-    ovs_cur_qty = _sum_qty(overseas_cur)
-    ovs_prev_qty = _sum_qty(overseas_prev)
-    dom_cur_qty = _sum_qty(domestic_cur)
-    dom_prev_qty = _sum_qty(domestic_prev)
-
-    # 비율
-    ovs_pct = (ovs_cur_qty / total_cur_qty * 100) if total_cur_qty > 0 else 0
-    dom_pct = (dom_cur_qty / total_cur_qty * 100) if total_cur_qty > 0 else 0
-
-    head = [
-        f"📦 {sel_month_label} B2B 출고 현황 공유드립니다 😊",
-        "(SAP 현황 기준이며, 자료에 오차 범위가 있을 수 있습니다)",
-        "",
-        "━━━━━━━━━━━━━━━━━━━━━━━━",
-        f"📊 총괄 요약",
-        "━━━━━━━━━━━━━━━━━━━━━━━━",
-        f"- 총 출고수량: {_fmt_int(total_cur_qty)}개 {_pct_change_str(total_cur_qty, total_prev_qty)}",
-        f"  ├ 해외B2B: {_fmt_int(ovs_cur_qty)}개 ({ovs_pct:.0f}%) {_pct_change_str(ovs_cur_qty, ovs_prev_qty)}",
-        f"  └ 국내B2B: {_fmt_int(dom_cur_qty)}개 ({dom_pct:.0f}%) {_pct_change_str(dom_cur_qty, dom_prev_qty)}",
-        "",
-    ]
+    def _neighbor(self, month: Optional[str], step: int) -> Optional[str]:
+        if month not in self.months:
+            return None
+        i = self.months.index(month) + step
+        return self.months[i] if 0 <= i < len(self.months) else None
 
-    def section_for(cust1_value: str, title: str, sched_top_bp_n: int):
-        sub_cur = _filter_cust1(cur_df, cust1_value).copy()
-        sub_prev = _filter_cust1(prev_df, cust1_value).copy() if (prev_df is not None) else pd.DataFrame()
-        lines: list[str] = []
-        lines.append("━━━━━━━━━━━━━━━━━━━━━━━━")
-        lines.append(f"*{title}*")
-        lines.append("━━━━━━━━━━━━━━━━━━━━━━━━")
-        lines.append("")
-
-        # 1) 신규 업체
-        lines.append("✅ 신규 업체 첫 출고")
-        lines.extend(_new_bp_detail_lines_whole_history(
-            all_df=all_df,
-            cur_df=cur_df,
-            cust1_value=cust1_value,
-            cur_month_label=sel_month_label,
-            top_n=REPORT_TOP_N
-        ))
-        lines.append("")
-
-        # 2) 출고량 증감 요약
-        cq = _sum_qty(sub_cur)
-        pq = _sum_qty(sub_prev)
-        diff = cq - pq
-        lines.append("✅ 출고량 증감 요약")
-        if pq > 0:
-            pct = (cq / pq - 1) * 100
-            arrow = "▲" if diff > 0 else ("▼" if diff < 0 else "→")
-            lines.append(f"- 출고수량: {_fmt_int(pq)} → {_fmt_int(cq)}개 ({arrow} {abs(diff):,}개, {abs(pct):.1f}%)")
-        else:
-            lines.append(f"- 출고수량: {_fmt_int(cq)}개 (전월 데이터 부족으로 증감 산정 불가)")
-        top_bps = _top_bp_lines(sub_cur, top_n=REPORT_TOP_N)
-        lines.append("- 주요 출고 업체 : " + (" / ".join(top_bps) if top_bps else "-"))
-        lines.append("")
-
-        # 3) 특정 SKU 대량 출고
-        lines.append("✅ 특정 SKU 대량 출고 (Top)")
-        if cust1_value == "해외B2B":
-            lines.extend(_top_sku_with_bp_lines_overseas_split_stock(sub_cur, top_n_each=REPORT_TOP_N))
-        else:
-            top_skus = _top_sku_with_bp_lines(sub_cur, top_n=REPORT_TOP_N, bp_top_k=2)
-            lines.extend(top_skus if top_skus else ["- 없음"])
-        lines.append("")
-
-        # 4) 전월 대비 주요 SKU 증감
-        lines.append("✅ 전월 대비 주요 SKU 증감")
-        lines.append(f"  [증감률 Top{REPORT_TOP_N}]")
-        pct_lines = _sku_mom_top_lines_by_pct(sub_cur, sub_prev, top_n=REPORT_TOP_N)
-        lines.extend(["  " + x for x in pct_lines])
-        lines.append(f"  [증감수량 Top{REPORT_TOP_N}]")
-        diff_lines = _sku_mom_top_lines_by_diff(sub_cur, sub_prev, top_n=REPORT_TOP_N)
-        lines.extend(["  " + x for x in diff_lines])
-        lines.append("")
-
-        # 5) 전월 대비 출고량 증가 SKU (급증)
-        lines.append("⚠️ 전월 대비 출고량 급증 SKU (+30% 이상)")
-        lines.extend(_spike_sku_lines(sub_cur, sub_prev, top_n=REPORT_TOP_N))
-        lines.append("")
-
-        # 6) 차월 간략 일정
-        lines.append("🗓️ 차월 간략 일정 (대량 출고 중심)")
-        if next_df is None or next_df.empty:
-            lines.append(f"- {title} 차월 데이터 없음")
+    def _build_sku_compare(self, sku: pd.DataFrame) -> _ReportRollup:
+        """월 × 거래처구분1 × 품목 수량을 전월(months 순서상 앞 월) 수량과 한 번에 outer merge"""
+        M = "_month_label"
+        keys = [M, COL_CUST1, COL_ITEM_CODE, COL_ITEM_NAME]
+        cur = sku.rename(columns={COL_QTY: "cur_qty"})
+        cur["cur_qty"] = pd.to_numeric(cur["cur_qty"], errors="coerce").fillna(0.0)
+        prev = sku.rename(columns={COL_QTY: "prev_qty"})
+        next_of = prev[M].astype(object).map({m: self._neighbor(m, 1) for m in self.months})
+        prev[M] = pd.Categorical(next_of, categories=sku[M].cat.categories) \
+            if isinstance(sku[M].dtype, pd.CategoricalDtype) else next_of
+        prev = prev[prev[M].notna().to_numpy()]
+        prev["prev_qty"] = pd.to_numeric(prev["prev_qty"], errors="coerce").fillna(0.0)
+        cmp = cur.merge(prev, on=keys, how="outer", indicator="__src")
+        cmp["__in_cur"] = cmp["__src"] != "right_only"
+        cmp = cmp.drop(columns="__src")
+        cmp["cur_qty"] = pd.to_numeric(cmp["cur_qty"], errors="coerce").fillna(0.0)
+        cmp["prev_qty"] = pd.to_numeric(cmp["prev_qty"], errors="coerce").fillna(0.0)
+        cmp["diff_qty"] = cmp["cur_qty"] - cmp["prev_qty"]
+        cmp["pct"] = np.where(cmp["prev_qty"] > 0, (cmp["cur_qty"] / cmp["prev_qty"]) - 1.0, np.nan)
+        cmp["abs_diff"] = cmp["diff_qty"].abs().astype(float)
+        cmp["abs_pct_sort"] = pd.to_numeric(np.abs(cmp["pct"]), errors="coerce").fillna(-1.0)
+        return _ReportRollup(cmp, [M, COL_CUST1])
+
+    @staticmethod
+    def _build_new_bp(a: pd.DataFrame, bp_history: pd.Series) -> tuple[_ReportRollup, _ReportRollup]:
+        """각 행의 BP 가 그 행의 월에 처음(전체 이력에서 그 달에만) 출고됐는지 → 신규 업체 (BP) / (BP, 국가) 표"""
+        M = "_month_label"
+        src = a[(a["__bp"] != "").to_numpy()]
+        # (월, 거래처구분1, BP) 조합 단위로 판정해 행에 되돌림
+        combo = src.groupby([M, COL_CUST1, "__bp"], dropna=False, observed=True).ngroup().to_numpy()
+        first = pd.Series(np.arange(len(src))).groupby(combo).first().to_numpy()
+        key = pd.MultiIndex.from_arrays([
+            src[COL_CUST1].iloc[first].astype(object).to_numpy(), src["__bp"].iloc[first].astype(object).to_numpy(),
+        ])
+        only = bp_history.reindex(key).to_numpy()
+        is_new = ~key.isin(bp_history.index) | (only == src[M].iloc[first].astype(object).to_numpy())
+        new = src[is_new[combo]].copy()
+        new["__country"] = new[COL_CUST2].astype(object).fillna("").astype(str).str.strip() if COL_CUST2 in new.columns else ""
+        new["__sku"] = new[COL_ITEM_CODE].astype(str).str.strip().replace({"": pd.NA})
+
+        def table(keys: list[str]) -> _ReportRollup:
+            g = new.groupby([M, COL_CUST1] + keys, dropna=False, observed=True)
+            out = pd.DataFrame({"sku_cnt": g["__sku"].nunique(), "qty_sum": g[COL_QTY].sum()}).reset_index()
+            out["qty_sum"] = pd.to_numeric(out["qty_sum"], errors="coerce").fillna(0)
+            return _ReportRollup(out, [M, COL_CUST1])
+        return table(["__bp"]), table(["__bp", "__country"])
+
+    # ── 섹션 조각 ──
+    def _total(self, month: Optional[str], cust1_value: Optional[str] = None) -> int:
+        if month is None:
+            return 0
+        v = self.month_total.get(month, 0) if cust1_value is None else self.cust1_total.get((month, cust1_value), 0)
+        return int(round(float(v), 0))
+
+    def _top_bp_lines(self, month: Optional[str], cust1_value: str, top_n: int = REPORT_TOP_N) -> list[str]:
+        if month is None:
+            return []
+        bps, qty = self.bp.by_key(month, cust1_value)
+        return [f"{str(bps[i]).strip()}({_fmt_int(qty[i])})" for i in _order_desc(qty, bps)[:top_n]]
+
+    @staticmethod
+    def _top_sku_lines(sku: dict, bp_of_code, top_n: int, bp_top_k: int) -> list[str]:
+        """sku: (품목코드, 품목명, 요청수량) 구간 / bp_of_code(품목코드 strip) → 같은 구간 그 품목의 (BP, 요청수량)"""
+        qty = sku[COL_QTY]
+        qty = np.where(np.isnan(qty), 0.0, qty)
+        out = []
+        for i in _order_desc(qty, sku[COL_ITEM_CODE], sku[COL_ITEM_NAME])[:top_n]:
+            code = str(sku[COL_ITEM_CODE][i]).strip()
+            name = str(sku[COL_ITEM_NAME][i]).strip()
+            bps, bp_qty = bp_of_code(code)
+            bp_txt = "/ ".join([f"{str(bps[j]).strip()}({_fmt_int(bp_qty[j])})" for j in _order_desc(bp_qty, bps)[:bp_top_k]])
+            if bp_txt:
+                out.append(f"- {code} {name} : {_fmt_int(qty[i])}개 → {bp_txt}")
+            else:
+                out.append(f"- {code} {name} : {_fmt_int(qty[i])}개")
+        return out
+
+    def _new_bp_lines(self, month: str, cust1_value: str, top_n: int = REPORT_TOP_N) -> list[str]:
+        overseas = cust1_value == "해외B2B"
+        new = (self.new_bp_country if overseas else self.new_bp).part(month, cust1_value)
+        if not len(new["qty_sum"]):
+            return ["- 없음"]
+        out = []
+        names = (new["__bp"], new["__country"]) if overseas else (new["__bp"],)
+        for i in _order_desc(new["qty_sum"], *names)[:top_n]:
+            bp = str(new["__bp"][i]).strip()
+            sku = int(new["sku_cnt"][i]) if pd.notna(new["sku_cnt"][i]) else 0
+            qty = float(new["qty_sum"][i]) if pd.notna(new["qty_sum"][i]) else 0
+            if overseas:
+                ctry = str(new["__country"][i]).strip()
+                tail = f"({ctry})" if ctry else ""
+                out.append(f"- {bp}{tail} : 총 {sku}SKU / {_fmt_int(qty)}개")
+            else:
+                out.append(f"- {bp}: 총 {sku}SKU / {_fmt_int(qty)}개")
+        return out
+
+    @staticmethod
+    def _sku_mom_lines(cmp: dict, top_n: int = REPORT_TOP_N) -> tuple[list[str], list[str]]:
+        """전월 대비 품목 증감 — (증감률 Top, 증감수량 Top). 동률은 품목코드·품목명 오름차순"""
+        def text(i: int) -> tuple[str, str, str]:
+            return (
+                f"- {str(cmp[COL_ITEM_CODE][i]).strip()} {str(cmp[COL_ITEM_NAME][i]).strip()} : ",
+                _fmt_int(cmp["prev_qty"][i]), _fmt_int(cmp["cur_qty"][i]),
+            )
+        has_pct = np.flatnonzero(cmp["abs_pct_sort"] >= 0)
+        pct_order = has_pct[np.lexsort((
+            _tie_key(cmp[COL_ITEM_NAME][has_pct]), _tie_key(cmp[COL_ITEM_CODE][has_pct]),
+            -cmp["abs_diff"][has_pct], -cmp["abs_pct_sort"][has_pct],
+        ))][:top_n]
+        pct_lines = []
+        for i in pct_order:
+            head, pq, cq = text(i)
+            pct_lines.append(f"{head}{float(cmp['pct'][i]) * 100:+.0f}% ({pq} → {cq})")
+        diff_lines = []
+        for i in _order_desc(cmp["abs_diff"], cmp[COL_ITEM_CODE], cmp[COL_ITEM_NAME])[:top_n]:
+            head, pq, cq = text(i)
+            diff_lines.append(f"{head}{float(cmp['diff_qty'][i]):+,.0f}개 ({pq} → {cq})")
+        return (pct_lines or ["- 없음"]), (diff_lines or ["- 없음"])
+
+    def _spike_lines(self, month: str, cust1_value: str, cmp: dict, top_n: int = REPORT_TOP_N) -> list[str]:
+        """build_spike_report_only 와 같은 판정·정렬 (선택 월 품목 기준, 전월 대비 SPIKE_FACTOR 배 이상) → Top N 만 BP 목록"""
+        prev_qty, cur_qty = cmp["prev_qty"], cmp["cur_qty"]
+        rows = np.flatnonzero(cmp["__in_cur"] & (prev_qty > 0) & (cur_qty >= prev_qty * SPIKE_FACTOR))
+        if not len(rows):
+            return ["- 없음"]
+        # (증가율, 반올림 정수 현재수량) 내림차순 → 동률은 품목코드·품목명 오름차순
+        cur_i = np.round(cur_qty[rows]).astype(np.int64)
+        prev_i = np.round(prev_qty[rows]).astype(np.int64)
+        pct = (cur_i.astype("float64") / prev_i.astype("float64") - 1) * 100
+        out = []
+        order = np.lexsort((_tie_key(cmp[COL_ITEM_NAME][rows]), _tie_key(cmp[COL_ITEM_CODE][rows]), -cur_i, -pct))
+        for j in order[:top_n]:
+            code, name = cmp[COL_ITEM_CODE][rows[j]], cmp[COL_ITEM_NAME][rows[j]]
+            bps, bp_qty = self.sku_bp.by_key(month, cust1_value, code, name)
+            bp_map = "/ ".join(f"{str(bps[k]).strip()}({_fmt_int(0 if np.isnan(bp_qty[k]) else bp_qty[k])})" for k in _order_desc(bp_qty, bps))
+            tail = f" → {bp_map}" if bp_map else ""
+            out.append(
+                f"- {str(code).strip()} {str(name).strip()} : {_fmt_int(prev_i[j])} → {_fmt_int(cur_i[j])} "
+                f"(약 {pct[j]:+.0f}%){tail}"
+            )
+        return out
+
+    def report(self, sel_month_label: str) -> str:
+        # ✅ v2.1 — 유니코드 이모지 사용 + 총괄 요약 추가
+        sel = str(sel_month_label)
+        prev_month = self._neighbor(sel, -1)
+        next_month = self._neighbor(sel, 1)
+
+        # ── 총괄 수치 산출 ──
+        total_cur_qty = self._total(sel)
+        total_prev_qty = self._total(prev_month)
+        ovs_cur_qty = self._total(sel, "해외B2B")
+        ovs_prev_qty = self._total(prev_month, "해외B2B")
+        dom_cur_qty = self._total(sel, "국내B2B")
+        dom_prev_qty = self._total(prev_month, "국내B2B")
+
+        # 비율
+        ovs_pct = (ovs_cur_qty / total_cur_qty * 100) if total_cur_qty > 0 else 0
+        dom_pct = (dom_cur_qty / total_cur_qty * 100) if total_cur_qty > 0 else 0
+
+        head = [
+            f"📦 {sel} B2B 출고 현황 공유드립니다 😊",
+            "(SAP 현황 기준이며, 자료에 오차 범위가 있을 수 있습니다)",
+            "",
+            "━━━━━━━━━━━━━━━━━━━━━━━━",
+            f"📊 총괄 요약",
+            "━━━━━━━━━━━━━━━━━━━━━━━━",
+            f"- 총 출고수량: {_fmt_int(total_cur_qty)}개 {_pct_change_str(total_cur_qty, total_prev_qty)}",
+            f"  ├ 해외B2B: {_fmt_int(ovs_cur_qty)}개 ({ovs_pct:.0f}%) {_pct_change_str(ovs_cur_qty, ovs_prev_qty)}",
+            f"  └ 국내B2B: {_fmt_int(dom_cur_qty)}개 ({dom_pct:.0f}%) {_pct_change_str(dom_cur_qty, dom_prev_qty)}",
+            "",
+        ]
+
+        def section_for(cust1_value: str, title: str, sched_top_bp_n: int):
+            lines: list[str] = []
+            lines.append("━━━━━━━━━━━━━━━━━━━━━━━━")
+            lines.append(f"*{title}*")
+            lines.append("━━━━━━━━━━━━━━━━━━━━━━━━")
             lines.append("")
-            return lines
-        sub_next = _filter_cust1(next_df, cust1_value).copy()
-        if sub_next.empty:
-            lines.append(f"- {title} 차월 데이터 없음")
+
+            # 1) 신규 업체
+            lines.append("✅ 신규 업체 첫 출고")
+            lines.extend(self._new_bp_lines(sel, cust1_value, top_n=REPORT_TOP_N))
             lines.append("")
-            return lines
-        bp_sched = _top_bp_lines(sub_next, top_n=sched_top_bp_n)
-        if not bp_sched:
-            lines.append(f"- {title} 차월 데이터 없음")
+
+            # 2) 출고량 증감 요약
+            cq = self._total(sel, cust1_value)
+            pq = self._total(prev_month, cust1_value)
+            diff = cq - pq
+            lines.append("✅ 출고량 증감 요약")
+            if pq > 0:
+                pct = (cq / pq - 1) * 100
+                arrow = "▲" if diff > 0 else ("▼" if diff < 0 else "→")
+                lines.append(f"- 출고수량: {_fmt_int(pq)} → {_fmt_int(cq)}개 ({arrow} {abs(diff):,}개, {abs(pct):.1f}%)")
+            else:
+                lines.append(f"- 출고수량: {_fmt_int(cq)}개 (전월 데이터 부족으로 증감 산정 불가)")
+            top_bps = self._top_bp_lines(sel, cust1_value, top_n=REPORT_TOP_N)
+            lines.append("- 주요 출고 업체 : " + (" / ".join(top_bps) if top_bps else "-"))
             lines.append("")
-            return lines
-        lines.append(f"- {title} 차월 대량 출고(Top{len(bp_sched)})")
-        for bp_txt in bp_sched:
-            bp_name = bp_txt.split("(")[0].strip()
-            bp_sub = sub_next[sub_next[COL_BP].astype(str).str.strip() == bp_name].copy()
-            sku_sched = _top_sku_with_bp_lines(bp_sub, top_n=1, bp_top_k=1)
-            if sku_sched:
-                sku_line = sku_sched[0].lstrip("- ").strip()
-                lines.append(f"  • {bp_name}: {sku_line}")
+
+            # 3) 특정 SKU 대량 출고
+            lines.append("✅ 특정 SKU 대량 출고 (Top)")
+            if cust1_value == "해외B2B" and not len(self.sku.part(sel, cust1_value)[COL_QTY]):
+                lines.append("- 없음")
+            elif cust1_value == "해외B2B":
+                for stock in ["공용재고", "전용재고"]:
+                    lines.append(f"- {stock}")
+                    sku_lines = self._top_sku_lines(
+                        self.sku_st.part(sel, cust1_value, stock),
+                        lambda code: self.code_bp_st.by_key(sel, cust1_value, stock, code),
+                        top_n=REPORT_TOP_N, bp_top_k=2,
+                    )
+                    lines.extend(["  " + ln for ln in sku_lines] if sku_lines else ["  - 없음"])
             else:
-                lines.append(f"  • {bp_txt}")
-        lines.append("")
-        return lines
-    overseas = section_for("해외B2B", "해외B2B", sched_top_bp_n=REPORT_TOP_N)
-    domestic = section_for("국내B2B", "국내B2B", sched_top_bp_n=REPORT_TOP_N)
-    return "\n".join(head + overseas + domestic).strip()
+                top_skus = self._top_sku_lines(
+                    self.sku.part(sel, cust1_value), lambda code: self.code_bp.by_key(sel, cust1_value, code),
+                    top_n=REPORT_TOP_N, bp_top_k=2,
+                )
+                lines.extend(top_skus if top_skus else ["- 없음"])
+            lines.append("")
+
+            # 4) 전월 대비 주요 SKU 증감
+            cmp = self.cmp.part(sel, cust1_value)
+            pct_lines, diff_lines = self._sku_mom_lines(cmp, top_n=REPORT_TOP_N)
+            lines.append("✅ 전월 대비 주요 SKU 증감")
+            lines.append(f"  [증감률 Top{REPORT_TOP_N}]")
+            lines.extend(["  " + x for x in pct_lines])
+            lines.append(f"  [증감수량 Top{REPORT_TOP_N}]")
+            lines.extend(["  " + x for x in diff_lines])
+            lines.append("")
+
+            # 5) 전월 대비 출고량 증가 SKU (급증)
+            lines.append("⚠️ 전월 대비 출고량 급증 SKU (+30% 이상)")
+            lines.extend(self._spike_lines(sel, cust1_value, cmp, top_n=REPORT_TOP_N))
+            lines.append("")
+
+            # 6) 차월 간략 일정
+            lines.append("🗓️ 차월 간략 일정 (대량 출고 중심)")
+            bp_sched = self._top_bp_lines(next_month, cust1_value, top_n=sched_top_bp_n)
+            if not bp_sched:
+                lines.append(f"- {title} 차월 데이터 없음")
+                lines.append("")
+                return lines
+            lines.append(f"- {title} 차월 대량 출고(Top{len(bp_sched)})")
+            for bp_txt in bp_sched:
+                bp_name = bp_txt.split("(")[0].strip()
+                sku_sched = self._top_sku_lines(
+                    self.bp_sku.part(next_month, cust1_value, bp_name),
+                    lambda code: self.bp_code_bp.by_key(next_month, cust1_value, bp_name, code),
+                    top_n=1, bp_top_k=1,
+                )
+                if sku_sched:
+                    sku_line = sku_sched[0].lstrip("- ").strip()
+                    lines.append(f"  • {bp_name}: {sku_line}")
+                else:
+                    lines.append(f"  • {bp_txt}")
+            lines.append("")
+            return lines
+        overseas = section_for("해외B2B", "해외B2B", sched_top_bp_n=REPORT_TOP_N)
+        domestic = section_for("국내B2B", "국내B2B", sched_top_bp_n=REPORT_TOP_N)
+        return "\n".join(head + overseas + domestic).strip()
+def build_monthly_share_report(
+    agg: pd.DataFrame,
+    bp_history: pd.Series,
+    sel_month_label: str,
+    prev_month_label: Optional[str] = None,
+    next_month_label: Optional[str] = None,
+) -> str:
+    """선택 월 하나 — agg: build_report_aggregate(선택/전월/차월 포함) / bp_history: build_bp_month_history"""
+    months = [m for m in (prev_month_label, sel_month_label, next_month_label) if m is not None]
+    return MonthlyReportEngine(agg, bp_history, months).report(sel_month_label)
+def get_monthly_reports(cache: "ResultCache", key: tuple, months: list[str], make_engine) -> dict[str, str]:
+    """월별 리포트를 ("monthly_report", 월) + key(데이터 버전·필터) 로 캐시 — 캐시에 없는 월이 있을 때만
+    make_engine() 으로 엔진을 한 번 만들어 그 월들을 렌더"""
+    engine: list[MonthlyReportEngine] = []
+
+    def render(month: str) -> str:
+        if not engine:
+            engine.append(make_engine())
+        return engine[0].report(month)
+    return {m: cache.get_or_compute(("monthly_report", m) + key, lambda m=m: render(m)) for m in months}
+def monthly_reports_zip(reports: dict[str, str], file_tags: dict[str, str]) -> bytes:
+    """{월: 리포트} → 월별 txt(UTF-8) 를 담은 zip. 파일명은 월간리포트_<file_tags[월]>.txt"""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for month, text in reports.items():
+            zf.writestr(f"월간리포트_{file_tags.get(month, month)}.txt", text)
+    return buf.getvalue()
 # =========================
 # Main
 # =========================
@@ -1600,9 +3063,9 @@ st.caption("Google Sheet RAW 기반 | 제품분류 B0/B1 고정 | 필터(거래
 init_nav_state()
 # ✅ Refresh handler (전부 초기화 정책)
 if st.button("🔄 데이터 새로고침"):
-    st.cache_data.clear()
+    st.session_state["_force_refresh"] = True
     for k in list(st.session_state.keys()):
-        if k.startswith(("cal_", "f_", "sku_", "wk_", "m_")) or k in ("monthly_report_text", "_prev_nav_menu", "nav_menu"):
+        if k.startswith(("cal_", "f_", "sku_", "wk_", "m_")) or k in ("_prev_nav_menu", "nav_menu"):
             del st.session_state[k]
     st.session_state["nav_menu"] = "① 출고 캘린더"
     st.session_state["_prev_nav_menu"] = "① 출고 캘린더"
@@ -1612,72 +3075,81 @@ if st.button("🔄 데이터 새로고침"):
     st.session_state["f_month"] = "전체"
     st.session_state["f_bp"] = "전체"
     safe_rerun()
-with st.spinner("Google Sheet RAW 로딩/전처리 중..."):
-    try:
-        raw, cal_agg = load_prepared_from_gsheet()
-    except Exception as e:
-        st.error("Google Sheet에서 RAW 데이터를 불러오지 못했습니다.")
-        st.code(str(e))
-        st.stop()
-# 재고 데이터 로드 (상품카테고리&입고일 탭)
-with st.spinner("재고/입고 데이터 로딩 중..."):
-    try:
-        inv_data = load_inventory_from_gsheet()
-    except Exception:
-        inv_data = pd.DataFrame(columns=["품목코드", "품목이름", "현재고", "1차입고일", "1차입고수량"])
+# ✅ 스냅샷 즉시 제공 + 백그라운드 재검증 (stale-while-revalidate)
+data_store = get_prepared_store()
+_forced = st.session_state.pop("_force_refresh", False)
+if data_store.current is None or _forced:
+    with st.spinner("Google Sheet RAW/재고 로딩·전처리 중..."):
+        try:
+            data_store.refresh(force=_forced)
+        except Exception as e:
+            if data_store.current is None:
+                st.error("Google Sheet에서 RAW 데이터를 불러오지 못했습니다.")
+                st.code(str(e))
+                st.stop()
+elif data_store.needs_revalidate():
+    data_store.revalidate_async()
+if data_store.errors:
+    failed = ", ".join(data_store.errors)
+    st.warning(f"Google Sheet 연결에 실패해({failed} 탭) 마지막으로 저장된 데이터를 표시합니다.", icon="⚠️")
+prepared = data_store.current
+raw, cal_agg, inv_data = prepared.raw, prepared.cal_agg, prepared.inv
 # =========================
 # Sidebar filters
 # =========================
 st.sidebar.header("필터")
 st.sidebar.caption("제품분류 고정: B0, B1")
+_age_txt = f"데이터 기준: {fmt_age(time.time() - prepared.fetched_at)}"
+if data_store.refreshing:
+    _age_txt += " · 🔄 백그라운드 갱신 중"
+else:
+    _next = data_store.next_prewarm_at() - time.time()
+    _age_txt += f" · 다음 갱신 {'곧' if _next < 60 else f'약 {int(_next // 60)}분 후'}"
+st.sidebar.caption(_age_txt)
+st.sidebar.caption(get_result_cache().stats_text())
+if data_store.last_timings:
+    st.sidebar.caption(
+        "데이터 로딩(병렬): " + " · ".join(f"{name} {sec:.2f}s" for name, sec in data_store.last_timings.items())
+    )
 st.session_state.setdefault("f_cust1", "전체")
 st.session_state.setdefault("f_cust2", "전체")
 st.session_state.setdefault("f_month", "전체")
 st.session_state.setdefault("f_bp", "전체")
-cust1_list = uniq_sorted(raw, COL_CUST1)
+f_index = get_filter_index(prepared.version, raw)
 with st.sidebar.form("filters_form", border=True):
-    sel_cust1 = safe_selectbox("거래처구분1", ["전체"] + cust1_list, key="f_cust1")
-    pool1 = raw.copy()
-    if sel_cust1 != "전체" and COL_CUST1 in pool1.columns:
-        pool1 = pool1[pool1[COL_CUST1].astype(str).str.strip() == sel_cust1]
-    cust2_list = uniq_sorted(pool1, COL_CUST2)
-    sel_cust2 = safe_selectbox("거래처구분2", ["전체"] + cust2_list, key="f_cust2")
-    pool2 = pool1.copy()
-    if sel_cust2 != "전체" and COL_CUST2 in pool2.columns:
-        pool2 = pool2[pool2[COL_CUST2].astype(str).str.strip() == sel_cust2]
-    month_labels = []
-    if "_month_label" in pool2.columns and "_month_key_num" in pool2.columns:
-        tmp = pool2[["_month_label", "_month_key_num"]].dropna().drop_duplicates("_month_label").copy()
-        tmp["_month_key_num"] = pd.to_numeric(tmp["_month_key_num"], errors="coerce")
-        tmp = tmp.dropna(subset=["_month_key_num"]).sort_values("_month_key_num")
-        month_labels = tmp["_month_label"].astype(str).tolist()
-    sel_month_label = safe_selectbox("월", ["전체"] + month_labels, key="f_month")
-    pool3 = pool2.copy()
-    if sel_month_label != "전체":
-        pool3 = pool3[pool3["_month_label"].astype(str) == str(sel_month_label)]
-    bp_list = uniq_sorted(pool3, COL_BP)
-    _ = safe_selectbox("BP명", ["전체"] + bp_list, key="f_bp")
+    # 선택지는 상위 선택 조합별로 인덱스에 메모 — 필터와 무관한 rerun 은 행을 다시 훑지 않음
+    sel_cust1 = safe_selectbox("거래처구분1", ["전체"] + f_index.options(COL_CUST1, {}), key="f_cust1")
+    sel_cust2 = safe_selectbox(
+        "거래처구분2", ["전체"] + f_index.options(COL_CUST2, {COL_CUST1: sel_cust1}), key="f_cust2"
+    )
+    sel_month_label = safe_selectbox(
+        "월", ["전체"] + f_index.options("_month_label", {COL_CUST1: sel_cust1, COL_CUST2: sel_cust2}), key="f_month"
+    )
+    _ = safe_selectbox(
+        "BP명",
+        ["전체"] + f_index.options(COL_BP, {COL_CUST1: sel_cust1, COL_CUST2: sel_cust2, "_month_label": sel_month_label}),
+        key="f_bp",
+    )
     st.form_submit_button("✅ 필터 적용", use_container_width=True)
-# ✅ view 구성
-pool1 = raw.copy()
-if st.session_state["f_cust1"] != "전체":
-    pool1 = pool1[pool1[COL_CUST1].astype(str).str.strip() == st.session_state["f_cust1"]]
-pool2 = pool1.copy()
-if st.session_state["f_cust2"] != "전체":
-    pool2 = pool2[pool2[COL_CUST2].astype(str).str.strip() == st.session_state["f_cust2"]]
-pool3 = pool2.copy()
-if st.session_state["f_month"] != "전체":
-    pool3 = pool3[pool3["_month_label"].astype(str) == str(st.session_state["f_month"])]
-df_view = pool3.copy()
-if st.session_state["f_bp"] != "전체":
-    df_view = df_view[df_view[COL_BP].astype(str).str.strip() == st.session_state["f_bp"]]
-
+# ✅ view 구성 — 위젯 값(safe_selectbox 가 보정한 session_state)만 기록, 열은 메뉴에서 select 할 때 물리화
+df_view = FilteredView(raw, f_index, {
+    COL_CUST1: st.session_state["f_cust1"],
+    COL_CUST2: st.session_state["f_cust2"],
+    "_month_label": st.session_state["f_month"],
+    COL_BP: st.session_state["f_bp"],
+})
 # ✅ v2.1 — pool2_with_bp: 월 필터 제외, 나머지 필터 적용 (③주차/④월간 비교용)
-pool2_with_bp = pool2.copy()
-if st.session_state["f_bp"] != "전체":
-    pool2_with_bp = pool2_with_bp[pool2_with_bp[COL_BP].astype(str).str.strip() == st.session_state["f_bp"]]
+pool2_with_bp = df_view.without("_month_label")
 
-k = compute_kpis(df_view)
+result_cache = get_result_cache()
+k = result_cache.get_or_compute(
+    ("kpi",) + df_view.cache_key,
+    lambda: compute_kpis(
+        df_view.select(VIEW_COLS_KPI),
+        view_orders(prepared.version, raw, df_view),
+        view_orders(prepared.version, raw, df_view, COL_BP),
+    ),
+)
 st.markdown(
     f"""
     <div class="kpi-wrap">
@@ -1731,16 +3203,15 @@ if prev_nav != nav:
 # =========================
 if nav == "① 출고 캘린더":
     init_calendar_state()
-    cal_pool = cal_agg.copy()
-    if st.session_state["f_cust1"] != "전체":
-        cal_pool = cal_pool[cal_pool[COL_CUST1].astype(str).str.strip() == st.session_state["f_cust1"]]
-    if st.session_state["f_cust2"] != "전체":
-        cal_pool = cal_pool[cal_pool[COL_CUST2].astype(str).str.strip() == st.session_state["f_cust2"]]
-    if st.session_state["f_bp"] != "전체":
-        cal_pool = cal_pool[cal_pool[COL_BP].astype(str).str.strip() == st.session_state["f_bp"]]
+    # 차원은 category(값은 이미 strip) → 코드 비교 마스크 한 번, 사본 없이 선택
+    cal_mask = np.ones(len(cal_agg), dtype=bool)
+    for _col, _key in ((COL_CUST1, "f_cust1"), (COL_CUST2, "f_cust2"), (COL_BP, "f_bp")):
+        if st.session_state[_key] != "전체":
+            cal_mask &= (cal_agg[_col] == st.session_state[_key]).to_numpy()
+    cal_pool = cal_agg if cal_mask.all() else cal_agg[cal_mask]
     if st.session_state["cal_ym"].strip() == "":
-        if (cal_pool is not None) and (not cal_pool.empty) and "_ship_ym" in cal_pool.columns:
-            st.session_state["cal_ym"] = cal_pool["_ship_ym"].dropna().astype(str).max()
+        if (cal_pool is not None) and (not cal_pool.empty) and "_ship_day" in cal_pool.columns:
+            st.session_state["cal_ym"] = day_from_key(cal_pool["_ship_day"].max()).strftime("%Y-%m")
         else:
             st.session_state["cal_ym"] = date.today().strftime("%Y-%m")
     ym = st.session_state["cal_ym"]
@@ -1777,17 +3248,18 @@ elif nav == "② SKU별 조회":
 
     if ignore_month:
         # 월 필터만 빼고 나머지(거래처구분1/2, BP) 필터는 그대로 적용
-        d_sku = pool2_with_bp.copy()
+        d_sku = pool2_with_bp.select(VIEW_COLS_SKU)
         st.caption("⚠️ 월 필터를 무시하고 전체 기간을 조회 중입니다.")
     else:
-        d_sku = df_view.copy()
+        d_sku = df_view.select(VIEW_COLS_SKU)
 
     if d_sku.empty:
         st.info("표시할 데이터가 없습니다. 필터 조건을 확인해 주세요.")
         st.stop()
 
     # ── 품목코드 풀 ──
-    sku_pool = d_sku[[COL_ITEM_CODE, COL_ITEM_NAME]].copy()
+    # 스키마 계약상 이미 strip 된 category — 중복 제거를 먼저 해서 문자열 정리는 SKU 수만큼만
+    sku_pool = d_sku[[COL_ITEM_CODE, COL_ITEM_NAME]].drop_duplicates(subset=[COL_ITEM_CODE])
     sku_pool[COL_ITEM_CODE] = sku_pool[COL_ITEM_CODE].astype(str).str.strip()
     sku_pool[COL_ITEM_NAME] = sku_pool[COL_ITEM_NAME].astype(str).str.strip()
     sku_pool = (
@@ -1838,7 +3310,7 @@ elif nav == "② SKU별 조회":
 
     # ── 복수 결과 선택 ──
     if len(matched) > 1:
-        options = (matched[COL_ITEM_CODE] + "  |  " + matched[COL_ITEM_NAME]).tolist()
+        options = (matched[COL_ITEM_CODE].astype(str) + "  |  " + matched[COL_ITEM_NAME].astype(str)).tolist()
         st.caption(f"검색 결과 {len(matched)}건 — 아래에서 조회할 SKU를 선택해 주세요.")
         sel_option = st.selectbox("검색 결과 선택", options, key="sku_candidate_pick")
         sel_code = sel_option.split("  |  ")[0].strip()
@@ -1846,7 +3318,7 @@ elif nav == "② SKU별 조회":
         sel_code = matched[COL_ITEM_CODE].iloc[0]
 
     # ── 선택 SKU 데이터 필터 ──
-    sku_df = d_sku[d_sku[COL_ITEM_CODE].astype(str).str.strip() == sel_code].copy()
+    sku_df = d_sku[d_sku[COL_ITEM_CODE] == sel_code].copy()
 
     if sku_df.empty:
         st.info("해당 SKU의 데이터가 없습니다.")
@@ -1854,7 +3326,7 @@ elif nav == "② SKU별 조회":
 
     sel_name_series = sku_df[COL_ITEM_NAME].dropna() if COL_ITEM_NAME in sku_df.columns else pd.Series([], dtype=str)
     sel_name = str(sel_name_series.iloc[0]) if not sel_name_series.empty else "-"
-    total_qty = int(round(float(pd.to_numeric(sku_df[COL_QTY], errors="coerce").fillna(0).sum()), 0))
+    total_qty = int(round(float(sku_df[COL_QTY].fillna(0).sum()), 0))
     # 주문번호 기준 중복 제외 건수
     order_cnt = _clean_nunique(sku_df[COL_ORDER_NO]) if COL_ORDER_NO in sku_df.columns else 0
 
@@ -1894,15 +3366,15 @@ elif nav == "② SKU별 조회":
         bp_base = sku_df.copy()
 
         # 출고일자 + BP명 단위로 집계 (출고일자 오름차순)
-        has_ship = COL_SHIP in bp_base.columns and "_ship_date" in bp_base.columns
+        has_ship = COL_SHIP in bp_base.columns and "_ship_day" in bp_base.columns
 
         if has_ship:
-            grp_cols = ["_ship_date", COL_BP]
+            grp_cols = ["_ship_day", COL_BP]
         else:
             grp_cols = [COL_BP]
 
         bp_summary = (
-            bp_base.groupby(grp_cols, dropna=False)[COL_QTY]
+            bp_base.groupby(grp_cols, dropna=False, observed=True)[COL_QTY]
             .sum(min_count=1)
             .reset_index()
             .rename(columns={COL_QTY: "요청수량_합"})
@@ -1914,10 +3386,10 @@ elif nav == "② SKU별 조회":
 
         # 출고일자 문자열 변환 및 오름차순 정렬
         if has_ship:
-            bp_summary["출고일자"] = bp_summary["_ship_date"].apply(
-                lambda x: str(x) if pd.notna(x) else ""
+            bp_summary["출고일자"] = bp_summary["_ship_day"].apply(
+                lambda k: str(day_from_key(k)) if pd.notna(k) else ""
             )
-            bp_summary = bp_summary.drop(columns=["_ship_date"])
+            bp_summary = bp_summary.drop(columns=["_ship_day"])
             bp_summary = bp_summary.sort_values(["출고일자", COL_BP], ascending=[False, True])
         else:
             bp_summary = bp_summary.sort_values(COL_BP)
@@ -1925,7 +3397,7 @@ elif nav == "② SKU별 조회":
         # 거래처구분1 최빈값 매핑
         if COL_CUST1 in bp_base.columns:
             cust1_map = (
-                bp_base.groupby(COL_BP, dropna=False)[COL_CUST1]
+                bp_base.groupby(COL_BP, dropna=False, observed=True)[COL_CUST1]
                 .agg(lambda s: s.dropna().mode().iloc[0] if not s.dropna().empty else "")
                 .reset_index()
                 .rename(columns={COL_CUST1: "거래처구분1"})
@@ -1959,9 +3431,8 @@ elif nav == "② SKU별 조회":
             st.subheader("📊 월별 채널(BP명) 출고 현황")
             st.caption("각 셀: 해당 월·해당 BP의 요청수량 합계 / 마지막 행: 합계")
 
-            pivot_src = sku_df.dropna(subset=["_ship_ym"]).copy()
-            pivot_src["_ship_ym"] = pivot_src["_ship_ym"].astype(str).str.strip()
-            pivot_src = pivot_src[pivot_src["_ship_ym"] != ""]
+            # _ship_ym 은 날짜 차원 라벨 category — 출고일(일 키) 있는 행만
+            pivot_src = sku_df[sku_df["_ship_day"].notna().to_numpy()]
 
             if pivot_src.empty:
                 st.info("월별 채널 데이터가 없습니다.")
@@ -1969,7 +3440,7 @@ elif nav == "② SKU별 조회":
                 # _ship_ym 은 이미 "YYYY-MM" 형식 → 정렬만 하면 됨
                 pivot_long = (
                     pivot_src
-                    .groupby(["_ship_ym", COL_BP], dropna=False)[COL_QTY]
+                    .groupby(["_ship_ym", COL_BP], dropna=False, observed=True)[COL_QTY]
                     .sum(min_count=1)
                     .reset_index()
                     .rename(columns={COL_QTY: "qty"})
@@ -1984,6 +3455,7 @@ elif nav == "② SKU별 조회":
                     values="qty",
                     aggfunc="sum",
                     fill_value=0,
+                    observed=True,
                 ).reset_index()
                 wide.columns.name = None
 
@@ -2012,7 +3484,7 @@ elif nav == "② SKU별 조회":
         st.subheader("📅 월별 요청수량 추이")
 
         month_summary = (
-            sku_df.groupby(["_month_label", "_month_key_num"], dropna=False)[COL_QTY]
+            sku_df.groupby(["_month_label", "_month_key_num"], dropna=False, observed=True)[COL_QTY]
             .sum(min_count=1)
             .reset_index()
             .rename(columns={COL_QTY: "요청수량_합"})
@@ -2063,28 +3535,32 @@ elif nav == "② SKU별 조회":
 elif nav == "③ 주차요약":
     st.subheader("주차요약")
     # ✅ v2.1: 월 필터를 무시하고 전체 기간 사용 (전주 비교를 위해)
-    d = pool2_with_bp.copy()
+    # 주차 목록/추이는 출고 큐브, Top3·코멘트·급증 리포트는 선택/전주 행만 물리화
+    d = slice_for_view(get_shipment_cube(prepared.version, raw), pool2_with_bp)
     if d.empty:
         st.info("표시할 데이터가 없습니다.")
         st.stop()
     if "_week_label" not in d.columns or "_week_key_num" not in d.columns:
         st.warning("주차 라벨/키 컬럼이 없습니다.")
         st.stop()
-    tmp = d[["_week_label", "_week_key_num"]].dropna(subset=["_week_label", "_week_key_num"]).drop_duplicates("_week_label").copy()
-    tmp["_week_key_num"] = pd.to_numeric(tmp["_week_key_num"], errors="coerce")
-    tmp = tmp.dropna(subset=["_week_key_num"]).sort_values("_week_key_num")
-    week_list = tmp["_week_label"].astype(str).tolist()
+    wk_all = (
+        d.dropna(subset=["_week_label", "_week_key_num"])
+        .groupby(["_week_label", "_week_key_num"], dropna=False, observed=True)[COL_QTY]
+        .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
+        .sort_values("_week_key_num")
+    )
+    week_list = wk_all["_week_label"].astype(str).tolist()
     if not week_list:
         st.info("주차 목록이 없습니다.")
         st.stop()
     sel_week = st.selectbox("주차 선택", week_list, index=len(week_list) - 1, key="wk_sel_week")
-    wdf = d[d["_week_label"].astype(str) == str(sel_week)].copy()
+    wdf = pool2_with_bp.where("_week_label", sel_week).select(VIEW_COLS_PERIOD)
     cur_idx = week_list.index(sel_week) if sel_week in week_list else None
     prev_wdf = pd.DataFrame()
     prev_week = None
     if cur_idx is not None and cur_idx > 0:
         prev_week = week_list[cur_idx - 1]
-        prev_wdf = d[d["_week_label"].astype(str) == str(prev_week)].copy()
+        prev_wdf = pool2_with_bp.where("_week_label", prev_week).select(VIEW_COLS_PERIOD)
     comment_items = []
     comment_items += period_kpi_delta_comment(cur_df=wdf, prev_df=prev_wdf)
     comment_items += category_top_comment(wdf, top_n=2)
@@ -2098,15 +3574,9 @@ elif nav == "③ 주차요약":
     # ── 최근 12주 출고 추이 바 차트 ──
     st.divider()
     st.subheader("📊 최근 12주 출고 추이")
-    wk_agg_src = d.copy()
-    wk_agg_src["_week_key_num"] = pd.to_numeric(wk_agg_src["_week_key_num"], errors="coerce")
-    wk_agg_src = wk_agg_src.dropna(subset=["_week_label", "_week_key_num"])
-    wk_agg = (
-        wk_agg_src.groupby(["_week_label", "_week_key_num"], dropna=False)[COL_QTY]
-        .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
-    )
+    wk_agg = wk_all.copy()
     wk_agg["요청수량"] = pd.to_numeric(wk_agg["요청수량"], errors="coerce").fillna(0)
-    wk_agg = wk_agg.sort_values("_week_key_num").tail(12)
+    wk_agg = wk_agg.tail(12)
     if not wk_agg.empty:
         bar_colors = ["#ef4444" if lbl == sel_week else "#3b82f6" for lbl in wk_agg["_week_label"]]
         fig_wk = px.bar(
@@ -2127,7 +3597,7 @@ elif nav == "③ 주차요약":
             st.info("데이터가 없습니다.")
         else:
             bp_top3 = (
-                wdf.groupby(COL_BP, dropna=False)[COL_QTY]
+                wdf.groupby(COL_BP, dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index()
                 .rename(columns={COL_QTY: "요청수량_합"})
             )
@@ -2141,7 +3611,7 @@ elif nav == "③ 주차요약":
             st.info("데이터가 없습니다.")
         else:
             sku_top3 = (
-                wdf.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY]
+                wdf.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index()
                 .rename(columns={COL_QTY: "요청수량_합"})
             )
@@ -2168,16 +3638,18 @@ elif nav == "③ 주차요약":
 elif nav == "④ 월간요약":
     st.subheader("월간요약")
     # ✅ v2.1: 월 필터를 무시하고 전체 기간 사용 (전월 비교를 위해)
-    d = pool2_with_bp.copy()
+    # 월 목록/월별 차트는 출고 큐브, 리포트 집계는 (캐시에 없을 때만) 롤업 열, 코멘트·급증 리포트는 선택/전월/다음월 행만 물리화
+    d = slice_for_view(get_shipment_cube(prepared.version, raw), pool2_with_bp)
     if d.empty:
         st.info("표시할 데이터가 없습니다.")
         st.stop()
     if "_month_label" not in d.columns or "_month_key_num" not in d.columns:
         st.warning("월 라벨/키 컬럼이 없습니다.")
         st.stop()
-    tmp = d[["_month_label", "_month_key_num"]].dropna(subset=["_month_label", "_month_key_num"]).drop_duplicates("_month_label").copy()
-    tmp["_month_key_num"] = pd.to_numeric(tmp["_month_key_num"], errors="coerce")
-    tmp = tmp.dropna(subset=["_month_key_num"]).sort_values("_month_key_num")
+    tmp = (
+        d[["_month_label", "_month_key_num"]].dropna()
+        .drop_duplicates("_month_label").sort_values("_month_key_num")
+    )
     month_list = tmp["_month_label"].astype(str).tolist()
     if not month_list:
         st.info("월 목록이 없습니다. RAW의 '년', '월1' 컬럼을 확인해 주세요.")
@@ -2191,18 +3663,18 @@ elif nav == "④ 월간요약":
             default_month_idx = month_list.index(sidebar_month)
 
     sel_month = st.selectbox("월 선택", month_list, index=default_month_idx, key="m_sel_month")
-    mdf = d[d["_month_label"].astype(str) == str(sel_month)].copy()
+    mdf = pool2_with_bp.where("_month_label", sel_month).select(VIEW_COLS_PERIOD)
     cur_idx = month_list.index(sel_month) if sel_month in month_list else None
     prev_mdf = pd.DataFrame()
     prev_month = None
     if cur_idx is not None and cur_idx > 0:
         prev_month = month_list[cur_idx - 1]
-        prev_mdf = d[d["_month_label"].astype(str) == str(prev_month)].copy()
+        prev_mdf = pool2_with_bp.where("_month_label", prev_month).select(VIEW_COLS_PERIOD)
     next_mdf = pd.DataFrame()
     next_month = None
     if cur_idx is not None and cur_idx < len(month_list) - 1:
         next_month = month_list[cur_idx + 1]
-        next_mdf = d[d["_month_label"].astype(str) == str(next_month)].copy()
+        next_mdf = pool2_with_bp.where("_month_label", next_month).select(VIEW_COLS_PERIOD)
     comment_items = []
     comment_items += period_kpi_delta_comment(cur_df=mdf, prev_df=prev_mdf)
     comment_items += category_top_comment(mdf, top_n=2)
@@ -2215,11 +3687,9 @@ elif nav == "④ 월간요약":
         st.caption("※ 사이드바 월 필터와 무관하게 전체 기간 내 월을 비교합니다.")
     # ── 월별 누적 바 차트 (해외B2B / 국내B2B) ──
     if "_ship_ym" in d.columns and COL_CUST1 in d.columns:
-        m_chart_src = d.dropna(subset=["_ship_ym"]).copy()
-        m_chart_src["_ship_ym"] = m_chart_src["_ship_ym"].astype(str).str.strip()
-        m_chart_src = m_chart_src[m_chart_src["_ship_ym"] != ""]
+        m_chart_src = d[d["_ship_ym"].notna().to_numpy()]
         m_chart_data = (
-            m_chart_src.groupby(["_ship_ym", COL_CUST1], dropna=False)[COL_QTY]
+            m_chart_src.groupby(["_ship_ym", COL_CUST1], dropna=False, observed=True)[COL_QTY]
             .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
         )
         m_chart_data = m_chart_data[m_chart_data[COL_CUST1].isin(["해외B2B", "국내B2B"])].copy()
@@ -2239,31 +3709,43 @@ elif nav == "④ 월간요약":
                 xaxis=dict(type="category"),
             )
             st.plotly_chart(fig_m, use_container_width=True)
-    st.markdown("### 📝 월간 리포트 생성")
-    cbtn1, cbtn2 = st.columns([1.2, 1.0], vertical_alignment="center")
-    with cbtn1:
-        if st.button("📝 월간 리포트 생성", use_container_width=True, key="btn_make_monthly_report"):
-            report = build_monthly_share_report(
-                all_df=raw,
-                sel_month_label=sel_month,
-                cur_df=mdf,
-                prev_df=prev_mdf,
-                next_df=(next_mdf if (next_month is not None and not next_mdf.empty) else None),
+    st.markdown("### 📝 월간 공유용 리포트")
+    # 리포트는 (데이터 버전, 필터, 월) 로 캐시 — 선택 월은 선택/전월/차월 3개월 집계로, 일괄 생성은 전체 월 집계 한 장으로 렌더
+    bp_history = get_bp_month_history(prepared.version, raw)
+    sel_months = [m for m in (prev_month, sel_month, next_month) if m is not None]
+    report = get_monthly_reports(
+        result_cache, pool2_with_bp.cache_key, [sel_month],
+        lambda: MonthlyReportEngine(
+            build_report_aggregate(pool2_with_bp.select(VIEW_COLS_ROLLUP), sel_months), bp_history, sel_months
+        ),
+    )[sel_month]
+    st.caption("아래 텍스트를 그대로 복사해서 슬랙/내부 공유에 사용하세요. (유니코드 이모지 적용)")
+    st.text_area(
+        "월간 공유용 리포트",
+        value=report,
+        height=520,
+    )
+    with st.expander(f"🗂️ 전체 월 리포트 일괄 생성 ({len(month_list)}개월 · ZIP)", expanded=False):
+        st.caption("월 필터를 제외한 현재 필터 기준으로 월 목록의 모든 월 리포트를 한 번에 만듭니다. 이미 만든 월은 캐시에서 꺼냅니다.")
+        if st.button("🗂️ 전체 월 리포트 생성", use_container_width=True, key="btn_batch_monthly_report"):
+            st.session_state["m_batch_report_key"] = pool2_with_bp.cache_key
+        # 필터가 바뀌면 다시 누를 때까지 만들지 않음
+        if st.session_state.get("m_batch_report_key") == pool2_with_bp.cache_key:
+            reports = get_monthly_reports(
+                result_cache, pool2_with_bp.cache_key, month_list,
+                lambda: MonthlyReportEngine(
+                    build_report_aggregate(pool2_with_bp.select(VIEW_COLS_ROLLUP), month_list), bp_history, month_list
+                ),
+            )
+            month_tags = dict(zip(tmp["_month_label"].astype(str), tmp["_month_key_num"].astype(int).astype(str)))
+            st.download_button(
+                f"📥 월간 리포트 {len(reports)}개월 ZIP 다운로드",
+                data=monthly_reports_zip(reports, month_tags),
+                file_name=f"월간리포트_{month_tags[month_list[0]]}-{month_tags[month_list[-1]]}.zip",
+                mime="application/zip",
+                use_container_width=True,
+                key="dl_monthly_report_zip",
             )
-            st.session_state["monthly_report_text"] = report
-            safe_rerun()
-    with cbtn2:
-        if st.button("🧹 리포트 지우기", use_container_width=True, key="btn_clear_monthly_report"):
-            if "monthly_report_text" in st.session_state:
-                del st.session_state["monthly_report_text"]
-            safe_rerun()
-    if st.session_state.get("monthly_report_text", "").strip():
-        st.caption("아래 텍스트를 그대로 복사해서 슬랙/내부 공유에 사용하세요. (유니코드 이모지 적용)")
-        st.text_area(
-            "월간 공유용 리포트",
-            value=st.session_state["monthly_report_text"],
-            height=520,
-        )
     st.divider()
     st.subheader("전월 대비 급증 SKU 리포트 (+30% 이상 증가)")
     if prev_month is None:
@@ -2283,27 +3765,15 @@ elif nav == "⑤ 국가별 조회":
     st.subheader("국가별 조회 (거래처구분2 기준)")
     if not need_cols(df_view, [COL_CUST2, COL_QTY, COL_LT2, COL_ORDER_NO], "국가별 조회"):
         st.stop()
-    base = df_view.copy()
-    out = base.groupby(COL_CUST2, dropna=False).agg(
-        요청수량_합=(COL_QTY, "sum"),
-        평균_리드타임_작업완료기준=(COL_LT2, "mean"),
-        리드타임_중간값_작업완료기준=(COL_LT2, "median"),
-        p90_tmp=(COL_LT2, lambda s: s.quantile(0.9)),
-        집계행수_표본=(COL_CUST2, "size"),
-    ).reset_index()
-    out = out.rename(columns={"p90_tmp": "리드타임 느린 상위10% 기준(P90)"})
-    tmp2 = base[[COL_CUST2, COL_ORDER_NO]].copy()
-    tmp2["_ord"] = tmp2[COL_ORDER_NO].astype(str).str.strip().replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
-    rep_cnt = tmp2.dropna(subset=["_ord"]).groupby(COL_CUST2)["_ord"].nunique()
-    out["출고건수"] = out[COL_CUST2].astype(str).map(rep_cnt).fillna(0).astype(int)
-    for c in ["평균_리드타임_작업완료기준", "리드타임_중간값_작업완료기준", "리드타임 느린 상위10% 기준(P90)"]:
-        out[c] = pd.to_numeric(out[c], errors="coerce").round(2)
-    out["요청수량_합"] = pd.to_numeric(out["요청수량_합"], errors="coerce").fillna(0).round(0).astype("Int64")
-    out["집계행수_표본"] = pd.to_numeric(out["집계행수_표본"], errors="coerce").fillna(0).astype("Int64")
-    out = out.sort_values("요청수량_합", ascending=False, na_position="last")
+    out = result_cache.get_or_compute(
+        ("country",) + df_view.cache_key,
+        lambda: build_country_summary(
+            df_view, view_orders(prepared.version, raw, df_view, COL_CUST2), get_lead_time_sketch(prepared.version, raw)
+        ),
+    )
     render_pretty_table(out, height=520, wrap_cols=[COL_CUST2], number_cols=["요청수량_합", "출고건수", "집계행수_표본"])
     render_download_buttons(out, "국가별_조회", key_suffix="country")
-    st.caption("※ P90은 '느린 상위 10%' 경계값(리드타임이 큰 구간)입니다.")
+    st.caption("※ P90/P95는 '느린 상위 10%/5%' 경계값(리드타임이 큰 구간)입니다.")
 # =========================
 # ⑥ BP명별 조회
 # =========================
@@ -2311,26 +3781,12 @@ elif nav == "⑥ BP명별 조회":
     st.subheader("BP명별 조회")
     if not need_cols(df_view, [COL_BP, COL_QTY, COL_LT2, COL_ORDER_NO], "BP명별 조회"):
         st.stop()
-    base = df_view.copy()
-    out = base.groupby(COL_BP, dropna=False).agg(
-        요청수량_합=(COL_QTY, "sum"),
-        평균_리드타임_작업완료기준=(COL_LT2, "mean"),
-        리드타임_중간값_작업완료기준=(COL_LT2, "median"),
-        최근_출고일=(COL_SHIP, "max"),
-        최근_작업완료일=(COL_DONE, "max"),
-        집계행수_표본=(COL_BP, "size"),
-    ).reset_index()
-    tmp3 = base[[COL_BP, COL_ORDER_NO]].copy()
-    tmp3["_ord"] = tmp3[COL_ORDER_NO].astype(str).str.strip().replace({"": pd.NA, "nan": pd.NA, "None": pd.NA})
-    rep_cnt2 = tmp3.dropna(subset=["_ord"]).groupby(COL_BP)["_ord"].nunique()
-    out["출고건수"] = out[COL_BP].astype(str).map(rep_cnt2).fillna(0).astype(int)
-    out["요청수량_합"] = pd.to_numeric(out["요청수량_합"], errors="coerce").fillna(0).round(0).astype("Int64")
-    for c in ["평균_리드타임_작업완료기준", "리드타임_중간값_작업완료기준"]:
-        out[c] = pd.to_numeric(out[c], errors="coerce").round(2)
-    out["최근_출고일"] = out["최근_출고일"].apply(fmt_date)
-    out["최근_작업완료일"] = out["최근_작업완료일"].apply(fmt_date)
-    out["집계행수_표본"] = pd.to_numeric(out["집계행수_표본"], errors="coerce").fillna(0).astype("Int64")
-    out = out.sort_values("요청수량_합", ascending=False, na_position="last")
+    out = result_cache.get_or_compute(
+        ("bp",) + df_view.cache_key,
+        lambda: build_bp_summary(
+            df_view, view_orders(prepared.version, raw, df_view, COL_BP), get_lead_time_sketch(prepared.version, raw)
+        ),
+    )
     render_pretty_table(out, height=520, wrap_cols=[COL_BP], number_cols=["요청수량_합", "출고건수", "집계행수_표본"])
     render_download_buttons(out, "BP명별_조회", key_suffix="bp")
 # =========================
@@ -2340,16 +3796,16 @@ elif nav == "⑦ 트렌드 분석":
     st.subheader("트렌드 분석")
     st.caption("※ 트렌드 분석은 월 필터를 무시하고 전체 기간 기준으로 표시됩니다. (거래처구분1/2, BP 필터는 반영)")
 
-    # 트렌드용 베이스: 월 필터 제외, 나머지 필터 적용
-    trend_base = pool2_with_bp.copy()
+    # 트렌드용 베이스: 월 필터 제외, 나머지 필터 적용 — 출고월 × 거래처구분 × BP 롤업(섹션 1/2/4)은 출고 큐브,
+    # 품목이 필요한 섹션 3 만 롤업 열을 물리화
+    trend_base = slice_for_view(get_shipment_cube(prepared.version, raw), pool2_with_bp)
 
     if trend_base.empty or "_ship_ym" not in trend_base.columns:
         st.info("표시할 데이터가 없습니다.")
         st.stop()
 
-    trend_base = trend_base.dropna(subset=["_ship_ym"]).copy()
-    trend_base["_ship_ym"] = trend_base["_ship_ym"].astype(str).str.strip()
-    trend_base = trend_base[trend_base["_ship_ym"] != ""]
+    # _ship_ym 은 날짜 차원 라벨 category — 출고일 있는 행만
+    trend_base = trend_base[trend_base["_ship_ym"].notna().to_numpy()]
 
     TREND_TOP_N = 10
     COLOR_OVERSEAS = "#3b82f6"
@@ -2361,7 +3817,7 @@ elif nav == "⑦ 트렌드 분석":
     # ────────────────────────────────────────────
     st.subheader("📈 섹션 1 · 전체 월별 출고 추이")
     s1_data = (
-        trend_base.groupby(["_ship_ym", COL_CUST1], dropna=False)[COL_QTY]
+        trend_base.groupby(["_ship_ym", COL_CUST1], dropna=False, observed=True)[COL_QTY]
         .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
     )
     s1_data = s1_data[s1_data[COL_CUST1].isin(["해외B2B", "국내B2B"])].copy()
@@ -2397,12 +3853,12 @@ elif nav == "⑦ 트렌드 분석":
                 st.info(f"{_cust1_2} 데이터가 없습니다.")
                 continue
             top_bps2 = (
-                sub2.groupby(COL_BP, dropna=False)[COL_QTY].sum()
+                sub2.groupby(COL_BP, dropna=False, observed=True)[COL_QTY].sum()
                 .sort_values(ascending=False).head(TREND_TOP_N).index.tolist()
             )
             s2_data = (
                 sub2[sub2[COL_BP].isin(top_bps2)]
-                .groupby(["_ship_ym", COL_BP], dropna=False)[COL_QTY]
+                .groupby(["_ship_ym", COL_BP], dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
             )
             s2_data["요청수량"] = pd.to_numeric(s2_data["요청수량"], errors="coerce").fillna(0)
@@ -2430,26 +3886,28 @@ elif nav == "⑦ 트렌드 분석":
     st.divider()
     st.subheader("📦 섹션 3 · Top10 SKU 월별 추이")
     tab_s3_ovs, tab_s3_dom = st.tabs(["🟦 해외B2B (JP/CN/EU/MO/공용 구분)", "🟩 국내B2B"])
+    sku_base = pool2_with_bp.select(VIEW_COLS_ROLLUP)
+    sku_base = sku_base[sku_base["_ship_day"].notna().to_numpy()]
 
     with tab_s3_ovs:
-        sub3_o = _filter_cust1(trend_base, "해외B2B").copy()
+        sub3_o = _filter_cust1(sku_base, "해외B2B").copy()
         if sub3_o.empty:
             st.info("해외B2B 데이터가 없습니다.")
         else:
             sub3_o["__country"] = sub3_o[COL_ITEM_NAME].astype(str).apply(_extract_overseas_country)
             top_skus_o = (
-                sub3_o.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY].sum()
+                sub3_o.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY].sum()
                 .sort_values(ascending=False).head(TREND_TOP_N).reset_index()
             )
             top_codes_o = top_skus_o[COL_ITEM_CODE].tolist()
             sub3_o_top = sub3_o[sub3_o[COL_ITEM_CODE].isin(top_codes_o)].copy()
             sku_label_o = (
                 sub3_o_top.drop_duplicates(subset=[COL_ITEM_CODE])
-                .assign(lbl=lambda x: x[COL_ITEM_CODE] + " [" + x["__country"] + "]")
+                .assign(lbl=lambda x: x[COL_ITEM_CODE].astype(str) + " [" + x["__country"].astype(str) + "]")
                 .set_index(COL_ITEM_CODE)["lbl"].to_dict()
             )
             s3_o = (
-                sub3_o_top.groupby(["_ship_ym", COL_ITEM_CODE, "__country"], dropna=False)[COL_QTY]
+                sub3_o_top.groupby(["_ship_ym", COL_ITEM_CODE, "__country"], dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
             )
             s3_o["요청수량"] = pd.to_numeric(s3_o["요청수량"], errors="coerce").fillna(0)
@@ -2488,23 +3946,23 @@ elif nav == "⑦ 트렌드 분석":
                     st.plotly_chart(fig3_o2, use_container_width=True)
 
     with tab_s3_dom:
-        sub3_d = _filter_cust1(trend_base, "국내B2B").copy()
+        sub3_d = _filter_cust1(sku_base, "국내B2B").copy()
         if sub3_d.empty:
             st.info("국내B2B 데이터가 없습니다.")
         else:
             top_skus_d = (
-                sub3_d.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False)[COL_QTY].sum()
+                sub3_d.groupby([COL_ITEM_CODE, COL_ITEM_NAME], dropna=False, observed=True)[COL_QTY].sum()
                 .sort_values(ascending=False).head(TREND_TOP_N).reset_index()
             )
             top_codes_d = top_skus_d[COL_ITEM_CODE].tolist()
             sub3_d_top = sub3_d[sub3_d[COL_ITEM_CODE].isin(top_codes_d)].copy()
             sku_label_d = (
                 sub3_d_top.drop_duplicates(subset=[COL_ITEM_CODE])
-                .assign(lbl=lambda x: x[COL_ITEM_CODE] + "  " + x[COL_ITEM_NAME].astype(str).str[:14])
+                .assign(lbl=lambda x: x[COL_ITEM_CODE].astype(str) + "  " + x[COL_ITEM_NAME].astype(str).str[:14])
                 .set_index(COL_ITEM_CODE)["lbl"].to_dict()
             )
             s3_d = (
-                sub3_d_top.groupby(["_ship_ym", COL_ITEM_CODE], dropna=False)[COL_QTY]
+                sub3_d_top.groupby(["_ship_ym", COL_ITEM_CODE], dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index().rename(columns={COL_QTY: "요청수량"})
             )
             s3_d["요청수량"] = pd.to_numeric(s3_d["요청수량"], errors="coerce").fillna(0)
@@ -2551,17 +4009,17 @@ elif nav == "⑦ 트렌드 분석":
                 st.info(f"{_cust1_4} 데이터가 없습니다.")
                 continue
             top3_bps = (
-                sub4.groupby(COL_BP, dropna=False)[COL_QTY].sum()
+                sub4.groupby(COL_BP, dropna=False, observed=True)[COL_QTY].sum()
                 .sort_values(ascending=False).head(3).index.tolist()
             )
             monthly_total4 = (
-                sub4.groupby("_ship_ym", dropna=False)[COL_QTY]
+                sub4.groupby("_ship_ym", dropna=False, observed=True)[COL_QTY]
                 .sum().reset_index().rename(columns={COL_QTY: "total"})
             )
             monthly_total4["total"] = pd.to_numeric(monthly_total4["total"], errors="coerce").fillna(0)
             s4_bp = (
                 sub4[sub4[COL_BP].isin(top3_bps)]
-                .groupby(["_ship_ym", COL_BP], dropna=False)[COL_QTY]
+                .groupby(["_ship_ym", COL_BP], dropna=False, observed=True)[COL_QTY]
                 .sum(min_count=1).reset_index().rename(columns={COL_QTY: "bp_qty"})
             )
             s4_bp["bp_qty"] = pd.to_numeric(s4_bp["bp_qty"], errors="coerce").fillna(0)
@@ -2591,7 +4049,7 @@ elif nav == "⑦ 트렌드 분석":
 # =========================
 elif nav == "⑧ 부족예상재고":
     st.subheader("⑧ 부족 예상 재고 알람 (해외B2B)")
-    st.caption("※ 해외B2B 기준 | 전월 대비 30% 이상 출고 증가 품목 대상 | 최근 90일 평균출고 기반 소진일수 산출")
+    st.caption("※ 해외B2B 기준 | 전월 대비 30% 이상 출고 증가 품목 대상 | 최근 N일 평균출고(기본) 또는 주별 수요 예측(추세 반영) 기반 소진일수 산출")
 
     if inv_data.empty:
         st.warning("재고/입고 데이터를 불러올 수 없습니다. (상품카테고리&입고일 탭 확인 필요)")
@@ -2603,9 +4061,21 @@ elif nav == "⑧ 부족예상재고":
                 lookback = st.slider("일평균 출고 계산 기간 (일)", 30, 180, 90, step=10, key="shortage_lookback")
             with col_s2:
                 threshold = st.slider("알람 기준 소진일수 (일)", 7, 60, 30, step=7, key="shortage_threshold")
+            method = st.radio(
+                "소진일수 산출 기준", list(SHORTAGE_METHODS), format_func=SHORTAGE_METHODS.get,
+                horizontal=True, key="shortage_method",
+            )
+        basis_text = f"최근{lookback}일 평균출고" if method == "average" else "수요 예측(추세 반영)"
 
         # 알람 분석 실행
-        alert_result = build_shortage_alert(raw, inv_data, lookback_days=lookback, alert_threshold_days=threshold)
+        scenarios = get_shortage_scenarios(prepared.version, prepared.inv_version, date.today().isoformat(), raw, inv_data)
+        if lookback in scenarios.lookbacks and threshold in scenarios.thresholds:
+            alert_result = scenarios.result(lookback, threshold, method)
+        else:
+            alert_result = build_shortage_alert(
+                raw, inv_data, lookback_days=lookback, alert_threshold_days=threshold,
+                ship_matrix=get_daily_ship_matrix(prepared.version, raw), method=method,
+            )
 
         # 요약 KPI
         if alert_result.empty or alert_result[alert_result["위험등급"] != "안전"].empty:
@@ -2639,6 +4109,7 @@ elif nav == "⑧ 부족예상재고":
                 # 포맷팅
                 display_df["현재고"] = display_df["현재고"].apply(lambda x: f"{int(x):,}" if pd.notna(x) else "-")
                 display_df["최근일평균출고"] = display_df["최근일평균출고"].apply(lambda x: f"{x:,.1f}" if pd.notna(x) else "-")
+                display_df["예측일평균출고"] = display_df["예측일평균출고"].apply(lambda x: f"{x:,.1f}" if pd.notna(x) else "-")
                 display_df["소진예상일수"] = display_df["소진예상일수"].apply(lambda x: f"{x:.0f}일" if x != float("inf") else "-")
                 display_df["이전월출고"] = display_df["이전월출고"].apply(lambda x: f"{int(x):,}" if pd.notna(x) else "-")
                 display_df["현재월출고"] = display_df["현재월출고"].apply(lambda x: f"{int(x):,}" if pd.notna(x) else "-")
@@ -2646,7 +4117,7 @@ elif nav == "⑧ 부족예상재고":
                 display_df["1차입고일"] = display_df["1차입고일"].apply(lambda x: x.strftime("%Y-%m-%d") if pd.notna(x) else "미정")
                 display_df["1차입고수량"] = display_df["1차입고수량"].apply(lambda x: f"{int(x):,}" if pd.notna(x) and x > 0 else "-")
                 display_cols = [
-                    COL_ITEM_CODE, COL_ITEM_NAME, "위험등급", "현재고", "최근일평균출고",
+                    COL_ITEM_CODE, COL_ITEM_NAME, "위험등급", "현재고", "최근일평균출고", "예측일평균출고",
                     "소진예상일수", "소진예상일", "1차입고일", "1차입고수량",
                     "입고전소진여부", "이전월출고", "현재월출고", "증가배수",
                 ]
@@ -2678,7 +4149,7 @@ elif nav == "⑧ 부족예상재고":
 
             # Slack 공유 기능
             st.subheader("Slack 공유")
-            slack_msg = build_shortage_slack_message(alert_active)
+            slack_msg = build_shortage_slack_message(alert_active, basis=basis_text)
             with st.expander("Slack 메시지 미리보기", expanded=False):
                 st.code(slack_msg, language=None)
             col_copy, col_info = st.columns([1, 2])
@@ -2693,13 +4164,59 @@ elif nav == "⑧ 부족예상재고":
             with col_info:
                 st.caption("다운로드한 텍스트를 Slack 채널에 붙여넣기 하세요.")
 
+        # 전 품목 재고 추이 (예측 수요 + N차 입고)
+        with st.expander(f"📈 전 품목 재고 추이 예측 (향후 {STOCK_PROJECTION_DAYS}일, 전 채널 예측 수요 + N차 입고 반영)", expanded=False):
+            proj = get_stock_projection(prepared.version, prepared.inv_version, date.today().isoformat(), raw, inv_data)
+            proj_sum = proj.summary
+            short_items = proj_sum[proj_sum["첫품절일"].notna()].sort_values(["첫품절일", "부족수량"], ascending=[True, False])
+            st.caption(
+                f"※ 전 채널(해외·국내B2B) 수요 예측 기준 · 오늘 입고분 포함 | {STOCK_PROJECTION_DAYS}일 안에 품절 예상 {len(short_items):,}개 / 전체 {len(proj_sum):,}개 품목"
+                " | 부족수량 = 기간 중 최대 미충족 수요"
+            )
+            if short_items.empty:
+                st.success(f"향후 {STOCK_PROJECTION_DAYS}일 안에 품절이 예상되는 품목이 없습니다.")
+            else:
+                proj_view = short_items.copy()
+                proj_view["첫품절일"] = proj_view["첫품절일"].dt.strftime("%Y-%m-%d")
+                proj_view["재고커버일수"] = proj_view["재고커버일수"].apply(lambda x: f"{x:.0f}일")
+                for c in ["현재고", "입고예정수량", "부족수량"]:
+                    proj_view[c] = proj_view[c].apply(lambda x: f"{int(x):,}")
+                proj_view["예측일평균출고"] = proj_view["예측일평균출고"].apply(lambda x: f"{x:,.1f}")
+                st.dataframe(proj_view, use_container_width=True, hide_index=True)
+                pick = st.selectbox(
+                    "재고 추이 품목", short_items[COL_ITEM_CODE].tolist(),
+                    format_func=lambda c: f"{c} {proj_sum.loc[proj_sum[COL_ITEM_CODE] == c, COL_ITEM_NAME].iloc[0]}",
+                    key="stock_projection_item",
+                )
+                row = int(np.flatnonzero(proj_sum[COL_ITEM_CODE].to_numpy() == pick)[0])
+                traj = pd.DataFrame({
+                    "날짜": pd.date_range(proj.start, periods=proj.level.shape[1], freq="D"),
+                    "예상재고": proj.level[row],
+                })
+                fig_proj = px.line(traj, x="날짜", y="예상재고")
+                fig_proj.add_hline(y=0, line_dash="dot", line_color="#ef4444")
+                fig_proj.update_layout(height=320, margin=dict(l=0, r=0, t=20, b=0))
+                st.plotly_chart(fig_proj, use_container_width=True)
+
+        # 수요 예측 검증 (최근 8개 기준일 × 28일 예측 vs 실제)
+        with st.expander("🧪 수요 예측 백테스트 (예측 vs 최근 N일 평균)", expanded=False):
+            st.caption("최근 8개 기준일마다 그날까지의 출고로 다음 28일을 예측해 실제 출고와 비교합니다. (WAPE·편향은 낮을수록/0에 가까울수록 정확)")
+            if st.button("백테스트 실행", key="shortage_backtest"):
+                st.session_state["shortage_backtest_run"] = True
+            if st.session_state.get("shortage_backtest_run"):
+                st.dataframe(
+                    get_forecast_backtest(prepared.version, date.today().isoformat(), raw),
+                    use_container_width=True, hide_index=True,
+                )
+
         # 재고 현황 전체 테이블 (참고용)
         with st.expander("📦 전체 재고 현황 (상품카테고리&입고일 탭)", expanded=False):
             if not inv_data.empty:
                 inv_display = inv_data.copy()
                 inv_display["현재고"] = inv_display["현재고"].apply(lambda x: f"{int(x):,}" if pd.notna(x) and x > 0 else "0")
-                inv_display["1차입고일"] = inv_display["1차입고일"].apply(lambda x: x.strftime("%Y-%m-%d") if pd.notna(x) else "-")
-                inv_display["1차입고수량"] = inv_display["1차입고수량"].apply(lambda x: f"{int(x):,}" if pd.notna(x) and x > 0 else "-")
+                for c_day, c_qty in inventory_receipt_cols(inv_display):
+                    inv_display[c_day] = inv_display[c_day].apply(lambda x: x.strftime("%Y-%m-%d") if pd.notna(x) else "-")
+                    inv_display[c_qty] = inv_display[c_qty].apply(lambda x: f"{int(x):,}" if pd.notna(x) and x > 0 else "-")
                 st.dataframe(inv_display, use_container_width=True, hide_index=True)
             else:
                 st.info("재고 데이터가 없습니다.")
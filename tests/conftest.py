@@ -0,0 +1,64 @@
+# ==========================================
+# 테스트 공용 픽스처
+# - app.py 는 Streamlit 스크립트라 그대로 import 하면 화면까지 그린다 → '# Main' 앞의 정의부만 모듈로 올려 쓴다
+# - 시트는 tools/mock_gsheet_server.py 대역 서버를 임시 포트로 띄워 받는다 (네트워크 불필요)
+# ==========================================
+import pathlib
+import sys
+import threading
+import types
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+APP_PATH = ROOT / "app.py"
+MAIN_MARKER = "# =========================\n# Main\n# ========================="
+sys.path.insert(0, str(ROOT / "tools"))
+
+import mock_gsheet_server  # noqa: E402
+from mock_gsheet_server import INV_GID, SAP_GID, demo_inventory_csv, demo_sap_csv  # noqa: E402,F401
+
+DEMO_ROWS = 3000
+
+
+@pytest.fixture(scope="session")
+def app():
+    src = APP_PATH.read_text(encoding="utf-8")
+    mod = types.ModuleType("app_defs")
+    mod.__file__ = str(APP_PATH)
+    exec(compile(src[: src.index(MAIN_MARKER)], str(APP_PATH), "exec"), mod.__dict__)
+    return mod
+
+
+@pytest.fixture(scope="session")
+def demo_sheets():
+    """{gid: CSV} — 합성 SAP/재고 탭 (세션 공용, 테스트가 고칠 때는 사본을 만든다)"""
+    return {SAP_GID: demo_sap_csv(DEMO_ROWS), INV_GID: demo_inventory_csv()}
+
+
+@pytest.fixture
+def gsheet(app, demo_sheets, monkeypatch):
+    """대역 서버를 임시 포트로 기동하고 app(정의부·AppTest 양쪽)의 GSHEET_BASE_URL 을 그쪽으로 돌린다.
+    반환하는 핸들러 클래스의 sheets / allow_tq 를 바꾸면 다음 요청부터 반영된다 (tq 는 실제 gviz 처럼 소수 타입 값을 비움)"""
+    handler = type(
+        "Handler", (mock_gsheet_server.SheetHandler,),
+        {"sheets": dict(demo_sheets), "allow_tq": True, "gviz_types": True},
+    )
+    app._pushdown_plans().clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    monkeypatch.setattr(app, "GSHEET_BASE_URL", url)
+    monkeypatch.setenv("GSHEET_BASE_URL", url)
+    handler.url = url
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def snapshot_dir(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setenv("B2B_SNAPSHOT_DIR", str(tmp_path))
+    return tmp_path
@@ -0,0 +1,80 @@
+# ==========================================
+# SAP 탭 증분(delta) 반영 (user-002)
+# - 행 추가/삭제/수정 후 delta 결과가 같은 CSV 의 전체 재구성과 같아야 한다
+# ==========================================
+import csv
+import io
+
+import numpy as np
+import pandas as pd
+
+from conftest import SAP_GID, demo_sap_csv
+
+HEAD_ROWS = 7  # 6행 메모 + 헤더
+
+
+def _rows(data: bytes) -> list[list[str]]:
+    return list(csv.reader(io.StringIO(data.decode("utf-8"))))
+
+
+def _csv(rows: list[list[str]]) -> bytes:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def _edit_sap(data: bytes) -> bytes:
+    """데이터 행 일부 삭제 + 수량 수정 + 다른 시드의 행 추가"""
+    rows = _rows(data)
+    head, body = rows[:HEAD_ROWS], rows[HEAD_ROWS:]
+    qty = head[-1].index("요청수량")
+    body = [r for i, r in enumerate(body) if i % 50 != 7]
+    for r in body[::40]:
+        r[qty] = "9,999"
+    extra = _rows(demo_sap_csv(60, seed=9))[HEAD_ROWS:]
+    return _csv(head + body + extra)
+
+
+def _full(app, data: bytes) -> tuple[pd.DataFrame, pd.DataFrame]:
+    return app.prepare_full(app.parse_sap_csv(data, app.HEADER_ROW_0BASED))
+
+
+def _sorted_cal_agg(app, cal_agg: pd.DataFrame) -> pd.DataFrame:
+    out = cal_agg.astype({c: object for c in app.CAL_AGG_KEYS if c in cal_agg.columns})
+    return out.sort_values(app.CAL_AGG_KEYS).reset_index(drop=True)
+
+
+def _prev(app):
+    raw0, cal0, version0, info0 = app.load_prepared_from_gsheet()
+    assert info0["mode"] == "full"
+    return app.PreparedData(raw0, cal0, app.empty_inventory(), version0, "", 0.0)
+
+
+def test_delta_matches_full_rebuild(app, gsheet):
+    prev = _prev(app)
+    edited = _edit_sap(gsheet.sheets[SAP_GID])
+    gsheet.sheets = {**gsheet.sheets, SAP_GID: edited}
+    raw, cal_agg, version, info = app.load_prepared_from_gsheet(prev)
+    assert info["mode"] == "delta"
+    assert info["added"] > 0 and info["removed"] > 0 and info["changed"] > 0
+    assert version != prev.version
+
+    full_raw, full_cal = _full(app, edited)
+    pd.testing.assert_frame_equal(raw.reset_index(drop=True), full_raw.reset_index(drop=True), check_categorical=False)
+    pd.testing.assert_frame_equal(_sorted_cal_agg(app, cal_agg), _sorted_cal_agg(app, full_cal), check_categorical=False)
+
+
+def test_unchanged_sheet_reuses_previous(app, gsheet):
+    prev = _prev(app)
+    raw, cal_agg, version, info = app.load_prepared_from_gsheet(prev)
+    assert info["mode"] == "unchanged"
+    assert raw is prev.raw and cal_agg is prev.cal_agg and version == prev.version
+
+
+def test_large_change_falls_back_to_full(app, gsheet):
+    prev = _prev(app)
+    other = demo_sap_csv(1000, seed=5)
+    gsheet.sheets = {**gsheet.sheets, SAP_GID: other}
+    raw, _, _, info = app.load_prepared_from_gsheet(prev)
+    assert info["mode"] == "full"
+    assert np.array_equal(raw["_row_fp"].to_numpy(), _full(app, other)[0]["_row_fp"].to_numpy())
@@ -0,0 +1,105 @@
+# ==========================================
+# ⑧ 수요 예측(감쇠 추세 지수평활)·백테스트 (user-022)
+# - 고정 합성 시계열로 동작 확인
+# ==========================================
+import inspect
+
+import numpy as np
+import pandas as pd
+import pytest
+
+END_DAY = 20_000  # 임의의 일 키 (1970-01-01 기준 일수)
+HISTORY_DAYS = 420
+
+
+def ship_frame(app, daily: dict[str, np.ndarray], cust1: str = "해외B2B") -> pd.DataFrame:
+    """품목코드 → 일별 출고량(END_DAY 로 끝나는 배열) → DailyShipMatrix 입력 프레임"""
+    rows = []
+    for code, qty in daily.items():
+        days = np.arange(END_DAY - len(qty) + 1, END_DAY + 1)
+        rows.append(pd.DataFrame({app.COL_CUST1: cust1, app.COL_ITEM_CODE: code, "_ship_day": days, app.COL_QTY: qty}))
+    df = pd.concat(rows, ignore_index=True)
+    df["_ship_day"] = df["_ship_day"].astype("Int32")
+    return df
+
+
+@pytest.fixture
+def series():
+    t = np.arange(HISTORY_DAYS, dtype="float64")
+    return {
+        "FLAT": np.full(HISTORY_DAYS, 10.0),
+        "RISING": 2.0 + 0.05 * t,    # 일 0.05 씩 증가 → 주 합계는 주당 2.45 씩 증가
+        "ZERO": np.zeros(HISTORY_DAYS),
+    }
+
+
+@pytest.fixture
+def forecast(app, series):
+    matrix = app.DailyShipMatrix(ship_frame(app, series))
+    return matrix, app.forecast_demand(matrix, END_DAY)
+
+
+def weekly_of(fc, code):
+    return fc.weekly[fc.skus.get_loc(code)]
+
+
+def test_flat_series_forecasts_its_level(forecast):
+    _, fc = forecast
+    assert np.allclose(weekly_of(fc, "FLAT"), 70.0)
+
+
+def test_zero_series_forecasts_zero_and_never_depletes(app, forecast):
+    _, fc = forecast
+    w = weekly_of(fc, "ZERO")
+    assert not w.any()
+    assert np.isinf(app.forecast_depletion_days(w[None, :], np.array([100.0])))[0]
+
+
+def test_rising_series_follows_a_damped_trend(app, forecast, series):
+    _, fc = forecast
+    w = weekly_of(fc, "RISING")
+    last_week = series["RISING"][-7:].sum()
+    slope = 0.05 * 49  # 주 합계의 주당 증가분
+    assert np.all(np.diff(w) >= -1e-9)                 # 추세 방향 유지
+    assert w[0] > last_week                             # 평균이 아니라 다음 주를 내다본다
+    # 감쇠(phi=0.9) → 추세 누적은 phi/(1-phi)=9주치를 넘지 않는다
+    assert w[-1] < last_week + slope * (app.FORECAST_PHI / (1 - app.FORECAST_PHI)) + slope
+    avg_90 = series["RISING"][-90:].sum() / 90 * 7
+    assert w[0] > avg_90
+
+
+def test_depletion_days_and_cumulative_from_weekly(app):
+    weekly = np.full((1, app.FORECAST_HORIZON_WEEKS), 70.0)
+    assert app.forecast_depletion_days(weekly, np.array([140.0]))[0] == pytest.approx(14.0)
+    assert app.forecast_depletion_days(weekly, np.array([105.0]))[0] == pytest.approx(10.5)
+    assert app.forecast_cumulative(weekly, 30)[0] == pytest.approx(300.0)
+
+
+def test_rows_fill_unknown_codes_with_zero(forecast):
+    _, fc = forecast
+    out = fc.rows(["FLAT", "NOPE"])
+    assert np.allclose(out[0], 70.0) and not out[1].any()
+
+
+def test_backtest_shape_and_accuracy(app, forecast):
+    matrix, _ = forecast
+    bt = app.backtest_demand_forecast(matrix, END_DAY)
+    assert list(bt.columns) == ["방법", "대상", "WAPE(%)", "편향(%)", "실행시간(ms/회)"]
+    assert len(bt) == 4
+    wape = bt.set_index(["대상", "방법"])["WAPE(%)"]
+    bias = bt.set_index(["대상", "방법"])["편향(%)"]
+    # 평균은 증가 추세를 늦게 따라가 과소 예측, 추세 모델은 거의 맞힌다
+    assert wape[("전체", "수요 예측(추세)")] < wape[("전체", "최근 90일 평균")]
+    assert bias[("전체", "최근 90일 평균")] < -5
+    assert abs(bias[("전체", "수요 예측(추세)")]) < 2
+
+
+def test_only_overseas_rows_feed_the_matrix(app, series):
+    matrix = app.DailyShipMatrix(ship_frame(app, {"DOM": series["FLAT"]}, cust1="국내B2B"))
+    assert len(matrix.skus) == 0
+
+
+def test_average_is_the_default_shortage_basis(app):
+    assert list(app.SHORTAGE_METHODS)[0] == "average"
+    for fn in (app.ShortageScenarios.result, app.build_shortage_alert):
+        assert inspect.signature(fn).parameters["method"].default == "average"
@@ -0,0 +1,110 @@
+# ==========================================
+# 시트 쿼리(gviz tq) pushdown vs 전체 export 대체 경로 (user-004 SAP 탭 / user-005 재고 탭)
+# - tq 본문은 전체 export 와 대조를 통과한 뒤에만 쓰고, 그 사이에는 핵심 컬럼 공란을 감시
+# ==========================================
+import csv
+import io
+
+import pandas as pd
+
+from conftest import INV_GID, SAP_GID
+
+HEAD_ROWS = 7  # 6행 메모 + 헤더
+
+
+def _count_requests(gsheet, monkeypatch) -> list[str]:
+    """대역 서버가 받은 요청 종류("export" / "tq") 기록"""
+    seen = []
+    do_get = gsheet.do_GET
+
+    def counting(handler):
+        seen.append(handler.path.split("?", 1)[0].rsplit("/", 1)[-1])
+        do_get(handler)
+    monkeypatch.setattr(gsheet, "do_GET", counting)
+    return seen
+
+
+def _with_sap_cells(gsheet, col: str, value: str, every: int = 20):
+    """SAP 탭 데이터 행 every 행마다 col 값을 value 로 (gviz 가 소수 타입으로 비우는 값)"""
+    rows = list(csv.reader(io.StringIO(gsheet.sheets[SAP_GID].decode("utf-8"))))
+    pos = rows[HEAD_ROWS - 1].index(col)
+    for r in rows[HEAD_ROWS::every]:
+        r[pos] = value
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    gsheet.sheets = {**gsheet.sheets, SAP_GID: out.getvalue().encode("utf-8")}
+
+
+def _prepared_raw(app):
+    data, header_row, mode = app.fetch_sap_csv()
+    raw, cal_agg = app.prepare_full(app.parse_sap_csv(data, header_row))
+    # 행 지문은 원문 열 구성(pushdown 은 필요한 열만)에 따라 달라지므로 비교에서 뺀다
+    return raw.drop(columns="_row_fp").reset_index(drop=True), cal_agg, mode, len(data)
+
+
+def test_pushdown_matches_full_export(app, gsheet):
+    raw_q, cal_q, mode_q, size_q = _prepared_raw(app)
+    gsheet.allow_tq = False
+    raw_f, cal_f, mode_f, size_f = _prepared_raw(app)
+    assert (mode_q, mode_f) == ("pushdown", "full")
+    assert size_q < size_f
+    pd.testing.assert_frame_equal(raw_q, raw_f[raw_q.columns], check_categorical=False)
+    pd.testing.assert_frame_equal(cal_q, cal_f, check_categorical=False)
+
+
+def test_missing_column_skips_pushdown(app, gsheet):
+    lines = gsheet.sheets[SAP_GID].decode("utf-8").split("\r\n")
+    lines[app.HEADER_ROW_0BASED] = lines[app.HEADER_ROW_0BASED].replace("출고일자", "출고일")
+    gsheet.sheets = {**gsheet.sheets, SAP_GID: "\r\n".join(lines).encode("utf-8")}
+    header = app._read_header_row(io.BytesIO(gsheet.sheets[SAP_GID]), app.HEADER_ROW_0BASED)
+    assert app.build_sap_pushdown_query(header) is None
+    _, header_row, mode = app.fetch_sap_csv()
+    assert (header_row, mode) == (app.HEADER_ROW_0BASED, "full")
+
+
+def test_verified_plan_needs_one_request_until_next_parity(app, gsheet, monkeypatch):
+    monkeypatch.setattr(app, "GSHEET_PARITY_EVERY", 2)
+    seen = _count_requests(gsheet, monkeypatch)
+    modes = [app.fetch_sap_csv()[2] for _ in range(4)]
+    assert modes == ["pushdown"] * 4
+    assert seen == ["export", "tq", "tq", "tq", "export", "tq"]
+
+
+def test_minority_type_blanks_fail_parity(app, gsheet):
+    # 문자 품목코드 사이의 숫자 코드 → gviz 가 비움 → tq 본문 행 수·값 수가 전체 export 와 다름
+    _with_sap_cells(gsheet, "품목코드", "12345")
+    data, header_row, mode = app.fetch_sap_csv()
+    assert (header_row, mode) == (app.HEADER_ROW_0BASED, "full")
+    assert app.GSHEET_GID not in app._pushdown_plans()
+
+
+def test_new_blanks_after_parity_fall_back_to_full(app, gsheet, monkeypatch):
+    assert app.fetch_sap_csv()[2] == "pushdown"
+    seen = _count_requests(gsheet, monkeypatch)
+    _with_sap_cells(gsheet, "주문번호", "777777")
+    data, header_row, mode = app.fetch_sap_csv()
+    assert seen == ["tq", "export", "tq"]
+    assert (header_row, mode) == (app.HEADER_ROW_0BASED, "full")
+    assert data == gsheet.sheets[SAP_GID]
+
+
+def test_inventory_range_matches_full_export(app, gsheet):
+    data, mode = app.fetch_inventory_csv()
+    inv_r = app.parse_inventory_csv(data, ranged=(mode == "range"))
+    gsheet.allow_tq = False
+    data, mode_f = app.fetch_inventory_csv()
+    inv_f = app.parse_inventory_csv(data, ranged=(mode_f == "range"))
+    assert (mode, mode_f) == ("range", "full")
+    pd.testing.assert_frame_equal(inv_r, inv_f)
+
+
+def test_inventory_minority_type_codes_fail_parity(app, gsheet):
+    rows = list(csv.reader(io.StringIO(gsheet.sheets[INV_GID].decode("utf-8"))))
+    for r in rows[2::10]:
+        r[7] = "880123"  # 문자 품목코드 사이의 숫자 코드 → gviz 범위 본문에서 빈 칸
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    gsheet.sheets = {**gsheet.sheets, INV_GID: out.getvalue().encode("utf-8")}
+    data, mode = app.fetch_inventory_csv()
+    assert mode == "full"
+    assert (app.parse_inventory_csv(data)["품목코드"] == "880123").sum() == len(rows[2::10])
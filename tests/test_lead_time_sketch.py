@@ -0,0 +1,61 @@
+# ==========================================
+# 리드타임 희소 스케치 (user-019)
+# - 필터/요약 축 조합마다 스케치 병합 결과가 원본 행에서 pandas 로 구한 평균·분위수와 같아야 한다
+# ==========================================
+import numpy as np
+import pandas as pd
+import pytest
+
+import mock_gsheet_server
+
+
+@pytest.fixture(scope="module")
+def raw(app):
+    src = app.parse_sap_csv(mock_gsheet_server.demo_sap_csv(4000, seed=3), app.HEADER_ROW_0BASED)
+    return app.prepare_full(src)[0]
+
+
+def _expected(app, df: pd.DataFrame, by: str) -> pd.DataFrame:
+    g = df[app.COL_LT2].astype("float64").groupby(df[by], observed=True)
+    out = pd.DataFrame({app.LT_COL_MEAN: g.mean()})
+    for q, col in app.LT_QUANTILE_COLS.items():
+        out[col] = g.quantile(q)
+    return out
+
+
+def _check(app, raw_df: pd.DataFrame, selections: dict, by: str):
+    sketch = app.build_lead_time_sketch(raw_df)
+    view = app.FilteredView(raw_df, app.FilterIndex(raw_df, "v"), selections)
+    got = app.summarize_lead_time(sketch, view, by).set_index(by)
+    mask = np.ones(len(raw_df), dtype=bool)
+    for col, val in selections.items():
+        if val != "전체":
+            mask &= (raw_df[col] == val).to_numpy()
+    sub = raw_df[mask]
+    exp = _expected(app, sub, by)
+    cols = [app.LT_COL_MEAN] + list(app.LT_QUANTILE_COLS.values())
+    pd.testing.assert_frame_equal(
+        got.loc[exp.index, cols].astype("float64"), exp[cols], check_names=False, check_index_type=False, rtol=1e-9
+    )
+    assert got["집계행수_표본"].sum() == len(sub)
+
+
+@pytest.mark.parametrize("by", ["거래처구분2", "BP명"])
+def test_integer_lead_times_match_pandas(app, raw, by):
+    _check(app, raw, {"거래처구분1": "전체"}, by)
+    _check(app, raw, {"거래처구분1": "해외B2B"}, by)
+    month = str(raw["_month_label"].dropna().iloc[0])
+    _check(app, raw, {"거래처구분1": "전체", "_month_label": month}, by)
+
+
+def test_fractional_lead_times_match_pandas(app, raw):
+    rnd = np.random.default_rng(0)
+    frac = raw.copy()
+    lt = np.round(rnd.gamma(2.0, 4.0, len(frac)), 3)
+    lt[rnd.random(len(frac)) < 0.05] = np.nan
+    frac[app.COL_LT2] = lt
+    _check(app, frac, {"거래처구분1": "전체"}, "BP명")
+    sketch = app.build_lead_time_sketch(frac)
+    # 쌍은 셀 안의 고유 값만 → 리드타임이 있는 행 수 이하
+    assert len(sketch.value) <= int(np.isfinite(lt).sum())
+    assert sketch.cell.dtype == np.int32 and sketch.count.dtype == np.int32
@@ -0,0 +1,138 @@
+# ==========================================
+# 월간 공유용 리포트 (user-024 / user-025)
+# - 집계 한 장에서 만든 리포트가 행 기반(기준 구현) 리포트와 같은 텍스트
+# - 선택 월 하나(선택/전월/차월 집계)와 전체 월 일괄 생성(전체 월 집계 한 장)이 같은 텍스트
+# - golden/: 기준 구현 build_monthly_share_report(all_df, cur_df, prev_df, next_df) 의 출력
+#   (고정 날짜·중복 없는 수량의 합성 RAW — 동률 순서에 기대지 않는다)
+# ==========================================
+import csv
+import io
+import random
+import zipfile
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import mock_gsheet_server
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+ALL = {"거래처구분1": "전체", "거래처구분2": "전체", "BP명": "전체", "_month_label": "전체"}
+
+
+class _FixedDate(date):
+    @classmethod
+    def today(cls):
+        return date(2026, 1, 15)
+
+
+def fixed_sap_csv() -> bytes:
+    """오늘 날짜와 무관한 합성 SAP 탭 — 행마다 다른 요청수량"""
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(mock_gsheet_server, "date", _FixedDate)
+        rows = list(csv.reader(io.StringIO(mock_gsheet_server.demo_sap_csv(1500, seed=11).decode("utf-8"))))
+    head = mock_gsheet_server.SAP_HEADER_ROW_0BASED
+    qi = rows[head].index("요청수량")
+    for r, q in zip(rows[head + 1:], random.Random(5).sample(range(1, 100000), len(rows) - head - 1)):
+        r[qi] = f"{q:,}"
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode("utf-8")
+
+
+def _prepare(app, data: bytes) -> pd.DataFrame:
+    return app.prepare_full(app.parse_sap_csv(data, app.HEADER_ROW_0BASED))[0]
+
+
+@pytest.fixture(scope="module")
+def raw(app):
+    return _prepare(app, mock_gsheet_server.demo_sap_csv(4000, seed=4))
+
+
+def _rollup_rows(app, raw_df: pd.DataFrame, selections: dict = ALL) -> tuple[pd.DataFrame, pd.Series, list[str]]:
+    """④ 와 같은 뷰 → (롤업 행, 신규 업체 이력, 월 목록)"""
+    view = app.FilteredView(raw_df, app.FilterIndex(raw_df, "v"), selections)
+    d = view.select(app.VIEW_COLS_ROLLUP)
+    months = (
+        d[["_month_label", "_month_key_num"]].dropna()
+        .drop_duplicates("_month_label").sort_values("_month_key_num")["_month_label"].astype(str).tolist()
+    )
+    return d, app.build_bp_month_history(raw_df), months
+
+
+def _single(app, d: pd.DataFrame, bp_history: pd.Series, months: list[str], i: int) -> str:
+    prev_m = months[i - 1] if i > 0 else None
+    next_m = months[i + 1] if i < len(months) - 1 else None
+    sel = [m for m in (prev_m, months[i], next_m) if m is not None]
+    return app.build_monthly_share_report(app.build_report_aggregate(d, sel), bp_history, months[i], prev_m, next_m)
+
+
+@pytest.mark.parametrize("selections", [ALL, {**ALL, "거래처구분1": "해외B2B"}, {**ALL, "거래처구분2": "JP"}])
+def test_batch_engine_matches_single_month(app, raw, selections):
+    d, bp_history, months = _rollup_rows(app, raw, selections)
+    engine = app.MonthlyReportEngine(app.build_report_aggregate(d, months), bp_history, months)
+    for i, m in enumerate(months):
+        assert engine.report(m) == _single(app, d, bp_history, months, i), m
+
+
+@pytest.mark.parametrize("ym", ["202402", "202502", "202601"])
+def test_report_matches_row_based_golden(app, ym):
+    d, bp_history, months = _rollup_rows(app, _prepare(app, fixed_sap_csv()))
+    i = months.index(f"{ym[:4]}년 {int(ym[4:])}월")
+    expected = (GOLDEN_DIR / f"monthly_report_{ym}.txt").read_text(encoding="utf-8")
+    assert _single(app, d, bp_history, months, i) == expected
+
+
+def test_report_totals_and_top_bp_match_raw(app, raw):
+    d, bp_history, months = _rollup_rows(app, raw)
+    m = months[-2]
+    text = _single(app, d, bp_history, months, len(months) - 2)
+    cur = raw[(raw["_month_label"] == m).to_numpy()]
+    qty = cur[app.COL_QTY].astype("float64")
+    assert f"- 총 출고수량: {app._fmt_int(round(qty.sum()))}개" in text
+    for cust1 in ("해외B2B", "국내B2B"):
+        part = cur[(cur[app.COL_CUST1] == cust1).to_numpy()]
+        by_bp = part[app.COL_QTY].astype("float64").groupby(part[app.COL_BP].astype(str), observed=True).sum().reset_index()
+        by_bp = by_bp.sort_values([app.COL_QTY, app.COL_BP], ascending=[False, True], kind="stable").head(app.REPORT_TOP_N)
+        line = " / ".join(f"{bp}({app._fmt_int(q)})" for bp, q in by_bp.itertuples(index=False))
+        assert f"- 주요 출고 업체 : {line}" in text
+
+
+def test_cached_reports_render_each_month_once(app, raw):
+    d, bp_history, months = _rollup_rows(app, raw)
+    built = []
+
+    def make_engine():
+        built.append(1)
+        return app.MonthlyReportEngine(app.build_report_aggregate(d, months), bp_history, months)
+    cache = app.ResultCache()
+    first = app.get_monthly_reports(cache, ("v",), months, make_engine)
+    again = app.get_monthly_reports(cache, ("v",), months, make_engine)
+    assert first == again and list(first) == months
+    assert len(built) == 1
+
+
+def test_order_desc_breaks_ties_by_name(app):
+    qty = [300.0, float("nan"), 500.0, 300.0, 300.0]
+    names = [" b", "a", "z", "a", "c"]
+    assert app._order_desc(qty, names).tolist() == [2, 3, 0, 4, 1]
+
+
+def test_tied_quantities_render_independent_of_row_order(app, raw):
+    tied = raw.copy()
+    tied[app.COL_QTY] = ((tied.index.to_numpy() % 3 + 1) * 100).astype("float64")
+    shuffled = tied.sample(frac=1, random_state=7).reset_index(drop=True)
+    texts = []
+    for df in (tied, shuffled):
+        d, bp_history, months = _rollup_rows(app, df)
+        engine = app.MonthlyReportEngine(app.build_report_aggregate(d, months), bp_history, months)
+        texts.append([engine.report(m) for m in months])
+    assert texts[0] == texts[1]
+
+
+def test_monthly_reports_zip(app):
+    data = app.monthly_reports_zip({"2025년 1월": "a", "2025년 2월": "b"}, {"2025년 1월": "202501", "2025년 2월": "202502"})
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == ["월간리포트_202501.txt", "월간리포트_202502.txt"]
+        assert zf.read("월간리포트_202502.txt").decode("utf-8") == "b"
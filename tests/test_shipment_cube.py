@@ -0,0 +1,38 @@
+# ==========================================
+# 출고 큐브 (user-017)
+# - 주차 × 월 × 출고월 × 거래처구분 × BP 큐브에서 롤업한 값이 뷰의 행에서 롤업한 값과 같아야 한다
+# ==========================================
+import pandas as pd
+import pytest
+
+import mock_gsheet_server
+
+ALL = {"거래처구분1": "전체", "거래처구분2": "전체", "BP명": "전체", "_month_label": "전체"}
+
+
+@pytest.fixture(scope="module")
+def raw(app):
+    src = app.parse_sap_csv(mock_gsheet_server.demo_sap_csv(4000, seed=5), app.HEADER_ROW_0BASED)
+    return app.prepare_full(src)[0]
+
+
+def _rollup(df: pd.DataFrame, keys: list[str], qty: str) -> pd.DataFrame:
+    out = df.groupby(keys, dropna=False, observed=True)[qty].sum(min_count=1).reset_index()
+    return out.astype({k: object for k in keys}).sort_values(keys, key=lambda s: s.astype(str)).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("selections", [ALL, {**ALL, "거래처구분1": "해외B2B"}, {**ALL, "BP명": "Tokyo Trade 3"}])
+def test_cube_rollups_match_view_rows(app, raw, selections):
+    view = app.FilteredView(raw, app.FilterIndex(raw, "v"), selections)
+    cube = app.slice_for_view(app.build_shipment_cube(raw), view)
+    rows = view.select(app.VIEW_COLS_ROLLUP + ["_week_label", "_week_key_num"])
+    assert len(cube) < len(rows)
+    shipped_cube = cube[cube["_ship_ym"].notna().to_numpy()]
+    shipped_rows = rows[rows["_ship_day"].notna().to_numpy()]
+    for keys, c, r in [
+        (["_week_label", "_week_key_num"], cube, rows),
+        (["_month_label", "_month_key_num"], cube, rows),
+        (["_ship_ym", app.COL_CUST1], shipped_cube, shipped_rows),
+        (["_ship_ym", app.COL_BP], shipped_cube, shipped_rows),
+    ]:
+        pd.testing.assert_frame_equal(_rollup(c, keys, app.COL_QTY), _rollup(r, keys, app.COL_QTY), check_dtype=False)
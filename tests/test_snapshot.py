@@ -0,0 +1,59 @@
+# ==========================================
+# 로컬 Arrow 스냅샷 (user-001)
+# ==========================================
+import json
+
+import pandas as pd
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from conftest import APP_PATH
+
+
+def _prepared(app):
+    raw, cal_agg, version, _ = app.load_prepared_from_gsheet()
+    inv, inv_version, _ = app.load_inventory_from_gsheet()
+    return app.PreparedData(raw, cal_agg, inv, version, inv_version, 1234.5)
+
+
+def test_snapshot_round_trip(app, gsheet, snapshot_dir):
+    data = _prepared(app)
+    app.write_snapshot(data)
+    back = app.read_snapshot()
+    assert back is not None
+    assert (back.version, back.inv_version, back.fetched_at) == (data.version, data.inv_version, data.fetched_at)
+    # 라벨(string)·키(Int64) 등 dtype 까지 그대로 (인덱스는 저장하지 않는다)
+    pd.testing.assert_frame_equal(back.raw, data.raw.reset_index(drop=True))
+    pd.testing.assert_frame_equal(back.cal_agg, data.cal_agg.reset_index(drop=True))
+    pd.testing.assert_frame_equal(back.inv, data.inv.reset_index(drop=True))
+
+
+def test_snapshot_keeps_only_current_version(app, gsheet, snapshot_dir):
+    data = _prepared(app)
+    app.write_snapshot(data._replace(version="old"))
+    app.write_snapshot(data)
+    names = sorted(p.name for p in snapshot_dir.glob("*.arrow"))
+    assert names == sorted(f"{n}-{v}.arrow" for n, v in [("raw", data.version), ("cal_agg", data.version), ("inv", data.inv_version)])
+
+
+def test_snapshot_schema_bump_invalidates(app, gsheet, snapshot_dir):
+    app.write_snapshot(_prepared(app))
+    meta_path = snapshot_dir / "meta.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta_path.write_text(json.dumps({**meta, "schema": app.SNAPSHOT_SCHEMA - 1}), encoding="utf-8")
+    assert app.read_snapshot() is None
+
+
+def test_app_serves_from_snapshot(app, gsheet, snapshot_dir):
+    """첫 실행은 시트를 받아 스냅샷을 남기고, 새 프로세스(캐시 비움)는 시트 없이 스냅샷으로 그린다"""
+    st.cache_resource.clear()
+    at = AppTest.from_file(str(APP_PATH), default_timeout=120).run()
+    assert not at.exception
+    assert (snapshot_dir / "meta.json").exists()
+
+    gsheet.sheets = {}  # 시트 접근 불가
+    st.cache_resource.clear()
+    at = AppTest.from_file(str(APP_PATH), default_timeout=120).run()
+    assert not at.exception
+    assert not list(at.error)
+    st.cache_resource.clear()
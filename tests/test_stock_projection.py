@@ -0,0 +1,83 @@
+# ==========================================
+# ⑧ 전 품목 재고 추이 예측 (user-023)
+# - 재고(d) = 현재고 - 누적 예측 수요(전 채널) + 누적 N차 입고, 오늘 입고분은 첫날에 반영
+# ==========================================
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+TODAY = date(2026, 3, 2)
+
+
+def make_inventory(stock, receipts):
+    """receipts: [(입고일, 수량)] → 1차·2차… 입고일/수량 한 품목"""
+    inv = {"품목코드": ["A"], "품목이름": ["상품 A"], "현재고": [stock]}
+    for i, (when, qty) in enumerate(receipts, start=1):
+        inv[f"{i}차입고일"] = pd.to_datetime([when])
+        inv[f"{i}차입고수량"] = [qty]
+    return pd.DataFrame(inv)
+
+
+def flat_forecast(app, codes, per_week):
+    weekly = np.full((len(codes), app.FORECAST_HORIZON_WEEKS), float(per_week))
+    return app.DemandForecast(pd.Index(codes), weekly)
+
+
+def test_level_is_stock_minus_demand_plus_receipts(app):
+    inv = make_inventory(70, [(TODAY + timedelta(days=1), 140)])
+    proj = app.project_stock(inv, flat_forecast(app, ["A"], 70), TODAY, days=28)
+    assert proj.start == TODAY + timedelta(days=1)
+    assert proj.level[0, 0] == 70 + 140 - 10
+    assert proj.summary.loc[0, "입고예정수량"] == 140
+    assert proj.summary.loc[0, "재고커버일수"] == 21  # 210 / 일 10 → 21일째 마감부터 품절
+    assert proj.summary.loc[0, "첫품절일"] == pd.Timestamp(TODAY + timedelta(days=22))
+
+
+def test_nth_receipts_are_added_on_their_dates(app):
+    inv = make_inventory(30, [(TODAY + timedelta(days=2), 20), (TODAY + timedelta(days=10), 50)])
+    proj = app.project_stock(inv, flat_forecast(app, ["A"], 70), TODAY, days=28)
+    assert proj.summary.loc[0, "입고예정수량"] == 70
+    assert proj.level[0, 1] == 30 + 20 - 20
+    assert proj.level[0, 9] == 30 + 20 + 50 - 100
+    assert proj.summary.loc[0, "부족수량"] == 28 * 10 - 100
+
+
+def test_receipt_dated_today_counts_toward_first_day(app):
+    inv = make_inventory(70, [(TODAY, 140)])
+    proj = app.project_stock(inv, flat_forecast(app, ["A"], 70), TODAY, days=28)
+    assert proj.level[0, 0] == 70 + 140 - 10
+    assert proj.summary.loc[0, "입고예정수량"] == 140
+    assert proj.summary.loc[0, "재고커버일수"] == 21
+
+
+def test_receipt_before_today_is_already_in_stock(app):
+    inv = make_inventory(70, [(TODAY - timedelta(days=1), 140)])
+    proj = app.project_stock(inv, flat_forecast(app, ["A"], 70), TODAY, days=28)
+    assert proj.summary.loc[0, "입고예정수량"] == 0
+    assert proj.summary.loc[0, "재고커버일수"] == 7
+
+
+def test_unknown_code_has_no_demand(app):
+    inv = make_inventory(5, [(pd.NaT, np.nan)])
+    proj = app.project_stock(inv, flat_forecast(app, ["B"], 70), TODAY, days=28)
+    assert np.isinf(proj.summary.loc[0, "재고커버일수"])
+    assert pd.isna(proj.summary.loc[0, "첫품절일"])
+
+
+def test_projection_demand_includes_domestic_channel(app):
+    end = app.day_key(TODAY)
+    days = np.arange(end - 399, end + 1)
+    raw = pd.DataFrame({
+        app.COL_CUST1: ["국내B2B"] * len(days),
+        app.COL_ITEM_CODE: "A",
+        "_ship_day": pd.array(days, dtype="Int32"),
+        app.COL_QTY: 10.0,
+    })
+    overseas_only = app.forecast_demand(app.DailyShipMatrix(raw), end)
+    all_channels = app.forecast_demand(app.DailyShipMatrix(raw, cust1=None), end)
+    assert len(overseas_only.skus) == 0
+    inv = make_inventory(100, [(pd.NaT, np.nan)])
+    proj = app.project_stock(inv, all_channels, TODAY, days=28)
+    assert proj.summary.loc[0, "예측일평균출고"] == 10
+    assert proj.summary.loc[0, "재고커버일수"] == 10
@@ -0,0 +1,296 @@
+# ==========================================
+# Google Sheet 로컬 대역 서버 (오프라인 테스트용)
+# - /spreadsheets/d/<id>/export?format=csv&gid=<gid>   → <data-dir>/<gid>.csv 그대로
+# - /spreadsheets/d/<id>/gviz/tq?tqx=out:csv&gid=...   → range/headers/tq(select·where) 를 적용한 CSV
+#
+# 사용:
+#   python tools/mock_gsheet_server.py --demo                 # 합성 데이터로 기동
+#   python tools/mock_gsheet_server.py --data-dir ./sheets    # <gid>.csv 파일 제공
+#   GSHEET_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+#
+# 지원하는 tq 문법(앱이 쓰는 범위만): select <열문자>, ...  where <열문자> (= '값' | matches '정규식')
+#   조건은 and / or 로 연결 (괄호 미지원). --no-tq 로 기동하면 tq 요청에 400 을 돌려 전체 export 대체 경로를 확인할 수 있다.
+#   --gviz-types 로 기동하면 실제 gviz 처럼 열마다 다수 타입(숫자/날짜/불리언/문자)을 정해 소수 타입 값을 비운다.
+# ==========================================
+import argparse
+import csv
+import io
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SAP_GID = "15468212"
+INV_GID = "525131304"
+SAP_HEADER_ROW_0BASED = 6
+
+
+# =========================
+# 합성 데이터 (--demo)
+# =========================
+def demo_sap_csv(rows: int, seed: int = 1) -> bytes:
+    """SAP 탭과 같은 배치: 6행 메모 + 7행 헤더 + 데이터 (제품분류 B0/B1 외 행 포함)"""
+    rnd = random.Random(seed)
+    cols = [
+        "No", "요청수량", "년", "월1", "작업완료", "출고일자", "리드타임", "BP명", "대표행",
+        "거래처구분1", "거래처구분2", "제품분류", "품목코드", "품목명", "발주일자", "주문번호",
+        "카테고리 라인", "리드타임1", "비고", "",
+    ]
+    bps = {
+        "해외B2B": [("JP", f"Tokyo Trade {i}") for i in range(8)]
+        + [("CN", f"Shanghai Co {i}") for i in range(6)]
+        + [("EU", f"Berlin GmbH {i}") for i in range(5)],
+        "국내B2B": [("국내", f"국내상사{i}") for i in range(15)],
+    }
+    skus = [(f"SKU{1000 + i}", f"상품 {i} " + rnd.choice(["", "JP", "CN", "EU", "MO"])) for i in range(300)]
+    out = io.StringIO()
+    w = csv.writer(out)
+    for _ in range(SAP_HEADER_ROW_0BASED):
+        w.writerow(["메모"] + [""] * (len(cols) - 1))
+    w.writerow(cols)
+    start = date.today() - timedelta(days=700)
+    order = 100000
+    for i in range(rows):
+        if i % 3 == 0:
+            order += 1
+        cust1 = rnd.choice(["해외B2B", "국내B2B"])
+        cust2, bp = rnd.choice(bps[cust1])
+        od = start + timedelta(days=rnd.randint(0, 712))
+        lt = rnd.randint(1, 30)
+        done = od + timedelta(days=lt)
+        ship = done + timedelta(days=rnd.randint(0, 2)) if rnd.random() > 0.05 else None
+        code, name = rnd.choice(skus)
+        w.writerow([
+            i, f"{rnd.randint(1, 3000):,}", od.year, od.month, done.isoformat(),
+            ship.isoformat() if ship else "", lt, f" {bp} ", rnd.choice(["TRUE", "FALSE"]),
+            cust1, cust2, rnd.choice(["B0", "B1", "C1", "C2", "B2"]), code, name.strip(),
+            od.isoformat(), f"SO{order}", rnd.choice(["스킨", "메이크업", "바디"]), "", "", "",
+        ])
+    return out.getvalue().encode("utf-8")
+
+
+def demo_inventory_csv(seed: int = 2) -> bytes:
+    """상품카테고리&입고일 탭과 같은 배치: 1행 메모 + 2행 헤더, H~L열 = 품목코드/품목이름/현재고/1차입고/1차수량,
+    M~P열 = 2차/3차 입고·수량 (일부 품목만)"""
+    rnd = random.Random(seed)
+    out = io.StringIO()
+    w = csv.writer(out)
+    w.writerow(["재고"] + [""] * 17)
+    w.writerow([
+        "카테고리", "a", "b", "c", "d", "e", "f", "품목 코드", "품목 이름", "현재고", "1차 입고", "1차 수량",
+        "2차 입고", "2차 수량", "3차 입고", "3차 수량", "비고", "x",
+    ])
+    for i in range(300):
+        inbound = (date.today() + timedelta(days=rnd.randint(0, 90))).isoformat() if rnd.random() > 0.3 else ""
+        later = []
+        for lo, hi in ((60, 150), (120, 200)):
+            if inbound and rnd.random() > 0.6:
+                later += [(date.today() + timedelta(days=rnd.randint(lo, hi))).isoformat(), f"{rnd.randint(0, 9000):,}"]
+            else:
+                later += ["", ""]
+        w.writerow([
+            "스킨", "", "", "", "", "", "", f"SKU{1000 + i}", f"상품 {i}",
+            f"{rnd.randint(0, 2500):,}", inbound, f"{rnd.randint(0, 9000):,}" if inbound else "", *later, "", "",
+        ])
+    return out.getvalue().encode("utf-8")
+
+
+# =========================
+# gviz tq (부분 구현)
+# =========================
+def col_index(letters: str) -> int:
+    n = 0
+    for ch in letters.upper():
+        n = n * 26 + (ord(ch) - ord("A") + 1)
+    return n - 1
+
+
+def parse_range(range_a1: str) -> tuple[int, int, int]:
+    """'A7:T' → (시작행 0-based, 시작열, 끝열)"""
+    m = re.fullmatch(r"([A-Za-z]+)(\d+)(?::([A-Za-z]+)\d*)?", range_a1 or "A1")
+    if not m:
+        raise ValueError(f"bad range: {range_a1}")
+    start_col = col_index(m.group(1))
+    end_col = col_index(m.group(3)) if m.group(3) else 10_000
+    return int(m.group(2)) - 1, start_col, end_col
+
+
+def _compile_where(where: str, base_col: int):
+    """"C = 'B0' or C matches '...'" → row predicate"""
+    token = re.compile(r"\s*([A-Za-z]+)\s*(=|matches)\s*'((?:[^'\\]|\\.)*)'\s*(and|or)?", re.IGNORECASE)
+    conds, joins, pos = [], [], 0
+    while pos < len(where):
+        m = token.match(where, pos)
+        if not m:
+            raise ValueError(f"unsupported where: {where[pos:]}")
+        col = col_index(m.group(1)) - base_col
+        op = m.group(2).lower()
+        val = m.group(3).replace("\\'", "'")
+        if op == "=":
+            conds.append(lambda row, c=col, v=val: c < len(row) and row[c] == v)
+        else:
+            rx = re.compile(val.replace("\\\\", "\\"))
+            conds.append(lambda row, c=col, r=rx: c < len(row) and r.fullmatch(row[c]) is not None)
+        if m.group(4):
+            joins.append(m.group(4).lower())
+        pos = m.end()
+
+    def pred(row):
+        result = conds[0](row)
+        for j, cond in zip(joins, conds[1:]):
+            result = (result or cond(row)) if j == "or" else (result and cond(row))
+        return result
+    return pred
+
+
+_NUM_RE = re.compile(r"-?[\d,]*\.?\d+")
+_DATE_RE = re.compile(r"\d{4}-\d{1,2}-\d{1,2}")
+
+
+def _cell_type(value: str):
+    v = value.strip()
+    if not v:
+        return None
+    if _DATE_RE.fullmatch(v):
+        return "date"
+    if _NUM_RE.fullmatch(v):
+        return "number"
+    if v.upper() in ("TRUE", "FALSE"):
+        return "boolean"
+    return "string"
+
+
+def blank_minority_types(body: list[list[str]]) -> None:
+    """gviz 처럼 열마다 다수 타입을 정하고 다른 타입 값은 빈 칸으로 (제자리 수정)"""
+    for c in range(max(map(len, body), default=0)):
+        types = Counter(t for r in body if c < len(r) and (t := _cell_type(r[c])))
+        if len(types) < 2:
+            continue
+        major = types.most_common(1)[0][0]
+        for r in body:
+            if c < len(r) and _cell_type(r[c]) not in (None, major):
+                r[c] = ""
+
+
+def run_query(data: bytes, range_a1: str, headers: int, tq: str, gviz_types: bool = False) -> bytes:
+    start_row, start_col, end_col = parse_range(range_a1)
+    rows = list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))[start_row:]
+    rows = [r[start_col:end_col + 1] for r in rows]
+    head, body = rows[:headers], rows[headers:]
+    if gviz_types:
+        blank_minority_types(body)
+    m = re.fullmatch(r"\s*select\s+(.+?)(?:\s+where\s+(.+))?\s*", tq or "select *", re.IGNORECASE | re.DOTALL)
+    if not m:
+        raise ValueError(f"unsupported tq: {tq}")
+    sel = m.group(1).strip()
+    picks = None if sel == "*" else [col_index(c.strip()) - start_col for c in sel.split(",")]
+    if m.group(2):
+        pred = _compile_where(m.group(2), start_col)
+        body = [r for r in body if pred(r)]
+    labels = [" ".join(x).strip() for x in zip(*head)] if head else []
+    out = io.StringIO()
+    w = csv.writer(out, quoting=csv.QUOTE_ALL)  # gviz 는 모든 값을 따옴표로 감싼다
+
+    def project(r):
+        if picks is None:
+            return r
+        return [r[i] if i < len(r) else "" for i in picks]
+    if labels:
+        w.writerow(project(labels))
+    for r in body:
+        w.writerow(project(r))
+    return out.getvalue().encode("utf-8")
+
+
+# =========================
+# HTTP
+# =========================
+class SheetHandler(BaseHTTPRequestHandler):
+    sheets: dict[str, bytes] = {}
+    allow_tq = True
+    gviz_types = False
+    delay_sec = 0.0
+
+    def _send(self, code: int, body: bytes, ctype: str = "text/csv; charset=utf-8"):
+        self.log_request(code, len(body))  # 응답 바이트 수를 로그에 남겨 pushdown 효과 확인
+        self.send_response_only(code)
+        self.send_header("Server", self.version_string())
+        self.send_header("Date", self.date_time_string())
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 헤더만 읽고 끊는 클라이언트(헤더 probe)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        gid = q.get("gid", "0")
+        if gid not in self.sheets:
+            return self._send(404, b"unknown gid", "text/plain")
+        if self.delay_sec:
+            time.sleep(self.delay_sec)
+        if url.path.endswith("/export"):
+            return self._send(200, self.sheets[gid])
+        if url.path.endswith("/gviz/tq"):
+            if not self.allow_tq:
+                return self._send(400, b"tq disabled", "text/plain")
+            try:
+                body = run_query(
+                    self.sheets[gid], q.get("range", "A1"), int(q.get("headers", 1)), q.get("tq", ""),
+                    self.gviz_types,
+                )
+            except ValueError as e:
+                return self._send(400, str(e).encode("utf-8"), "text/plain")
+            return self._send(200, body)
+        return self._send(404, b"not found", "text/plain")
+
+    def log_message(self, fmt, *args):
+        sys.stderr.write(f"[mock-gsheet] {self.address_string()} {fmt % args}\n")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Google Sheet export/gviz 로컬 대역 서버")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--data-dir", help="<gid>.csv 파일이 있는 폴더")
+    ap.add_argument("--demo", action="store_true", help="합성 SAP/재고 탭 제공")
+    ap.add_argument("--rows", type=int, default=20000, help="--demo SAP 행 수")
+    ap.add_argument("--no-tq", action="store_true", help="gviz tq 요청 거부 (전체 export 대체 경로 확인용)")
+    ap.add_argument("--gviz-types", action="store_true", help="tq 응답에서 열별 소수 타입 값을 비움 (실제 gviz 동작)")
+    ap.add_argument("--delay", type=float, default=0.0, help="응답 지연(초)")
+    args = ap.parse_args(argv)
+
+    sheets: dict[str, bytes] = {}
+    if args.demo:
+        sheets[SAP_GID] = demo_sap_csv(args.rows)
+        sheets[INV_GID] = demo_inventory_csv()
+    if args.data_dir:
+        for fn in os.listdir(args.data_dir):
+            if fn.endswith(".csv"):
+                with open(os.path.join(args.data_dir, fn), "rb") as f:
+                    sheets[fn[:-4]] = f.read()
+    if not sheets:
+        ap.error("--demo 또는 --data-dir 가 필요합니다.")
+    SheetHandler.sheets = sheets
+    SheetHandler.allow_tq = not args.no_tq
+    SheetHandler.gviz_types = args.gviz_types
+    SheetHandler.delay_sec = args.delay
+    server = ThreadingHTTPServer((args.host, args.port), SheetHandler)
+    print(f"mock gsheet: http://{args.host}:{args.port}  gids={sorted(sheets)}  tq={'off' if args.no_tq else 'on'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())